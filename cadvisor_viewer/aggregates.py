@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Incremental per-group aggregation of calculated container samples.
+Containers are grouped by network function (amf, smf, upf, ...) and by node.
+Each group keeps sliding windows that are updated as samples arrive, so the
+summary of a cycle is built from running state instead of a history scan:
+  - per_container: distribution of the members' individual samples
+  - total:         the group sum (e.g. all AMF replicas together), once per cycle
+Every window reports count, mean, p50/p95/p99 and peak.
+"""
+
+import bisect
+import math
+import threading
+from collections import deque
+
+PERCENTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+
+
+class SlidingWindow:
+    """
+    Values of the last `seconds` seconds. Keeps a sorted copy next to the
+    arrival-ordered deque, so percentiles and peak are O(1) reads and
+    insert / expire are a bisect plus a list shift.
+    """
+
+    __slots__ = ('seconds', 'entries', 'ordered', 'total')
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.entries = deque() # (timestamp, value) in arrival order
+        self.ordered = []
+        self.total = 0.0
+
+    def add(self, timestamp, value):
+        self.entries.append((timestamp, value))
+        bisect.insort(self.ordered, value)
+        self.total += value
+
+    def expire(self, now):
+        cutoff = now - self.seconds
+        while self.entries and self.entries[0][0] < cutoff:
+            _, value = self.entries.popleft()
+            del self.ordered[bisect.bisect_left(self.ordered, value)]
+            self.total -= value
+        if not self.entries:
+            self.total = 0.0 # Drop accumulated rounding error
+
+    def stats(self):
+        n = len(self.ordered)
+        if not n:
+            return None
+        result = dict(count=n, mean=self.total / n)
+        for name, q in PERCENTILES:
+            result[name] = self.ordered[max(0, math.ceil(q * n) - 1)] # Nearest rank
+        result['peak'] = self.ordered[-1]
+        return result
+
+
+class GroupStats:
+    """Running state of one group: latest value per member plus per-field windows."""
+
+    __slots__ = ('latest', 'samples', 'totals', 'peak')
+
+    def __init__(self, fields, windows):
+        self.latest = {} # {container_id: [value per field]}
+        self.samples = {f: {name: SlidingWindow(seconds) for name, seconds in windows} for f in fields}
+        self.totals = {f: {name: SlidingWindow(seconds) for name, seconds in windows} for f in fields}
+        self.peak = {} # {field: (value, timestamp)} of the group sum since startup
+
+    def empty(self):
+        return not self.latest and not any(w.entries for windows in self.samples.values() for w in windows.values())
+
+
+class Aggregator:
+    """
+    Per-NF and per-node aggregates over calculated samples.
+    add() is called by the scrape workers, end_cycle() once per collection
+    cycle by the collector; it returns the summary for that cycle.
+    """
+
+    def __init__(self, fields, windows, nf_of):
+        self.fields = tuple(fields)
+        self.windows = tuple(windows)
+        self.nf_of = nf_of
+        self._groups = {} # {('nf' | 'node', name): GroupStats}
+        self._membership = {} # {container_id: (nf group key, node group key)}
+        self._lock = threading.Lock()
+
+    def _group(self, key):
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = GroupStats(self.fields, self.windows)
+        return group
+
+    def add(self, node_name, container_id, pod_name, samples):
+        """samples: [(timestamp_sec, values aligned with fields), ...] of one container."""
+        keys = (('nf', self.nf_of(pod_name)), ('node', node_name))
+        with self._lock:
+            previous = self._membership.get(container_id)
+            if previous != keys:
+                if previous is not None:
+                    self._drop_member(container_id, previous)
+                self._membership[container_id] = keys
+            for key in keys:
+                group = self._group(key)
+                latest = group.latest.setdefault(container_id, [None] * len(self.fields))
+                for timestamp, values in samples:
+                    for i, field in enumerate(self.fields):
+                        value = values[i]
+                        if value is None or value != value: continue
+                        latest[i] = value
+                        for window in group.samples[field].values():
+                            window.add(timestamp, value)
+
+    def _drop_member(self, container_id, keys):
+        for key in keys:
+            group = self._groups.get(key)
+            if group is not None:
+                group.latest.pop(container_id, None)
+
+    def remove(self, container_ids):
+        with self._lock:
+            for container_id in container_ids:
+                keys = self._membership.pop(container_id, None)
+                if keys is not None:
+                    self._drop_member(container_id, keys)
+
+    def end_cycle(self, now, live_ids=None):
+        """
+        Records the group sums of this cycle, expires old window entries and
+        returns the summary: {'nf': {name: group}, 'node': {name: group}} where
+        group = {'members': n, field: {'sum', 'mean', 'peak', 'peak_at', 'windows': {...}}}.
+        """
+        summary = {'generated': now, 'windows': [name for name, _ in self.windows], 'nf': {}, 'node': {}}
+        with self._lock:
+            if live_ids is not None:
+                for container_id in [cid for cid in self._membership if cid not in live_ids]:
+                    self._drop_member(container_id, self._membership.pop(container_id))
+            for key in list(self._groups):
+                group = self._groups[key]
+                result = {'members': len(group.latest)}
+                for i, field in enumerate(self.fields):
+                    values = [latest[i] for latest in group.latest.values() if latest[i] is not None]
+                    total = math.fsum(values) if values else None
+                    if total is not None:
+                        for window in group.totals[field].values():
+                            window.add(now, total)
+                        if field not in group.peak or total > group.peak[field][0]:
+                            group.peak[field] = (total, now)
+                    windows = {}
+                    for name, _ in self.windows:
+                        group.samples[field][name].expire(now)
+                        group.totals[field][name].expire(now)
+                        windows[name] = dict(per_container=group.samples[field][name].stats(),
+                                             total=group.totals[field][name].stats())
+                    peak = group.peak.get(field)
+                    result[field] = dict(sum=total, mean=total / len(values) if values else None,
+                                         peak=peak[0] if peak else None, peak_at=peak[1] if peak else None,
+                                         windows=windows)
+                if group.empty():
+                    del self._groups[key]
+                    continue
+                kind, name = key
+                summary[kind][name] = result
+        return summary
@@ -3,330 +3,1070 @@
 
 """
 Flask web application to continuously display cAdvisor metrics (table and graphs)
-for the 'open5gs' namespace. Fetches Kubernetes mappings only once on startup.
+for the 'open5gs' namespace. Kubernetes mappings are kept current by pod watches.
+Several instances can split the work (--shard, --namespace, --context) and
+one more instance can serve their merged view (--federate, see federation.py).
 """
 
 import requests
-import json
+import requests.adapters
+import os
+import posixpath
 import sys
-import subprocess
 import re
 import time
 import threading
-from collections import defaultdict, deque
+import gzip
+import hashlib
+import json
+import functools
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timezone
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, render_template, jsonify, request
 import math # For checking NaN
 
+from inventory import PodWatcher
+from tsstore import ContainerSeries, SeriesRing, ROLLUP_TIERS
+from segstore import SegmentStore
+from pubsub import Broadcaster, filter_batch
+from extractors import RateEngine
+from aggregates import Aggregator
+from scheduler import NodeScheduler
+from recorder import ScrapeRecorder, iter_recording
+from federation import Federation
+from experiments import ExperimentLog, usage_report
+from instrument import CollectorStats, CountingReader, SamplingProfiler, ScrapeTrace, TimedLock
+
+try:
+    import ijson # Optional: incremental parsing of full cAdvisor dumps
+except ImportError:
+    ijson = None
+try:
+    import zstandard # Optional: zstd response compression
+except ImportError:
+    zstandard = None
+
 # --- Configuration ---
-OPEN5GS_NAMESPACE = "open5gs"
+# Namespaces whose pods are monitored; each one gets its own pod watcher
+TARGET_NAMESPACES = ("open5gs",)
 CADVISOR_NAMESPACE = "cadvisor"
+# kubectl context of the cluster to watch (None: the current context) and the
+# cluster name reported to a federating instance (None: no prefix on node names)
+KUBE_CONTEXT = None
+CLUSTER_NAME = None
+# Node sharding: this instance only scrapes nodes whose name hashes to
+# SHARD_INDEX out of SHARD_COUNT (crc32 of the node name)
+SHARD_INDEX = 0
+SHARD_COUNT = 1
+# (connect, read) timeout for requests to upstream collectors in federation mode
+FEDERATION_TIMEOUT = (1.0, 5.0)
 CADVISOR_PORT = 8080
 # How often the background thread fetches stats (seconds)
 COLLECTION_INTERVAL_SECONDS = 3.0
-# Number of historical samples to keep for rate calculation AND graphing
-HISTORY_SIZE = 20
+# Number of raw counter samples kept for deduplication and rate seeding, also
+# the default number of points returned to the graphs
+HISTORY_SIZE = 60
+# Max number of cAdvisor nodes scraped in parallel
+SCRAPE_MAX_WORKERS = 16
+# (connect, read) timeout for a single cAdvisor request (seconds)
+CADVISOR_REQUEST_TIMEOUT = (2.0, 10.0)
+# Shorter timeout for the single probe sent to a node whose circuit is open
+CADVISOR_PROBE_TIMEOUT = (0.5, 1.0)
+# Deadline for a whole collection cycle; nodes that have not answered by then
+# are left out of this cycle so cycle time stays flat as nodes are added
+CYCLE_DEADLINE_SECONDS = COLLECTION_INTERVAL_SECONDS * 0.9
+# 'targeted' only asks cAdvisor for the pod cgroups of tracked containers,
+# 'full' downloads the whole recursive cgroup tree every cycle
+CADVISOR_FETCH_MODE = "targeted"
+# A tracked container missing from a full walk (exited early, unexpected cgroup
+# naming) is looked for again after this backoff, doubling per miss up to the max
+CGROUP_MISS_BACKOFF_SECONDS = 30
+CGROUP_MISS_MAX_BACKOFF_SECONDS = 600
+# Targeted mode sends one request per pod cgroup, one after the other. With more
+# pod cgroups than this on a node, their deepest common parent cgroup is fetched
+# in a single request instead: one round trip, but other pods under it come along
+CADVISOR_MAX_POD_REQUESTS = 8
+# Number of stats samples cAdvisor returns per container; every sample not
+# stored yet is ingested, so this should cover one collection interval at
+# cAdvisor's housekeeping interval (1 s by default) with some overlap
+CADVISOR_NUM_STATS = 5
+# Directory for on-disk sample segments; None disables persistence
+PERSIST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics_data")
+# Raw scrape recordings (POST /record/start or --record) go to subdirectories of this
+RECORD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+# Experiment markers and their cached cost reports
+EXPERIMENTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "experiments.json")
+# Segments whose newest sample is older than this are deleted
+PERSIST_RETENTION_SECONDS = 7 * 24 * 3600
+# How much stored history is loaded back into memory when a container reappears
+PERSIST_RELOAD_SECONDS = 12 * 3600
+# How often retention is enforced (seconds)
+PERSIST_RETENTION_CHECK_SECONDS = 600
+# Responses smaller than this are sent uncompressed (bytes)
+COMPRESS_MIN_BYTES = 1024
+# Idle streaming connections get a keep-alive comment this often (seconds)
+SSE_HEARTBEAT_SECONDS = 15
+# Extra per-container metrics extracted from every stats sample, stored next to
+# CPU and memory: (name, 'rate' | 'gauge', path into the sample, scale, help).
+# Rates are per second and survive counter resets; see extractors.py for the
+# path syntax (e.g. 'network.interfaces[ogstun].rx_bytes' for the UPF's GTP-U tun).
+EXTRA_METRICS = (
+    ("net_rx_bytes_per_s", "rate", "network.interfaces[*].rx_bytes", 1, "Received bytes per second, all interfaces."),
+    ("net_tx_bytes_per_s", "rate", "network.interfaces[*].tx_bytes", 1, "Transmitted bytes per second, all interfaces."),
+    ("net_rx_packets_per_s", "rate", "network.interfaces[*].rx_packets", 1, "Received packets per second, all interfaces."),
+    ("net_tx_packets_per_s", "rate", "network.interfaces[*].tx_packets", 1, "Transmitted packets per second, all interfaces."),
+    ("disk_read_bytes_per_s", "rate", "diskio.io_service_bytes[*].stats.Read", 1, "Disk bytes read per second."),
+    ("disk_write_bytes_per_s", "rate", "diskio.io_service_bytes[*].stats.Write", 1, "Disk bytes written per second."),
+    ("cpu_throttled_periods_per_s", "rate", "cpu.cfs.throttled_periods", 1, "CFS periods throttled per second."),
+)
+# Per-NF / per-node aggregates served by /summary: fields and sliding windows (name, seconds)
+SUMMARY_FIELDS = ("cpu_mcore", "memory_mib", "net_rx_bytes_per_s", "net_tx_bytes_per_s")
+SUMMARY_WINDOWS = (("1m", 60), ("5m", 300), ("15m", 900))
+# Stack sampling period of the profiler started via POST /debug/collector/profile
+PROFILER_SAMPLE_INTERVAL_SECONDS = 0.005
 
 # --- Global State ---
 # Stores raw data for rate calculation:
-# {container_id: deque([(timestamp_ns, cpu_total_ns), ...], maxlen=HISTORY_SIZE)}
-container_history = defaultdict(lambda: deque(maxlen=HISTORY_SIZE))
-# Stores calculated data points for the API/graphs:
-# {container_id: deque([(timestamp_sec, cpu_mcore, memory_mib), ...], maxlen=HISTORY_SIZE)}
-api_metric_history = defaultdict(lambda: deque(maxlen=HISTORY_SIZE))
-# Lock for thread-safe access to histories
-data_lock = threading.Lock()
+# {container_id: SeriesRing of (timestamp_ns, cpu_total_ns) rows, int64 columns}
+container_history = defaultdict(lambda: SeriesRing(HISTORY_SIZE, ('cpu_total_ns',), ts_typecode='q', value_typecode='q'))
+# Rate engine for EXTRA_METRICS; keeps the last counter values per container
+rate_engine = RateEngine(EXTRA_METRICS)
+# Fields of every calculated sample: cpu_mcore, memory_mib, then the extra metrics
+METRIC_FIELDS = ContainerSeries.FIELDS + rate_engine.fields
+# Stores calculated data points for the API/graphs, with 1m/10m rollups:
+# {container_id: ContainerSeries of (timestamp_sec, cpu_mcore, memory_mib, *extra) rows}
+api_metric_history = defaultdict(lambda: ContainerSeries(fields=METRIC_FIELDS))
+# Collector self-instrumentation, served by /debug/collector and /metrics/prometheus
+collector_stats = CollectorStats(COLLECTION_INTERVAL_SECONDS)
+# Lock for thread-safe access to histories (records wait/hold times)
+data_lock = collector_stats.register_lock("data_lock", TimedLock())
+# Per-node scrape intervals, backoff and circuit breakers
+node_scheduler = NodeScheduler(COLLECTION_INTERVAL_SECONDS)
+# Experiment start/stop markers (see experiments.py)
+experiment_log = ExperimentLog(EXPERIMENTS_FILE)
+# Raw scrape recorder (see recorder.py); set while a recording runs
+scrape_recorder = None
+# Upstream collectors when running as a federating instance (--federate)
+federation = None
+# Stack sampler for the collector and scrape threads; off until toggled
+profiler = SamplingProfiler(("collector", "scrape"), PROFILER_SAMPLE_INTERVAL_SECONDS)
 # To signal the background thread to stop
 stop_event = threading.Event()
-# Store mappings globally - These will be populated once at startup
+# Store mappings globally - kept current by the pod watchers. Both maps are
+# replaced (copy-on-write) on every change, never mutated in place.
 node_to_cadvisor_ip_map = {}
 target_pods_on_nodes_map = {}
+# Watched target pods: {(namespace, pod_uid): (node_name, {container_id_64: info})}
+target_pod_index = {}
+# One persistent keep-alive session per cAdvisor IP: {cadvisor_ip: requests.Session}
+cadvisor_sessions = {}
+sessions_lock = threading.Lock()
+# Bounded pool used by the collector to scrape nodes concurrently
+scrape_executor = ThreadPoolExecutor(max_workers=SCRAPE_MAX_WORKERS, thread_name_prefix="scrape")
+# Scrapes still running from an earlier cycle: {node_name: Future}
+inflight_scrapes = {}
+# cgroup names learned from cAdvisor, used for targeted fetches: {container_id: cgroup_name}
+container_cgroup_names = {}
+# Containers a full walk did not find: {container_id: (misses, next walk time)}
+container_cgroup_misses = {}
+# On-disk sample store (created at startup when PERSIST_DIR is set)
+segment_store = None
+# Containers whose meta.json has been written this run
+persisted_meta = set()
+# Latest per-node results ({node_name: {container_id: entry}}), each replaced whole by its scrape worker
+node_fragments = {}
+# Streaming clients; the collector publishes each cycle's new samples to it
+broadcaster = Broadcaster(lambda pod_name: network_function_of(pod_name))
+# Rolling per-NF / per-node aggregates, fed with every calculated sample
+aggregator = Aggregator(SUMMARY_FIELDS, SUMMARY_WINDOWS, lambda pod_name: network_function_of(pod_name))
+# Positions of SUMMARY_FIELDS in a calculated row (cpu_mcore, memory_mib, *extra)
+SUMMARY_FIELD_INDEX = tuple(METRIC_FIELDS.index(f) for f in SUMMARY_FIELDS)
 
-# --- Kubectl Interaction (Same as before) ---
+# --- Kubernetes Inventory (watch-based) ---
 
-def run_kubectl_command(command_args, parse_json=True):
-    """Runs kubectl, returns parsed JSON or raw text output."""
-    command = ['kubectl'] + command_args
-    try:
-        # Reduced timeout slightly as it runs only once at start
-        result = subprocess.run(command, capture_output=True, text=True, check=True, timeout=60)
-        return json.loads(result.stdout) if parse_json else result.stdout
-    except FileNotFoundError:
-        print("Error: 'kubectl' command not found.", file=sys.stderr)
-        return None
-    except subprocess.CalledProcessError as e:
-        print(f"Error running kubectl: {e}\nStderr: {e.stderr}", file=sys.stderr)
-        return None
-    except subprocess.TimeoutExpired:
-         print(f"Error: kubectl command '{' '.join(command)}' timed out.", file=sys.stderr)
-         return None
-    except Exception as e:
-        print(f"Unexpected kubectl error: {e}", file=sys.stderr)
-        return None
+def owns_node(node_name):
+    """Whether node_name belongs to this instance's shard."""
+    return SHARD_COUNT <= 1 or zlib.crc32(node_name.encode()) % SHARD_COUNT == SHARD_INDEX
+
+def running_containers_of_pod(pod):
+    """Returns (node_name, {container_id_64: info}) for the running containers of a pod."""
+    pod_name = pod.get('metadata', {}).get('name', 'UnknownPod')
+    node_name = pod.get('spec', {}).get('nodeName')
+    phase = pod.get('status', {}).get('phase')
+    containers = {}
+
+    if not node_name or phase != 'Running' or pod.get('metadata', {}).get('deletionTimestamp'):
+        return node_name, containers
+
+    container_statuses = pod.get('status', {}).get('containerStatuses', [])
+    for status in container_statuses:
+        if status.get('state', {}).get('running') and status.get('containerID'):
+            full_container_id = status['containerID']
+            container_name = status.get('name')
+            match = re.search(r'://([0-9a-f]{64})', full_container_id)
+            if match:
+                containers[match.group(1)] = {
+                    'pod_name': pod_name,
+                    'container_name': container_name
+                }
+    return node_name, containers
+
+def network_function_of(pod_name):
+    """
+    Derives the network function from a pod name: 'open5gs-amf-7c9d5b8f6-x2x7k' -> 'amf'.
+    Pods outside the open5gs naming scheme keep their name minus the pod hash suffix.
+    """
+    name = re.sub(r'-[a-z0-9]{6,10}-[a-z0-9]{5}$', '', pod_name) # Deployment pods
+    name = re.sub(r'-[0-9]+$', '', name) # StatefulSet pods
+    return name[len('open5gs-'):] if name.startswith('open5gs-') else name
+
+def evict_container_state(container_ids):
+    """Drops histories of containers that no longer exist. Caller holds data_lock."""
+    aggregator.remove(container_ids)
+    for container_id in container_ids:
+        container_history.pop(container_id, None)
+        api_metric_history.pop(container_id, None)
+        container_cgroup_names.pop(container_id, None)
+        container_cgroup_misses.pop(container_id, None)
+        rate_engine.forget(container_id)
+        if segment_store is not None:
+            segment_store.close_writer(container_id)
+
+def restore_history(container_ids):
+    """
+    Loads recent stored samples of (re)appearing containers back into memory.
+    The collector may already have started their series, as the new target map
+    is published first; the restored samples are then put in front of its own.
+    """
+    if segment_store is None: return
+    since = time.time() - PERSIST_RELOAD_SECONDS
+    for container_id in container_ids:
+        series = ContainerSeries(fields=METRIC_FIELDS)
+        for timestamps, cpu_values, mem_values in segment_store.range(container_id, since):
+            for ts, cpu, mem in zip(timestamps, cpu_values, mem_values):
+                series.append(ts, None if cpu != cpu else cpu, None if mem != mem else mem)
+        if not len(series): continue
+        with data_lock:
+            current = api_metric_history.get(container_id)
+            if current is None:
+                api_metric_history[container_id] = series
+            else:
+                # Merged in place: a scrape worker may hold this series outside the lock
+                current.prepend(series)
+
+def handle_target_pod_event(namespace, event_type, payload):
+    """
+    PodWatcher callback for a target namespace: keeps target_pods_on_nodes_map
+    current. Pods on nodes outside this instance's shard are ignored.
+    """
+    global target_pods_on_nodes_map
+    def owned_containers(pod):
+        node_name, containers = running_containers_of_pod(pod)
+        for info in containers.values():
+            info['namespace'] = namespace
+        return (node_name, containers) if node_name and owns_node(node_name) else (node_name, {})
+
+    if event_type == 'SYNC':
+        updates = {(namespace, pod.get('metadata', {}).get('uid')): owned_containers(pod) for pod in payload}
+        removed_uids = {key for key in target_pod_index if key[0] == namespace} - set(updates)
+    else:
+        uid = (namespace, payload.get('metadata', {}).get('uid'))
+        updates = {} if event_type == 'DELETED' else {uid: owned_containers(payload)}
+        removed_uids = {uid} if event_type == 'DELETED' else set()
+
+    with data_lock:
+        old_ids = set()
+        touched_nodes = set()
+        for uid in removed_uids | set(updates):
+            old_node, old_containers = target_pod_index.pop(uid, (None, {}))
+            old_ids.update(old_containers)
+            if old_node: touched_nodes.add(old_node)
+        for uid, (node_name, containers) in updates.items():
+            if node_name and containers:
+                target_pod_index[uid] = (node_name, containers)
+                touched_nodes.add(node_name)
 
-# --- Data Gathering from Kubernetes (Same as before) ---
-
-def get_node_to_cadvisor_map(cadvisor_namespace=CADVISOR_NAMESPACE):
-    """Finds cAdvisor pods and maps node name to cAdvisor pod IP."""
-    print(f"Fetching cAdvisor pod IPs from namespace '{cadvisor_namespace}'...", file=sys.stderr)
-    kubectl_output = run_kubectl_command([
-        'get', 'pods', '-n', cadvisor_namespace,
-        '--field-selector=status.phase=Running',
-        '-o', 'jsonpath={range .items[*]}{.spec.nodeName}{\"\\t\"}{.status.podIP}{\"\\n\"}'
-    ], parse_json=False)
-
-    if kubectl_output is None or not kubectl_output.strip():
-        print(f"Warning: Failed to get or find running cAdvisor pods in namespace '{cadvisor_namespace}'.", file=sys.stderr)
-        return {}
-
-    node_map = {}
-    lines = kubectl_output.strip().split('\n')
-    for line in lines:
-        if not line: continue
-        parts = line.split('\t')
-        if len(parts) == 2:
-            node_name, pod_ip = parts
-            if node_name and pod_ip and pod_ip != "<none>":
-                node_map[node_name] = pod_ip
-    print(f"Found {len(node_map)} cAdvisor pod IPs.", file=sys.stderr)
-    return node_map
-
-def get_target_pods_by_node(namespace=OPEN5GS_NAMESPACE):
-    """Gets target pods and groups container info by node name."""
-    print(f"Fetching '{namespace}' pod data...", file=sys.stderr)
-    pod_data = run_kubectl_command(['get', 'pods', '-n', namespace, '-o', 'json'], parse_json=True)
-
-    if not pod_data or 'items' not in pod_data:
-        print(f"Warning: Failed to get pod data from namespace '{namespace}'.", file=sys.stderr)
-        return {}
-
-    pods_by_node = defaultdict(dict)
-    count = 0
-    for pod in pod_data['items']:
-        pod_name = pod.get('metadata', {}).get('name', 'UnknownPod')
-        node_name = pod.get('spec', {}).get('nodeName')
-        phase = pod.get('status', {}).get('phase')
-
-        if not node_name or phase != 'Running': continue
-
-        container_statuses = pod.get('status', {}).get('containerStatuses', [])
-        for status in container_statuses:
-            if status.get('state', {}).get('running') and status.get('containerID'):
-                full_container_id = status['containerID']
-                container_name = status.get('name')
-                match = re.search(r'://([0-9a-f]{64})', full_container_id)
-                if match:
-                    container_id_64 = match.group(1)
-                    pods_by_node[node_name][container_id_64] = {
-                        'pod_name': pod_name,
-                        'container_name': container_name
-                    }
-                    count += 1
-    print(f"Found {count} running containers in '{namespace}' namespace across {len(pods_by_node)} nodes.", file=sys.stderr)
-    return pods_by_node
+        # Copy-on-write: rebuild only the touched nodes, so collector copies stay consistent
+        new_map = dict(target_pods_on_nodes_map)
+        for node_name in touched_nodes:
+            node_containers = {}
+            for pod_node, containers in target_pod_index.values():
+                if pod_node == node_name: node_containers.update(containers)
+            if node_containers:
+                new_map[node_name] = node_containers
+            else:
+                new_map.pop(node_name, None)
+        target_pods_on_nodes_map = new_map
+
+        live_ids = set()
+        for node_name in touched_nodes:
+            live_ids.update(new_map.get(node_name, {}))
+        evict_container_state(old_ids - live_ids)
+        new_ids = set()
+        for node_name, containers in updates.values():
+            new_ids.update(cid for cid in containers if cid not in old_ids)
+
+    restore_history(new_ids)
+
+    if event_type == 'SYNC':
+        count = sum(len(c) for c in target_pods_on_nodes_map.values())
+        print(f"Found {count} running containers in {', '.join(TARGET_NAMESPACES)} across {len(target_pods_on_nodes_map)} nodes"
+              f" (after syncing '{namespace}').", file=sys.stderr)
+
+def handle_cadvisor_pod_event(event_type, payload):
+    """PodWatcher callback for the cAdvisor namespace: keeps node_to_cadvisor_ip_map current."""
+    global node_to_cadvisor_ip_map
+    pods = payload if event_type == 'SYNC' else [payload]
+    with data_lock:
+        new_map = {} if event_type == 'SYNC' else dict(node_to_cadvisor_ip_map)
+        for pod in pods:
+            node_name = pod.get('spec', {}).get('nodeName')
+            pod_ip = pod.get('status', {}).get('podIP')
+            running = pod.get('status', {}).get('phase') == 'Running' and not pod.get('metadata', {}).get('deletionTimestamp')
+            if not node_name or not owns_node(node_name):
+                continue
+            if event_type != 'DELETED' and running and pod_ip:
+                new_map[node_name] = pod_ip
+            elif new_map.get(node_name) == pod_ip or not pod_ip:
+                new_map.pop(node_name, None)
+        node_to_cadvisor_ip_map = new_map
+    if event_type == 'SYNC':
+        print(f"Found {len(new_map)} cAdvisor pod IPs.", file=sys.stderr)
 
 # --- cAdvisor Querying and Metric Calculation (Same as before) ---
 
+@functools.lru_cache(maxsize=4096)
+def _epoch_seconds(base, tz_part):
+    """Whole epoch seconds of 'YYYY-MM-DDTHH:MM:SS' + zone; cached, since samples share seconds."""
+    if tz_part in ('', 'Z'): tz_part = '+00:00'
+    return int(datetime.fromisoformat(base + tz_part).timestamp())
+
 def parse_timestamp_to_ns(timestamp_str):
-    """Converts RFC3339Nano string to nanoseconds since epoch, truncating."""
-    if not timestamp_str: return None
+    """Converts RFC3339Nano string to nanoseconds since epoch (full nanosecond precision)."""
+    if not timestamp_str or len(timestamp_str) < 20: return None
     try:
-        if timestamp_str.endswith('Z'): timestamp_str = timestamp_str[:-1] + '+00:00'
-        if '.' in timestamp_str:
-            parts = timestamp_str.split('.')
-            base = parts[0]
-            if '+' in parts[1]: frac, tz_part = parts[1].split('+', 1); tz_part = '+' + tz_part
-            elif '-' in parts[1]: frac, tz_part = parts[1].split('-', 1); tz_part = '-' + tz_part
-            else: frac = parts[1]; tz_part = '+00:00'
-            if len(frac) > 6: frac = frac[:6]
-            timestamp_str = f"{base}.{frac}{tz_part}"
-        dt = datetime.fromisoformat(timestamp_str)
-        return int(dt.timestamp() * 1e9)
-    except Exception as e:
-        # print(f"ERROR parsing timestamp '{timestamp_str}': {e}", file=sys.stderr)
+        base, rest = timestamp_str[:19], timestamp_str[19:]
+        frac_ns = 0
+        if rest[0] == '.':
+            end = 1
+            while end < len(rest) and rest[end].isdigit(): end += 1
+            frac_ns = int((rest[1:end] + '000000000')[:9])
+            rest = rest[end:]
+        return _epoch_seconds(base, rest) * 1_000_000_000 + frac_ns
+    except (ValueError, IndexError):
         return None
 
-def update_and_calculate_metrics_for_node(node_name, cadvisor_ip, containers_on_node, cadvisor_port=CADVISOR_PORT):
+def memory_mib_of(stats):
+    """Working-set memory (falling back to usage) of one stats sample in MiB, or None."""
+    memory_stats = stats.get("memory") or {}
+    memory_bytes = memory_stats.get("working_set")
+    if memory_bytes is None:
+        memory_bytes = memory_stats.get("usage")
+    if memory_bytes is None:
+        return None
+    mem_mib = memory_bytes / (1024 * 1024)
+    return None if math.isnan(mem_mib) else mem_mib
+
+def decode_new_samples(stats_list, last_ts_ns):
+    """
+    Decodes every stats sample newer than last_ts_ns (the newest one already
+    stored). Returns [(ts_ns, cpu_total_ns, stats), ...] sorted by time, deduplicated.
+    """
+    samples = {}
+    for stats in stats_list:
+        ts_ns = parse_timestamp_to_ns(stats.get("timestamp"))
+        cpu_total_ns = (stats.get("cpu") or {}).get("usage", {}).get("total")
+        if ts_ns is None or cpu_total_ns is None: continue
+        if last_ts_ns is not None and ts_ns <= last_ts_ns: continue
+        samples[ts_ns] = (ts_ns, cpu_total_ns, stats)
+    return [samples[ts] for ts in sorted(samples)]
+
+def interval_cpu_mcore(prev_row, rows):
+    """
+    Per-interval CPU rates (mCore) for consecutive counter rows in one pass.
+    prev_row is the last stored (ts_ns, cpu_total_ns) or None. Intervals with
+    a counter reset or zero counters yield None.
+    """
+    ts = [r[0] for r in rows]
+    cpu = [r[1] for r in rows]
+    prev_ts = [prev_row[0] if prev_row else None] + ts[:-1]
+    prev_cpu = [prev_row[1] if prev_row else None] + cpu[:-1]
+    return [
+        (c - pc) * 1000 / (t - pt) if pt is not None and t > pt and pc > 0 and c >= pc else None
+        for t, c, pt, pc in zip(ts, cpu, prev_ts, prev_cpu)
+    ]
+
+def get_cadvisor_session(cadvisor_ip):
+    """Returns the keep-alive session for a cAdvisor IP, creating it on first use."""
+    with sessions_lock:
+        session = cadvisor_sessions.get(cadvisor_ip)
+        if session is None:
+            session = requests.Session()
+            # A node is never scraped by two workers at once, so one pooled connection is enough
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+            session.mount("http://", adapter)
+            cadvisor_sessions[cadvisor_ip] = session
+        return session
+
+def close_stale_sessions(active_ips):
+    """Closes sessions for cAdvisor IPs that are no longer in the node map."""
+    with sessions_lock:
+        for ip in [ip for ip in cadvisor_sessions if ip not in active_ips]:
+            cadvisor_sessions.pop(ip).close()
+
+def extract_container_id(container_entry):
+    """Returns the 64-hex container ID of a cAdvisor container entry, or None."""
+    container_id_path = container_entry.get("id")
+    if isinstance(container_id_path, str) and len(container_id_path) == 64 and all(c in '0123456789abcdef' for c in container_id_path):
+        return container_id_path
+    aliases = container_entry.get("aliases") or []
+    containerd_alias = next((alias for alias in aliases if ':cri-containerd:' in alias), None)
+    if containerd_alias:
+        match = re.search(r':cri-containerd:([0-9a-f]{64})', containerd_alias)
+        if match: return match.group(1)
+    return None
+
+def post_json(session, api_endpoint, timeout, trace):
+    """POSTs a subcontainers query and decodes the JSON reply, accounting time and bytes in trace."""
+    start = time.perf_counter()
+    response = session.post(api_endpoint, json={"num_stats": CADVISOR_NUM_STATS}, timeout=timeout)
+    decode_start = time.perf_counter()
+    trace.http_seconds += decode_start - start
+    trace.payload_bytes += len(response.content)
+    trace.requests += 1
+    if response.status_code >= 400:
+        return response, None
+    data = response.json()
+    trace.parse_seconds += time.perf_counter() - decode_start
+    return response, data
+
+def iter_full_dump(session, cadvisor_url, timeout, trace):
+    """
+    Yields every entry of the recursive cgroup tree. With ijson installed the
+    response is parsed incrementally, so only one entry is held in memory at a
+    time; network reads and decoding then interleave, and the time not spent
+    waiting on the socket is accounted as parse time.
+    """
+    api_endpoint = f"{cadvisor_url}/api/v1.3/subcontainers"
+    if ijson is None:
+        response, data = post_json(session, api_endpoint, timeout, trace)
+        response.raise_for_status()
+        yield from data
+        return
+    start = time.perf_counter()
+    response = session.post(api_endpoint, json={"num_stats": CADVISOR_NUM_STATS}, timeout=timeout, stream=True)
+    trace.http_seconds += time.perf_counter() - start
+    trace.requests += 1
+    response.raise_for_status()
+    response.raw.decode_content = True
+    http_before = trace.http_seconds
+    parse_start = time.perf_counter()
+    try:
+        for item in ijson.items(CountingReader(response.raw, trace), 'item', use_float=True):
+            pause = time.perf_counter()
+            yield item
+            parse_start += time.perf_counter() - pause # Exclude the consumer's time
+    finally:
+        response.close()
+        trace.parse_seconds += max(0.0, time.perf_counter() - parse_start - (trace.http_seconds - http_before))
+
+def fetch_target_entries(node_name, session, cadvisor_url, containers_on_node, timeout, trace):
+    """
+    Fetches cAdvisor entries for the containers tracked on a node. In targeted
+    mode only the pod cgroup subtrees holding those containers are requested;
+    the full tree is only walked (once) to learn cgroup names of new containers.
+    Containers a walk did not find are retried with a backoff, so they do not
+    force a full walk every cycle. Pod subtrees are requested serially, one
+    round trip each; above CADVISOR_MAX_POD_REQUESTS pods their common parent
+    subtree is requested once instead. Returns {container_id: container_entry}.
+    """
+    entries = {}
+    now = time.time()
+    unknown = [cid for cid in containers_on_node if cid not in container_cgroup_names
+               and container_cgroup_misses.get(cid, (0, 0))[1] <= now]
+
+    if CADVISOR_FETCH_MODE != "targeted" or unknown:
+        for container_entry in iter_full_dump(session, cadvisor_url, timeout, trace):
+            container_id_64 = extract_container_id(container_entry)
+            if container_id_64 in containers_on_node and container_id_64 not in entries:
+                entries[container_id_64] = container_entry
+                if container_entry.get("name"):
+                    container_cgroup_names[container_id_64] = container_entry["name"]
+        if CADVISOR_FETCH_MODE != "targeted":
+            return entries
+        for cid in unknown:
+            if cid in entries:
+                container_cgroup_misses.pop(cid, None)
+                continue
+            misses = container_cgroup_misses.get(cid, (0, 0))[0] + 1
+            backoff = min(CGROUP_MISS_BACKOFF_SECONDS * 2 ** (misses - 1), CGROUP_MISS_MAX_BACKOFF_SECONDS)
+            container_cgroup_misses[cid] = (misses, now + backoff)
+            print(f"Warning: Container {cid[:12]} not found in cAdvisor on Node '{node_name}' "
+                  f"(miss {misses}, next look in {backoff:.0f} s).", file=sys.stderr)
+
+    # Group the remaining containers by their parent (pod) cgroup
+    pod_cgroups = defaultdict(set)
+    for cid in containers_on_node:
+        if cid not in entries and cid in container_cgroup_names:
+            pod_cgroups[container_cgroup_names[cid].rsplit('/', 1)[0]].add(cid)
+    if len(pod_cgroups) > CADVISOR_MAX_POD_REQUESTS:
+        parent = posixpath.commonpath(list(pod_cgroups))
+        pod_cgroups = {'' if parent == '/' else parent: set().union(*pod_cgroups.values())}
+
+    for pod_cgroup, wanted in pod_cgroups.items():
+        api_endpoint = f"{cadvisor_url}/api/v1.3/subcontainers{pod_cgroup}"
+        response, data = post_json(session, api_endpoint, timeout, trace)
+        if data is None:
+            # Pod cgroup is gone or moved: relearn its containers with the next full walk
+            for cid in wanted:
+                container_cgroup_names.pop(cid, None)
+            continue
+        for container_entry in data:
+            container_id_64 = extract_container_id(container_entry)
+            if container_id_64 in wanted:
+                entries[container_id_64] = container_entry
+    return entries
+
+def update_and_calculate_metrics_for_node(node_name, cadvisor_ip, containers_on_node, cadvisor_port=CADVISOR_PORT,
+                                          timeout=CADVISOR_REQUEST_TIMEOUT):
     """
-    Fetches latest stats, updates raw history, calculates metrics,
-    updates API history, and returns count.
+    Fetches recent stats, ingests every sample not stored yet (raw counters,
+    per-interval CPU rates, memory), updates API history, and returns the
+    number of containers that got new samples. Timings and counts go to
+    collector_stats.
     """
-    global container_history, api_metric_history
     if not containers_on_node or not cadvisor_ip: return 0
 
     cadvisor_url = f"http://{cadvisor_ip}:{cadvisor_port}"
-    api_endpoint = f"{cadvisor_url}/api/v1.3/subcontainers?recursive=true"
+    trace = ScrapeTrace()
 
     # Fetch Current Stats
     try:
-        response = requests.get(api_endpoint, timeout=10)
-        response.raise_for_status()
-        cadvisor_data = response.json()
+        target_entries = fetch_target_entries(
+            node_name, get_cadvisor_session(cadvisor_ip), cadvisor_url, containers_on_node, timeout, trace
+        )
     except requests.exceptions.RequestException as e:
         print(f"Error querying cAdvisor on Node '{node_name}': {e}", file=sys.stderr)
+        trace.error = (type(e).__name__, str(e))
+        collector_stats.record_scrape(node_name, trace)
+        node_scheduler.record_failure(node_name, f"{type(e).__name__}: {e}")
         return 0
-    except json.JSONDecodeError:
+    except (ValueError, getattr(ijson, 'JSONError', ValueError)) as e:
         print(f"Error parsing JSON from cAdvisor on Node '{node_name}'.", file=sys.stderr)
+        trace.error = ('JSONError', str(e))
+        collector_stats.record_scrape(node_name, trace)
+        node_scheduler.record_failure(node_name, f"JSONError: {e}")
         return 0
 
-    # Process Current Stats and Update RAW History
-    processed_in_this_cycle = set()
-    current_raw_stats = {}
+    recorder = scrape_recorder
+    if recorder is not None:
+        recorder.write(node_name, current_snapshot.version + 1, containers_on_node, target_entries)
 
-    for container_entry in cadvisor_data:
-        stats_list = container_entry.get("stats", [])
-        if not stats_list: continue
+    updated = ingest_node_entries(node_name, containers_on_node, target_entries, trace)
+    collector_stats.record_scrape(node_name, trace)
+    node_scheduler.record_success(node_name, time.perf_counter() - trace.started, trace.payload_bytes)
+    return updated
 
-        container_id_64 = None
-        container_id_path = container_entry.get("id")
-        if isinstance(container_id_path, str) and len(container_id_path) == 64 and all(c in '0123456789abcdef' for c in container_id_path):
-            container_id_64 = container_id_path
-        else:
-            aliases = container_entry.get("aliases", [])
-            containerd_alias = next((alias for alias in aliases if ':cri-containerd:' in alias), None)
-            if containerd_alias:
-                match = re.search(r':cri-containerd:([0-9a-f]{64})', containerd_alias)
-                if match: container_id_64 = match.group(1)
-
-        if container_id_64 and container_id_64 in containers_on_node and container_id_64 not in processed_in_this_cycle:
-            latest_stats = stats_list[-1]
-            current_raw_stats[container_id_64] = latest_stats
-            processed_in_this_cycle.add(container_id_64)
-
-            ts_str = latest_stats.get("timestamp")
-            cpu_total_ns = latest_stats.get("cpu", {}).get("usage", {}).get("total")
-            ts_ns = parse_timestamp_to_ns(ts_str)
-
-            if ts_ns is not None and cpu_total_ns is not None:
-                 with data_lock:
-                     container_history[container_id_64].append((ts_ns, cpu_total_ns))
-
-    # Calculate Metrics and Update API History
-    processed_count = 0
-    current_timestamp_sec = time.time()
-
-    for container_id, pod_info in containers_on_node.items():
-        latest_raw_stats_this_cycle = current_raw_stats.get(container_id)
-        cpu_mcore = None
-        mem_mib = None
-        mem_mib_current_reading = None
-
-        # Calculate CPU Rate from raw history
-        with data_lock:
-            history = container_history.get(container_id)
-            history_copy = list(history) if history else []
-
-        if history_copy and len(history_copy) >= 2:
-            oldest_valid = None
-            newest_valid = None
-            for i in range(len(history_copy) - 1, -1, -1):
-                 ts, cpu = history_copy[i]
-                 if cpu > 0: newest_valid = (ts, cpu); break
-            for i in range(len(history_copy)):
-                 ts, cpu = history_copy[i]
-                 if cpu > 0: oldest_valid = (ts, cpu); break
-
-            if oldest_valid and newest_valid and oldest_valid[0] < newest_valid[0]:
-                try:
-                    oldest_ts, oldest_cpu = oldest_valid
-                    newest_ts, newest_cpu = newest_valid
-                    time_delta_ns = newest_ts - oldest_ts
-                    cpu_delta_ns = newest_cpu - oldest_cpu
-
-                    if time_delta_ns > 0 and cpu_delta_ns >= 0:
-                        cpu_rate_cores = cpu_delta_ns / time_delta_ns
-                        cpu_mcore = cpu_rate_cores * 1000
-                        if math.isnan(cpu_mcore): cpu_mcore = None
-                    # else: cpu_mcore remains None
-                except Exception:
-                    cpu_mcore = None
-
-        # Calculate Memory from latest raw stats
-        if latest_raw_stats_this_cycle:
-            memory_stats = latest_raw_stats_this_cycle.get("memory", {})
-            memory_working_set_bytes = memory_stats.get("working_set")
-            if memory_working_set_bytes is not None:
-                mem_mib_current_reading = memory_working_set_bytes / (1024 * 1024)
-            else:
-                mem_usage_bytes = memory_stats.get("usage")
-                if mem_usage_bytes is not None:
-                    mem_mib_current_reading = mem_usage_bytes / (1024 * 1024)
-            if mem_mib_current_reading is not None and math.isnan(mem_mib_current_reading):
-                 mem_mib_current_reading = None
+def ingest_node_entries(node_name, containers_on_node, target_entries, trace):
+    """
+    Ingests fetched (or replayed) cAdvisor entries of one node: every sample
+    not stored yet goes into the raw counters, API history, aggregates and
+    segment store, and the node's snapshot fragment is rebuilt. Returns the
+    number of containers that got new samples.
+    """
+    process_start = time.perf_counter()
+
+    # One short lock acquisition per node to look up (or create) the series
+    with data_lock:
+        series_by_container = {cid: (container_history[cid], api_metric_history[cid]) for cid in containers_on_node}
+
+    # Decode every returned sample not stored yet (no lock: only this worker writes this node's series)
+    calculated = []
+    raw_counter_rows = {}
+
+    for container_id, container_entry in target_entries.items():
+        counters, api_history = series_by_container[container_id]
+        prev_row = counters.row(-1) if len(counters) else None
+        last_ts_ns = prev_row[0] if prev_row else None
+        history_tail = api_history.raw.last_timestamp()
+        if history_tail is not None:
+            # After a restart the history restored from segments is ahead of the (empty) raw counters;
+            # 1 us of slack covers the float seconds round trip
+            tail_ns = int(history_tail * 1e9) + 1000
+            last_ts_ns = tail_ns if last_ts_ns is None else max(last_ts_ns, tail_ns)
+        new_samples = decode_new_samples(container_entry.get("stats") or [], last_ts_ns)
+        if not new_samples: continue
+        trace.new_samples += len(new_samples)
+        if prev_row is not None and len(new_samples) >= 2:
+            # A gap well above the sampling period means samples aged out of cAdvisor's buffer unseen
+            period = (new_samples[-1][0] - new_samples[0][0]) / (len(new_samples) - 1)
+            gap = new_samples[0][0] - prev_row[0]
+            if period > 0 and gap > 1.5 * period:
+                trace.missed_samples += round(gap / period) - 1
+
+        raw_counter_rows[container_id] = [(ts_ns, cpu_total_ns) for ts_ns, cpu_total_ns, _ in new_samples]
+        cpu_rates = interval_cpu_mcore(prev_row, raw_counter_rows[container_id])
+        extra_rows = rate_engine.process(container_id, [(ts_ns, stats) for ts_ns, _, stats in new_samples])
 
         # Use last known good memory value if current is zero/None
-        if mem_mib_current_reading is not None and mem_mib_current_reading > 0.01:
-            mem_mib = mem_mib_current_reading
-        else:
-            mem_mib = None
-            with data_lock:
-                api_history = api_metric_history.get(container_id)
-                if api_history:
-                    for i in range(len(api_history) - 1, -1, -1):
-                        _, _, prev_mem = api_history[i]
-                        if prev_mem is not None and prev_mem > 0.01:
-                            mem_mib = prev_mem; break
-            if mem_mib is None:
-                 mem_mib = mem_mib_current_reading if mem_mib_current_reading is not None else 0.0
-
-        # Store CALCULATED metrics in API history
-        with data_lock:
-             api_metric_history[container_id].append( (current_timestamp_sec, cpu_mcore, mem_mib) )
+        last_good_memory = api_history.last_good_memory
+        for (ts_ns, _, stats), cpu_mcore, extra in zip(new_samples, cpu_rates, extra_rows):
+            mem_mib_current_reading = memory_mib_of(stats)
+            if mem_mib_current_reading is not None and mem_mib_current_reading > 0.01:
+                mem_mib = last_good_memory = mem_mib_current_reading
+            elif last_good_memory is not None:
+                mem_mib = last_good_memory
+            else:
+                mem_mib = mem_mib_current_reading if mem_mib_current_reading is not None else 0.0
+            calculated.append((container_id, ts_ns / 1e9, cpu_mcore, mem_mib, extra))
+    trace.stale_containers = len(containers_on_node) - len(raw_counter_rows)
+    store_start = time.perf_counter()
+    trace.process_seconds = store_start - process_start
+
+    # Store raw counters and CALCULATED metrics, again under a single lock acquisition
+    with data_lock:
+        for container_id, rows in raw_counter_rows.items():
+            counters = series_by_container[container_id][0]
+            for row in rows: counters.append(*row)
+        for container_id, ts_sec, cpu_mcore, mem_mib, extra in calculated:
+            series_by_container[container_id][1].append(ts_sec, cpu_mcore, mem_mib, *extra)
+
+    # Feed the per-NF / per-node aggregates
+    samples_by_container = defaultdict(list)
+    for container_id, ts_sec, cpu_mcore, mem_mib, extra in calculated:
+        row = (cpu_mcore, mem_mib) + extra
+        samples_by_container[container_id].append((ts_sec, [row[i] for i in SUMMARY_FIELD_INDEX]))
+    for container_id, samples in samples_by_container.items():
+        aggregator.add(node_name, container_id, containers_on_node[container_id]['pod_name'], samples)
+
+    # Only CPU and memory are persisted; extra metrics live in memory
+    if segment_store is not None:
+        for container_id, ts_sec, cpu_mcore, mem_mib, _ in calculated:
+            if container_id not in persisted_meta:
+                segment_store.write_meta(container_id, dict(containers_on_node[container_id], node_name=node_name))
+                persisted_meta.add(container_id)
+            segment_store.append(container_id, ts_sec, cpu_mcore, mem_mib)
+
+    # Publish this node's part of the next snapshot
+    node_fragments[node_name] = build_node_fragment(
+        containers_on_node, {cid: series for cid, (_, series) in series_by_container.items()}
+    )
+
+    trace.store_seconds = time.perf_counter() - store_start
+    return len(raw_counter_rows)
+
+
+# --- Metrics Payloads and Snapshots ---
+
+class Snapshot:
+    """
+    Immutable result of one collection cycle. The collector builds a new one
+    every cycle and swaps it in with a single assignment, so readers serve it
+    without taking data_lock. The JSON body is serialized once per cycle and
+    compressed at most once per encoding.
+    """
+
+    __slots__ = ('version', 'created', 'payload', 'summary', 'body', 'newest', 'etag', '_cache')
+
+    def __init__(self, version, payload, summary=None):
+        self.version = version
+        self.created = time.time()
+        self.payload = payload
+        self.summary = summary if summary is not None else {}
+        self.body = json.dumps(payload, separators=(',', ':')).encode()
+        self.newest = max((e['timestamps'][-1] for containers in payload.values()
+                           for e in containers.values() if e['timestamps']), default=None)
+        self.etag = f"snap-{version}"
+        self._cache = {}
+
+    def cached(self, key, build):
+        """Returns build() computed at most once per snapshot (a rare duplicate build under races is harmless)."""
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def encoded_body(self, encoding, body=None, key='json'):
+        """Returns body (default: the JSON body) compressed with encoding ('zstd', 'gzip' or None), cached."""
+        body = self.body if body is None else body
+        if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+            return body
+        return self.cached((key, encoding), lambda: compress_body(body, encoding))
+
+# Published snapshot; replaced (never mutated) by the collector at the end of each cycle
+current_snapshot = Snapshot(0, {})
+
+def _prom_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def render_prometheus(snapshot, openmetrics=False):
+    """
+    Renders the newest sample of every container in a snapshot in the
+    Prometheus text format (or OpenMetrics), labelled with pod, container,
+    node and network function.
+    """
+    gauges = (
+        ('cpu_mcore', 'open5gs_container_cpu_mcore', 'CPU usage of the container in millicores.'),
+        ('memory_mib', 'open5gs_container_memory_mib', 'Working-set memory of the container in MiB.'),
+    ) + tuple((spec.name, f'open5gs_container_{spec.name}', spec.help) for spec in rate_engine.specs)
+    lines = []
+    for field, name, help_text in gauges:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for node_name, containers in snapshot.payload.items():
+            for container_id, entry in containers.items():
+                value = next((v for v in reversed(entry.get(field, ())) if v is not None), None)
+                if value is None: continue
+                labels = (f'pod="{_prom_label(entry["pod_name"])}",container="{_prom_label(entry["container_name"])}",'
+                          f'node="{_prom_label(node_name)}",namespace="{_prom_label(entry.get("namespace") or "")}",'
+                          f'nf="{_prom_label(network_function_of(entry["pod_name"]))}",'
+                          f'container_id="{container_id[:12]}"')
+                lines.append(f"{name}{{{labels}}} {value!r}")
+    lines.append("# HELP cadvisor_viewer_snapshot_version Collection cycle counter of the served snapshot.")
+    lines.append("# TYPE cadvisor_viewer_snapshot_version gauge")
+    lines.append(f"cadvisor_viewer_snapshot_version {snapshot.version}")
+    lines.append("# HELP cadvisor_viewer_snapshot_timestamp_seconds When the served snapshot was published.")
+    lines.append("# TYPE cadvisor_viewer_snapshot_timestamp_seconds gauge")
+    lines.append(f"cadvisor_viewer_snapshot_timestamp_seconds {snapshot.created!r}")
+    schedule = node_scheduler.status()
+    lines.append("# HELP cadvisor_viewer_node_staleness_seconds Time since the last successful scrape of a node.")
+    lines.append("# TYPE cadvisor_viewer_node_staleness_seconds gauge")
+    for node_name, status in schedule.items():
+        if status['staleness_seconds'] is not None:
+            lines.append(f'cadvisor_viewer_node_staleness_seconds{{node="{_prom_label(node_name)}"}} {status["staleness_seconds"]!r}')
+    lines.append("# HELP cadvisor_viewer_node_circuit_open Whether scrapes of a node are suspended after repeated failures.")
+    lines.append("# TYPE cadvisor_viewer_node_circuit_open gauge")
+    for node_name, status in schedule.items():
+        lines.append(f'cadvisor_viewer_node_circuit_open{{node="{_prom_label(node_name)}"}} {int(status["state"] != "closed")}')
+    lines.extend(collector_stats.prometheus_lines(openmetrics))
+    if openmetrics:
+        lines.append("# EOF")
+    return ("\n".join(lines) + "\n").encode()
+
+def build_node_fragment(containers_on_node, series_by_container):
+    """Builds a node's /metrics entries from series owned by the calling scrape worker."""
+    fragment = {}
+    for container_id, pod_info in sorted(containers_on_node.items(), key=lambda item: item[1]['container_name']):
+        series = series_by_container.get(container_id)
+        if series is None or not len(series): continue
+        timestamps, values = series.query('raw', limit=HISTORY_SIZE)
+        fragment[container_id] = dict(
+            pod_name=pod_info['pod_name'], container_name=pod_info['container_name'],
+            namespace=pod_info.get('namespace'), timestamps=timestamps, **values
+        )
+    return fragment
+
+def publish_snapshot(pods_map, now=None):
+    """
+    Assembles the node fragments of live containers into a new snapshot and
+    swaps it in. now overrides the aggregation time (replay).
+    """
+    global current_snapshot
+    previous = current_snapshot
+    payload = {}
+    for node_name in list(node_fragments):
+        if node_name not in pods_map:
+            node_fragments.pop(node_name, None)
+    for node_name in sorted(pods_map):
+        fragment = node_fragments.get(node_name) or {}
+        live = {cid: entry for cid, entry in fragment.items() if cid in pods_map[node_name]}
+        if live:
+            payload[node_name] = live
+    live_ids = {cid for containers in pods_map.values() for cid in containers}
+    summary = aggregator.end_cycle(now or time.time(), live_ids)
+    current_snapshot = Snapshot(previous.version + 1, payload, summary)
+    return previous, current_snapshot
 
-        processed_count += 1
+def _entry_after(entry, after):
+    """Copy of a payload entry restricted to points with timestamp > after."""
+    timestamps = entry['timestamps']
+    skip = 0
+    if after is not None:
+        while skip < len(timestamps) and timestamps[skip] <= after: skip += 1
+    trimmed = dict(entry)
+    for key in ('timestamps',) + METRIC_FIELDS:
+        trimmed[key] = entry[key][skip:]
+    return trimmed
+
+def payload_since(payload, cursor):
+    """Restricts a snapshot payload to points newer than cursor. Returns (payload, newest)."""
+    result = {}
+    newest = cursor
+    for node_name, containers in payload.items():
+        result[node_name] = {cid: _entry_after(entry, cursor) for cid, entry in containers.items()}
+        for entry in result[node_name].values():
+            if entry['timestamps'] and (newest is None or entry['timestamps'][-1] > newest):
+                newest = entry['timestamps'][-1]
+    return result, newest
+
+def snapshot_delta(previous_payload, payload):
+    """Per-container new points between two snapshots; every live container is listed."""
+    last_seen = {}
+    for containers in previous_payload.values():
+        for cid, entry in containers.items():
+            if entry['timestamps']: last_seen[cid] = entry['timestamps'][-1]
+    return {node_name: {cid: _entry_after(entry, last_seen.get(cid)) for cid, entry in containers.items()}
+            for node_name, containers in payload.items()}
+
+
+def build_metrics_payload(resolution='raw', since=None, points=None, cursor=None):
+    """
+    Builds the {node: {container_id: entry}} structure served by /metrics and
+    the stream. With a cursor only newer points are included (see metrics_api).
+    Returns (payload, newest_timestamp).
+    """
+    if cursor is not None and since is None:
+        since = cursor
+    response_data = {}
+    with data_lock:
+        pods_map_copy = target_pods_on_nodes_map.copy()
+        history_copy = {}
+        for containers in pods_map_copy.values():
+            for container_id in containers:
+                series = api_metric_history.get(container_id)
+                if series is not None and len(series):
+                    history_copy[container_id] = series.query(resolution, since, points)
+
+    newest = cursor
+    for node_name, containers in pods_map_copy.items():
+        node_data = {}
+        sorted_container_items = sorted(containers.items(), key=lambda item: item[1]['container_name'])
 
-    return processed_count
+        for container_id, pod_info in sorted_container_items:
+            timestamps, values = history_copy.get(container_id, ([], {f: [] for f in METRIC_FIELDS}))
+            if cursor is not None and resolution == 'raw':
+                skip = 0
+                while skip < len(timestamps) and timestamps[skip] <= cursor: skip += 1
+                if skip:
+                    timestamps = timestamps[skip:]
+                    values = {k: v[skip:] for k, v in values.items()}
+            if timestamps or cursor is not None:
+                entry = {
+                    "pod_name": pod_info['pod_name'],
+                    "container_name": pod_info['container_name'],
+                    "namespace": pod_info.get('namespace'),
+                    "timestamps": timestamps,
+                }
+                if resolution == 'raw' or not timestamps:
+                    entry.update((f, values.get(f, [])) for f in METRIC_FIELDS)
+                else:
+                    # Averages under the raw field names so the graphs work unchanged
+                    for field in METRIC_FIELDS:
+                        entry[field] = values[f"{field}_avg"]
+                        entry[f"{field}_min"] = values[f"{field}_min"]
+                        entry[f"{field}_max"] = values[f"{field}_max"]
+                node_data[container_id] = entry
+                if timestamps and (newest is None or timestamps[-1] > newest):
+                    newest = timestamps[-1]
+        if node_data:
+            response_data[node_name] = node_data
 
+    return response_data, newest
 
 # --- Background Collector Thread ---
 
+def scheduled_scrape(node_name, cadvisor_ip, containers_on_node, timeout, start_delay):
+    """Scrape worker: waits out the node's start jitter, then scrapes it."""
+    if start_delay > 0 and stop_event.wait(start_delay):
+        return 0
+    return update_and_calculate_metrics_for_node(node_name, cadvisor_ip, containers_on_node, CADVISOR_PORT, timeout)
+
+def scrape_all_nodes(cadvisor_map, pods_map, deadline):
+    """
+    Scrapes every node concurrently and waits until all are done or the
+    cycle deadline (time.time() based) passes. Returns the number of nodes
+    that completed in time.
+    """
+    close_stale_sessions(set(cadvisor_map.values()))
+
+    futures = {}
+    for node_name in sorted(pods_map.keys()):
+        containers_on_this_node = pods_map.get(node_name, {})
+        cadvisor_pod_ip = cadvisor_map.get(node_name)
+        if not cadvisor_pod_ip or not containers_on_this_node:
+            continue # Skip node if no cAdvisor IP found for it in the map
+        previous = inflight_scrapes.get(node_name)
+        if previous is not None and not previous.done():
+            print(f"Collector Warning: Node '{node_name}' still busy from a previous cycle, skipping.", file=sys.stderr)
+            continue
+        decision = node_scheduler.due(node_name)
+        if decision is None:
+            continue # Backing off, circuit open, or on a longer interval than the cycle
+        mode, start_delay = decision
+        # Never let a single request outlive the cycle deadline
+        remaining = max(0.5, deadline - time.time() - start_delay)
+        limit = CADVISOR_PROBE_TIMEOUT if mode == 'probe' else CADVISOR_REQUEST_TIMEOUT
+        timeout = (min(limit[0], remaining), min(limit[1], remaining))
+        future = scrape_executor.submit(
+            scheduled_scrape, node_name, cadvisor_pod_ip, containers_on_this_node, timeout, start_delay
+        )
+        inflight_scrapes[node_name] = future
+        futures[future] = node_name
+
+    if not futures:
+        return 0
+    done, not_done = wait(futures, timeout=max(0, deadline - time.time()))
+    for future in not_done:
+        print(f"Collector Warning: Node '{futures[future]}' missed the cycle deadline.", file=sys.stderr)
+        collector_stats.record_deadline_miss(futures[future])
+    for future in done:
+        if future.exception() is not None:
+            print(f"Error scraping node '{futures[future]}': {future.exception()}", file=sys.stderr)
+    return len(done)
+
+def replay_recording(directory, speed=None):
+    """
+    Feeds a recording (see recorder.py) back through ingest_node_entries(),
+    publishing a snapshot at the end of every recorded collection cycle with
+    the recorded time, so aggregates come out the same on every replay.
+    speed=None replays as fast as possible, otherwise at speed x real time.
+    Returns (cycles, records).
+    """
+    global target_pods_on_nodes_map
+    pods_map = {}
+    live_ids = set()
+    cycle = cycle_time = first_time = None
+    cycles = records = 0
+    wall_start = time.time()
+
+    def finish_cycle():
+        nonlocal live_ids
+        global target_pods_on_nodes_map
+        now_live = {cid for containers in pods_map.values() for cid in containers}
+        with data_lock:
+            target_pods_on_nodes_map = dict(pods_map)
+            evict_container_state(live_ids - now_live)
+        live_ids = now_live
+        publish_snapshot(pods_map, now=cycle_time)
+
+    for record in iter_recording(directory):
+        if cycle is not None and record['cycle'] != cycle:
+            finish_cycle()
+            cycles += 1
+        cycle, cycle_time = record['cycle'], record['t']
+        if first_time is None: first_time = cycle_time
+        if speed:
+            delay = wall_start + (cycle_time - first_time) / speed - time.time()
+            if delay > 0: time.sleep(delay)
+        pods_map[record['node']] = record['containers']
+        ingest_node_entries(record['node'], record['containers'], record['entries'], ScrapeTrace())
+        records += 1
+    if cycle is not None:
+        finish_cycle()
+        cycles += 1
+    return cycles, records
+
+def start_recording(name=None):
+    """Starts recording raw scrapes to RECORD_DIR/<name or timestamp>. Returns the directory."""
+    global scrape_recorder
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', name) if name else time.strftime('%Y%m%d-%H%M%S')
+    stop_recording()
+    scrape_recorder = ScrapeRecorder(os.path.join(RECORD_DIR, name))
+    print(f"Recording raw scrapes to '{scrape_recorder.directory}'.", file=sys.stderr)
+    return scrape_recorder.directory
+
+def stop_recording():
+    """Stops the running recording, if any. Returns (directory, records) or None."""
+    global scrape_recorder
+    recorder, scrape_recorder = scrape_recorder, None
+    if recorder is None:
+        return None
+    recorder.close()
+    return recorder.directory, recorder.records
+
+def experiment_samples(start, stop):
+    """
+    Yields (container_id, meta, samples) for every container with stored
+    data, where samples are (timestamp, cpu_mcore, memory_mib) from just before
+    start to stop. Reads the segment store when persistence is on, otherwise
+    the in-memory series (1m rollup averages once raw samples no longer reach back).
+    """
+    lookback = start - 10 * COLLECTION_INTERVAL_SECONDS
+    if segment_store is not None:
+        for container_id in segment_store.containers():
+            def samples(container_id=container_id):
+                for timestamps, cpu_values, mem_values in segment_store.range(container_id, lookback, stop):
+                    yield from zip(timestamps.tolist(), cpu_values.tolist(), mem_values.tolist())
+            yield container_id, segment_store.read_meta(container_id), samples()
+        return
+
+    with data_lock:
+        metas = {cid: dict(info, node_name=node_name)
+                 for node_name, containers in target_pods_on_nodes_map.items() for cid, info in containers.items()}
+        queried = {}
+        for container_id, series in api_metric_history.items():
+            timestamps, values = series.query('raw', since=lookback)
+            if not timestamps or timestamps[0] > start:
+                timestamps, rollup = series.query('1m', since=lookback - 60)
+                values = {field: rollup[f"{field}_avg"] for field in ContainerSeries.FIELDS}
+            queried[container_id] = (timestamps, values)
+    for container_id, (timestamps, values) in queried.items():
+        yield container_id, metas.get(container_id, {}), zip(timestamps, values['cpu_mcore'], values['memory_mib'])
+
+def experiment_report(experiment):
+    """Report of an experiment; computed once and cached for finished experiments."""
+    if experiment.get('report') is not None:
+        return experiment['report']
+    report = usage_report(experiment, experiment_samples(experiment['start'], experiment['stop'] or time.time()),
+                          network_function_of)
+    if report['complete']:
+        experiment_log.store_report(experiment['id'], report)
+    return report
+
 def background_collector():
     """Function executed by the background thread to collect metrics."""
-    global node_to_cadvisor_ip_map, target_pods_on_nodes_map
     print("Background collector thread started.")
+    last_retention_check = 0.0
 
-    # --- Fetch Mappings ONCE at Startup ---
-    print("Collector: Fetching initial Kubernetes mappings...", file=sys.stderr)
-    temp_cadvisor_map = get_node_to_cadvisor_map(CADVISOR_NAMESPACE)
-    temp_pods_map = get_target_pods_by_node(OPEN5GS_NAMESPACE)
-    with data_lock:
-        node_to_cadvisor_ip_map = temp_cadvisor_map
-        target_pods_on_nodes_map = temp_pods_map
-    print("Collector: Initial mappings fetched.", file=sys.stderr)
-    # --- End Initial Fetch ---
+    # --- Start Kubernetes pod watchers ---
+    print("Collector: Starting Kubernetes pod watchers...", file=sys.stderr)
+    watchers = [PodWatcher(CADVISOR_NAMESPACE, handle_cadvisor_pod_event, context=KUBE_CONTEXT)]
+    watchers += [PodWatcher(namespace, functools.partial(handle_target_pod_event, namespace), context=KUBE_CONTEXT)
+                 for namespace in TARGET_NAMESPACES]
+    for watcher in watchers:
+        threading.Thread(target=watcher.run, args=(stop_event,), daemon=True,
+                         name=f"watch-{watcher.namespace}").start()
+    # --- End Watcher Startup ---
 
     while not stop_event.is_set():
         try:
             start_cycle_time = time.time()
 
             # --- Collect Metrics using existing maps ---
-            with data_lock: # Get copies of maps fetched at startup
+            with data_lock: # Get the current (copy-on-write) maps
                 cadvisor_map_copy = node_to_cadvisor_ip_map.copy()
                 pods_map_copy = target_pods_on_nodes_map.copy()
 
             if not pods_map_copy:
                  # Print warning only if map is empty after initial fetch
                  if not target_pods_on_nodes_map: # Check original map
-                     print(f"Collector Warning: No running pods found in namespace '{OPEN5GS_NAMESPACE}'.", file=sys.stderr)
+                     print(f"Collector Warning: No running pods found in {', '.join(TARGET_NAMESPACES)}"
+                           f"{f' (shard {SHARD_INDEX}/{SHARD_COUNT})' if SHARD_COUNT > 1 else ''}.", file=sys.stderr)
                  pass # Continue waiting
             elif not cadvisor_map_copy:
                  # Print warning only if map is empty after initial fetch
                  if not node_to_cadvisor_ip_map: # Check original map
                      print(f"Collector Warning: Could not find running cAdvisor pods in namespace '{CADVISOR_NAMESPACE}'.", file=sys.stderr)
             else:
-                nodes_to_process = sorted(pods_map_copy.keys())
-                for node_name in nodes_to_process:
-                    containers_on_this_node = pods_map_copy.get(node_name, {})
-                    cadvisor_pod_ip = cadvisor_map_copy.get(node_name)
-                    if cadvisor_pod_ip and containers_on_this_node:
-                        # This function updates the global histories
-                        update_and_calculate_metrics_for_node(
-                            node_name, cadvisor_pod_ip, containers_on_this_node, CADVISOR_PORT
-                        )
-                    # else: Skip node if no cAdvisor IP found for it in the initial map
+                scrape_all_nodes(cadvisor_map_copy, pods_map_copy, start_cycle_time + CYCLE_DEADLINE_SECONDS)
+
+            previous, snapshot = publish_snapshot(pods_map_copy)
+            # Push this cycle's new samples to streaming clients
+            if broadcaster.subscriber_count():
+                broadcaster.publish(snapshot_delta(previous.payload, snapshot.payload))
+
+            if segment_store is not None and start_cycle_time - last_retention_check >= PERSIST_RETENTION_CHECK_SECONDS:
+                last_retention_check = start_cycle_time
+                removed = segment_store.enforce_retention()
+                if removed:
+                    print(f"Collector: Removed {removed} expired segment files.", file=sys.stderr)
 
             # --- Wait for next cycle ---
             elapsed_time = time.time() - start_cycle_time
+            collector_stats.record_cycle(elapsed_time)
+            collector_stats.forget_nodes(pods_map_copy)
+            node_scheduler.forget(pods_map_copy)
             sleep_time = max(0, COLLECTION_INTERVAL_SECONDS - elapsed_time)
             stop_event.wait(sleep_time) # Interruptible sleep
 
@@ -338,6 +1078,43 @@ def background_collector():
 
     print("Background collector thread stopped.")
 
+def publish_federated_snapshot(payload, now=None):
+    """
+    Publishes a merged upstream payload as the next snapshot. The summary is
+    computed here from the merged samples, so per-NF aggregates span all shards.
+    """
+    global current_snapshot
+    previous = current_snapshot
+    now = now or time.time()
+    for node_name, containers in snapshot_delta(previous.payload, payload).items():
+        for container_id, entry in containers.items():
+            if not entry['timestamps']: continue
+            columns = [entry.get(field) or [None] * len(entry['timestamps']) for field in SUMMARY_FIELDS]
+            aggregator.add(node_name, container_id, entry['pod_name'], list(zip(entry['timestamps'], zip(*columns))))
+    live_ids = {cid for containers in payload.values() for cid in containers}
+    current_snapshot = Snapshot(previous.version + 1, payload, aggregator.end_cycle(now, live_ids))
+    return previous, current_snapshot
+
+def federation_collector():
+    """Thread target in federation mode: polls the upstream collectors once per cycle and publishes the merged view."""
+    print(f"Federation thread started for {len(federation.upstreams)} upstream collectors.")
+    while not stop_event.is_set():
+        try:
+            start_cycle_time = time.time()
+            federation.poll(scrape_executor, start_cycle_time + CYCLE_DEADLINE_SECONDS)
+            previous, snapshot = publish_federated_snapshot(federation.merged_payload())
+            if broadcaster.subscriber_count():
+                broadcaster.publish(snapshot_delta(previous.payload, snapshot.payload))
+            elapsed_time = time.time() - start_cycle_time
+            collector_stats.record_cycle(elapsed_time)
+            stop_event.wait(max(0, COLLECTION_INTERVAL_SECONDS - elapsed_time))
+        except Exception as e:
+            print(f"\nError in federation loop: {e}", file=sys.stderr)
+            import traceback
+            traceback.print_exc()
+            stop_event.wait(COLLECTION_INTERVAL_SECONDS)
+    print("Federation thread stopped.")
+
 
 # --- Flask Web Application (Same as before) ---
 app = Flask(__name__)
@@ -345,54 +1122,454 @@ app = Flask(__name__)
 @app.route('/')
 def index():
     """Serves the main HTML page."""
-    return render_template('index_graphs.html', interval=COLLECTION_INTERVAL_SECONDS * 1000)
+    return render_template('index_graphs.html', interval=COLLECTION_INTERVAL_SECONDS * 1000, points=HISTORY_SIZE)
+
+def requested_filter():
+    """The node=<name>[,...] and nf=<amf|smf|...>[,...] query parameters as (nodes, nfs); None means no filter."""
+    nodes = {n for n in request.args.get('node', '').split(',') if n} or None
+    nfs = {n for n in request.args.get('nf', '').split(',') if n} or None
+    return nodes, nfs
+
+def choose_encoding(accepted):
+    """Picks the response encoding from an Accept-Encoding header value."""
+    if zstandard is not None and 'zstd' in accepted:
+        return 'zstd'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+def compress_body(body, encoding):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return gzip.compress(body, compresslevel=5)
+
+@app.after_request
+def compress_response(response):
+    """Compresses JSON/text responses with zstd (if installed and accepted) or gzip."""
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200 or 'Content-Encoding' in response.headers
+            or not (response.mimetype == 'application/json' or response.mimetype.startswith('text/'))):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(compress_body(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
 
 @app.route('/metrics')
 def metrics_api():
-    """Provides the latest time-series metrics data as JSON."""
-    global node_to_cadvisor_ip_map, target_pods_on_nodes_map, api_metric_history
-    response_data = {}
+    """
+    Provides time-series metrics data as JSON.
+    Query parameters:
+      resolution: 'raw' (default) or a rollup tier name ('1m', '10m'); rollups
+                  also carry <field>_min / <field>_max next to the average
+      window:     only return points from the last N seconds
+      points:     max points per container (default HISTORY_SIZE for raw)
+      since:      cursor; only return raw points newer than this timestamp
+                  (rollups: buckets starting at or after it, so the open bucket
+                  is re-sent until it closes). Every live container is listed,
+                  with empty arrays if it has nothing new.
+      node, nf:   only these nodes / network functions (comma-separated), as for /stream
+    The newest returned timestamp is sent back in the X-Metrics-Cursor header.
+    Answers served from the snapshot (raw, without window/points) carry an
+    ETag, and If-None-Match is answered with 304 until the next snapshot.
+    """
+    resolution = request.args.get('resolution', 'raw')
+    if resolution != 'raw' and resolution not in {name for name, _, _ in ROLLUP_TIERS}:
+        return jsonify({"error": f"unknown resolution '{resolution}'"}), 400
+    # Invalid numbers fall back to the defaults (werkzeug's type conversion)
+    window = request.args.get('window', type=float)
+    cursor = request.args.get('since', type=float)
+    points = request.args.get('points', type=int)
 
-    with data_lock:
-        # Use the maps fetched at startup
-        pods_map_copy = target_pods_on_nodes_map.copy()
-        history_copy = {k: list(v) for k, v in api_metric_history.items()}
+    snapshot = current_snapshot # Single read of the published snapshot; no lock on this path
+    from_snapshot = resolution == 'raw' and window is None and points is None
+    # The snapshot version only validates answers built from the snapshot; the others read live series
+    etag = None
+    if from_snapshot:
+        etag = hashlib.sha1(f"{snapshot.version}|{request.query_string.decode()}".encode()).hexdigest()
+        if request.if_none_match.contains(etag):
+            return '', 304, {'ETag': f'"{etag}"'}
 
-    for node_name, containers in pods_map_copy.items():
-        node_data = {}
-        sorted_container_items = sorted(containers.items(), key=lambda item: item[1]['container_name'])
+    nodes, nfs = requested_filter()
+    filtered = nodes is not None or nfs is not None
 
-        for container_id, pod_info in sorted_container_items:
-            history_data = history_copy.get(container_id, [])
-            if history_data:
-                timestamps = [item[0] for item in history_data]
-                cpu_values = [item[1] for item in history_data]
-                mem_values = [item[2] for item in history_data]
+    if from_snapshot:
+        # Default view and cursor deltas are served straight from the snapshot
+        if cursor is None and not filtered:
+            encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+            body = snapshot.encoded_body(encoding)
+            response = Response(body, mimetype='application/json')
+            if body is not snapshot.body:
+                response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            newest = snapshot.newest
+        else:
+            if cursor is None:
+                response_data, newest = snapshot.payload, snapshot.newest
+            else:
+                response_data, newest = payload_since(snapshot.payload, cursor)
+            if filtered:
+                response_data = filter_batch(response_data, nodes, nfs, network_function_of)
+            response = jsonify(response_data)
+    elif federation is not None:
+        # Custom resolutions/windows are answered by the collectors that own the series;
+        # the filter is applied here, on the cluster-prefixed node names
+        params = {k: v for k, v in request.args.to_dict().items() if k not in ('node', 'nf')}
+        response_data, newest = federation.query('/metrics', params)
+        if filtered:
+            response_data = filter_batch(response_data, nodes, nfs, network_function_of)
+        response = jsonify(response_data)
+    else:
+        # Custom resolutions/windows read the series under the lock
+        since = time.time() - window if window is not None else None
+        if cursor is not None:
+            since = cursor if since is None else max(since, cursor)
+        response_data, newest = build_metrics_payload(resolution, since, points, cursor)
+        if filtered:
+            response_data = filter_batch(response_data, nodes, nfs, network_function_of)
+        response = jsonify(response_data)
 
-                node_data[container_id] = {
-                    "pod_name": pod_info['pod_name'],
-                    "container_name": pod_info['container_name'],
-                    "timestamps": timestamps,
-                    "cpu_mcore": cpu_values,
-                    "memory_mib": mem_values
-                }
-        if node_data:
-            response_data[node_name] = node_data
+    if etag is not None:
+        response.set_etag(etag)
+    if newest is not None:
+        response.headers['X-Metrics-Cursor'] = repr(newest)
+    return response
+
+@app.route('/summary')
+def summary_api():
+    """
+    Rolling aggregates per network function and per node: current sum and
+    mean over members, peak of the group sum, and per window (1m/5m/15m) the
+    count/mean/p50/p95/p99/peak of the members' samples ('per_container') and
+    of the group sum ('total'). Built incrementally by the collector once per
+    cycle; requests only serialize (once per snapshot) and send it.
+    """
+    snapshot = current_snapshot
+    if request.if_none_match.contains(snapshot.etag):
+        return '', 304, {'ETag': f'"{snapshot.etag}"'}
+    body = snapshot.cached('summary', lambda: json.dumps(snapshot.summary, separators=(',', ':')).encode())
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    encoded = snapshot.encoded_body(encoding, body, key='summary')
+    response = Response(encoded, mimetype='application/json')
+    if encoded is not body:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(snapshot.etag)
+    return response
+
+@app.route('/nodes')
+def nodes_api():
+    """
+    Per-node scrape state for the dashboard: schedule state ('closed', 'open'
+    or 'half-open' circuit), interval, consecutive failures, last error,
+    seconds since the last successful scrape and age of the newest sample.
+    """
+    now = time.time()
+    if federation is not None:
+        return jsonify(federation.node_status(now))
+    status = node_scheduler.status(now)
+    for node_name, containers in current_snapshot.payload.items():
+        newest = max((e['timestamps'][-1] for e in containers.values() if e['timestamps']), default=None)
+        if node_name in status:
+            status[node_name]['data_age_seconds'] = now - newest if newest is not None else None
+    return jsonify(status)
+
+@app.route('/shard')
+def shard_api():
+    """What this instance collects (cluster, namespaces, node shard), or its upstreams in federation mode."""
+    if federation is not None:
+        return jsonify({"role": "federation", "cluster": CLUSTER_NAME, "upstreams": federation.status()})
+    return jsonify({"role": "collector", "cluster": CLUSTER_NAME, "context": KUBE_CONTEXT,
+                    "namespaces": list(TARGET_NAMESPACES), "cadvisor_namespace": CADVISOR_NAMESPACE,
+                    "shard": {"index": SHARD_INDEX, "count": SHARD_COUNT},
+                    "nodes": sorted(target_pods_on_nodes_map)})
+
+@app.route('/experiments', methods=['GET'])
+def experiments_api():
+    """Lists experiments (without reports) and the running one."""
+    return jsonify({"active": experiment_log.active(), "experiments": experiment_log.list()})
+
+@app.route('/experiments/start', methods=['POST'])
+def experiment_start_api():
+    """
+    Marks the start of an experiment. Parameters (query string or JSON body):
+      name: label, e.g. 'packetrusher-1000ue'
+      ues:  number of UEs, used to normalize costs per UE
+      notes: free text
+      record: '1' to also record raw scrapes for the duration of the run
+    """
+    params = dict(request.args)
+    params.update(request.get_json(silent=True) or {})
+    try:
+        ues = int(params['ues']) if params.get('ues') not in (None, '') else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "ues must be an integer"}), 400
+    name = params.get('name') or time.strftime('run-%Y%m%d-%H%M%S')
+    if experiment_log.active() is not None:
+        return jsonify({"error": "an experiment is already running", "active": experiment_log.active()}), 409
+    recording = start_recording(name) if str(params.get('record', '')).lower() in ('1', 'true', 'yes') else None
+    try:
+        experiment = experiment_log.start(name, ues, params.get('notes'), recording)
+    except ValueError as e:
+        if recording: stop_recording()
+        return jsonify({"error": str(e)}), 409
+    return jsonify(experiment), 201
+
+@app.route('/experiments/stop', methods=['POST'])
+def experiment_stop_api():
+    """Marks the end of the running experiment (or ?id=<id>) and returns its report."""
+    experiment = experiment_log.stop(request.args.get('id'))
+    if experiment is None:
+        return jsonify({"error": "no running experiment"}), 409
+    recorder = scrape_recorder
+    if experiment.get('recording') and recorder is not None and recorder.directory == experiment['recording']:
+        stop_recording()
+    return jsonify(experiment_report(experiment))
+
+@app.route('/experiments/<experiment_id>', methods=['GET', 'DELETE'])
+def experiment_api(experiment_id):
+    """
+    Per-run cost report: per network function CPU-seconds, average CPU,
+    average/peak memory and, with a UE count, CPU ms and peak memory per UE.
+    Finished experiments are computed once and served from the cache.
+    """
+    if request.method == 'DELETE':
+        if not experiment_log.delete(experiment_id):
+            return jsonify({"error": "unknown experiment"}), 404
+        return '', 204
+    experiment = experiment_log.get(experiment_id)
+    if experiment is None:
+        return jsonify({"error": "unknown experiment"}), 404
+    return jsonify(experiment_report(experiment))
+
+@app.route('/experiments/compare')
+def experiments_compare_api():
+    """Side-by-side per-UE and total costs: ?ids=<id>,<id>,... (default: all finished experiments)."""
+    ids = [i for i in request.args.get('ids', '').split(',') if i]
+    experiments = [experiment_log.get(i) for i in ids] if ids else \
+        [experiment_log.get(e['id']) for e in experiment_log.list() if e['stop'] is not None]
+    rows = []
+    for experiment in experiments:
+        if experiment is None: continue
+        report = experiment_report(experiment)
+        rows.append(dict(
+            id=experiment['id'], name=experiment['name'], ues=experiment['ues'],
+            duration_seconds=report['duration_seconds'], totals=report['totals'],
+            nfs={nf: {k: v for k, v in entry.items() if k in ('cpu_seconds', 'cpu_ms_per_ue', 'memory_peak_mib')}
+                 for nf, entry in report['nfs'].items()},
+        ))
+    return jsonify(rows)
+
+@app.route('/record', methods=['GET'])
+@app.route('/record/<action>', methods=['POST'])
+def record_api(action=None):
+    """
+    Raw scrape recording: POST /record/start[?name=<run>] starts a recording
+    in RECORD_DIR, POST /record/stop closes it; GET /record shows the state.
+    Replay a recording with: python3 app.py --replay <dir>
+    """
+    if action == 'start':
+        start_recording(request.args.get('name'))
+    elif action == 'stop':
+        stopped = stop_recording()
+        if stopped is None:
+            return jsonify({"error": "not recording"}), 409
+        return jsonify({"recording": False, "directory": stopped[0], "records": stopped[1]})
+    elif action is not None:
+        return jsonify({"error": f"unknown action '{action}'"}), 400
+    recorder = scrape_recorder
+    if recorder is None:
+        return jsonify({"recording": False})
+    return jsonify({"recording": True, "directory": recorder.directory, "records": recorder.records,
+                    "started": recorder.started})
+
+@app.route('/debug/collector')
+def debug_collector_api():
+    """
+    Collector self-instrumentation: cycle durations and overruns, data_lock
+    wait/hold times, and per node the scrape / network / JSON decode /
+    processing / store timings, payload sizes, errors, deadline misses,
+    missed samples (aged out of cAdvisor's buffer between scrapes) and
+    stale containers (no new sample in a scrape). Includes the profiler report.
+    """
+    report = collector_stats.report()
+    report['schedule'] = node_scheduler.status()
+    report['profiler'] = profiler.report(limit=request.args.get('limit', 30, type=int))
+    return jsonify(report)
+
+@app.route('/debug/collector/profile', methods=['POST'])
+def debug_profile_api():
+    """Starts or stops the sampling profiler: POST ?action=start|stop. Returns its report."""
+    action = request.args.get('action', 'start')
+    if action == 'start':
+        profiler.start()
+    elif action == 'stop':
+        profiler.stop()
+    else:
+        return jsonify({"error": f"unknown action '{action}'"}), 400
+    return jsonify(profiler.report(limit=request.args.get('limit', 30, type=int)))
 
-    return jsonify(response_data)
+@app.route('/metrics/prometheus')
+def prometheus_api():
+    """
+    Prometheus/OpenMetrics exposition of the latest computed values. Rendered
+    once per snapshot (and compressed once per encoding), so scrapes never
+    recompute anything.
+    """
+    snapshot = current_snapshot
+    openmetrics = 'application/openmetrics-text' in request.headers.get('Accept', '')
+    body = snapshot.cached(('prometheus', openmetrics), lambda: render_prometheus(snapshot, openmetrics))
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    encoded = snapshot.encoded_body(encoding, body, key=('prometheus', openmetrics))
+    content_type = ('application/openmetrics-text; version=1.0.0; charset=utf-8' if openmetrics
+                    else 'text/plain; version=0.0.4; charset=utf-8')
+    response = Response(encoded, content_type=content_type)
+    if encoded is not body:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/stream')
+def stream_api():
+    """
+    Server-Sent Events stream of collector results. The first event ('snapshot')
+    carries the current /metrics payload, then every collection cycle pushes
+    its new samples in the /metrics?since= format.
+    Query parameters: node=<name>[,<name>...], nf=<amf|smf|...>[,...]
+    """
+    nodes, nfs = requested_filter()
+    subscription = broadcaster.subscribe(nodes, nfs)
+    initial = current_snapshot.payload
+
+    def events():
+        try:
+            yield f"retry: {int(COLLECTION_INTERVAL_SECONDS * 1000)}\nevent: snapshot\ndata: {broadcaster.encode(initial, subscription)}\n\n"
+            while not subscription.closed and not stop_event.is_set():
+                payload = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                yield ": keep-alive\n\n" if payload is None else f"data: {payload}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/history')
+def history_index_api():
+    """Lists containers with stored history, including ones that no longer run."""
+    if segment_store is None:
+        return jsonify({"error": "persistence disabled"}), 404
+    return jsonify({cid: segment_store.read_meta(cid) for cid in segment_store.containers()})
+
+@app.route('/history/<container_id>')
+def history_range_api(container_id):
+    """
+    Returns stored samples of one container between ?start= and ?end=
+    (seconds since epoch), read straight from the mmapped segment columns.
+    """
+    if segment_store is None:
+        return jsonify({"error": "persistence disabled"}), 404
+    if not re.fullmatch(r'[0-9a-f]{64}', container_id):
+        return jsonify({"error": "invalid container id"}), 400
+    start = request.args.get('start', type=float)
+    end = request.args.get('end', type=float)
+    timestamps, cpu_values, mem_values = [], [], []
+    for ts_col, cpu_col, mem_col in segment_store.range(container_id, start, end):
+        timestamps += ts_col.tolist()
+        cpu_values += [None if v != v else v for v in cpu_col]
+        mem_values += [None if v != v else v for v in mem_col]
+    return jsonify(dict(segment_store.read_meta(container_id), timestamps=timestamps,
+                        cpu_mcore=cpu_values, memory_mib=mem_values))
 
 # --- Main Execution (Same as before) ---
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Open5GS cAdvisor metrics viewer.")
+    parser.add_argument('--record', metavar='NAME', nargs='?', const='', default=None,
+                        help=f"record raw scrapes to {RECORD_DIR}/<NAME or timestamp>")
+    parser.add_argument('--replay', metavar='DIR', help="replay a recording instead of collecting")
+    parser.add_argument('--speed', type=float, default=None, help="replay speed factor (default: as fast as possible)")
+    parser.add_argument('--output', metavar='FILE', help="after a replay, write the metrics and summary as JSON")
+    parser.add_argument('--resolution', default='raw', help="resolution of the --output metrics ('raw', '1m', '10m')")
+    parser.add_argument('--serve', action='store_true', help="after a replay, serve the replayed data")
+    parser.add_argument('--namespace', action='append', metavar='NS',
+                        help=f"namespace to monitor, repeatable (default: {', '.join(TARGET_NAMESPACES)})")
+    parser.add_argument('--cadvisor-namespace', default=CADVISOR_NAMESPACE, help="namespace of the cAdvisor DaemonSet")
+    parser.add_argument('--context', help="kubectl context of the cluster to watch (default: the current context)")
+    parser.add_argument('--cluster', help="cluster name; a federating instance prefixes node names with it")
+    parser.add_argument('--shard', metavar='I/N', help="only scrape nodes in shard I of N (0-based)")
+    parser.add_argument('--federate', action='append', metavar='URL',
+                        help="serve the merged view of these collector instances instead of collecting, repeatable")
+    parser.add_argument('--data-dir', help="directory for persisted samples, recordings and experiments")
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+
+    TARGET_NAMESPACES = tuple(args.namespace or TARGET_NAMESPACES)
+    CADVISOR_NAMESPACE = args.cadvisor_namespace
+    KUBE_CONTEXT = args.context
+    CLUSTER_NAME = args.cluster
+    if args.shard:
+        try:
+            SHARD_INDEX, SHARD_COUNT = (int(part) for part in args.shard.split('/'))
+        except ValueError:
+            parser.error("--shard must look like I/N, e.g. 0/3")
+        if not 0 <= SHARD_INDEX < SHARD_COUNT:
+            parser.error("--shard index must be between 0 and N-1")
+    if args.data_dir:
+        PERSIST_DIR = os.path.join(args.data_dir, "metrics_data")
+        RECORD_DIR = os.path.join(args.data_dir, "recordings")
+        EXPERIMENTS_FILE = os.path.join(args.data_dir, "experiments.json")
+        experiment_log = ExperimentLog(EXPERIMENTS_FILE)
+
+    if args.replay:
+        started = time.time()
+        cycles, records = replay_recording(args.replay, args.speed)
+        print(f"Replayed {records} scrapes in {cycles} cycles from '{args.replay}' in {time.time() - started:.2f} s.")
+        if args.output:
+            metrics, _ = build_metrics_payload(args.resolution)
+            with open(args.output, 'w') as f:
+                json.dump({"cycles": cycles, "records": records, "summary": current_snapshot.summary,
+                           "metrics": metrics}, f, sort_keys=True)
+            print(f"Wrote replay results to '{args.output}'.")
+        if args.serve:
+            app.run(host='0.0.0.0', port=args.port, debug=False, use_reloader=False)
+        sys.exit(0)
+
+    if args.federate:
+        federation = Federation([url for urls in args.federate for url in urls.split(',') if url], FEDERATION_TIMEOUT)
+        print("Starting federation thread...")
+        collector_thread = threading.Thread(target=federation_collector, daemon=True, name="collector")
+        collector_thread.start()
+        print(f"Starting Flask web server on http://0.0.0.0:{args.port} for {len(federation.upstreams)} collectors...")
+        app.run(host='0.0.0.0', port=args.port, debug=False, use_reloader=False)
+        stop_event.set()
+        collector_thread.join(timeout=5)
+        sys.exit(0)
+
+    if PERSIST_DIR:
+        segment_store = SegmentStore(PERSIST_DIR, PERSIST_RETENTION_SECONDS)
+        print(f"Persisting samples to '{PERSIST_DIR}'.")
+    if args.record is not None:
+        start_recording(args.record)
+
     print("Starting background collector thread...")
-    collector_thread = threading.Thread(target=background_collector, daemon=True)
+    collector_thread = threading.Thread(target=background_collector, daemon=True, name="collector")
     collector_thread.start()
 
-    print(f"Starting Flask web server on http://0.0.0.0:5000 for namespace '{OPEN5GS_NAMESPACE}'...")
-    app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
+    shard = f", shard {SHARD_INDEX}/{SHARD_COUNT}" if SHARD_COUNT > 1 else ""
+    print(f"Starting Flask web server on http://0.0.0.0:{args.port} for {', '.join(TARGET_NAMESPACES)}{shard}...")
+    app.run(host='0.0.0.0', port=args.port, debug=False, use_reloader=False)
 
     print("Flask server stopped. Signaling collector thread to stop...")
     stop_event.set()
     collector_thread.join(timeout=5)
+    scrape_executor.shutdown(wait=False)
+    close_stale_sessions(set())
+    stop_recording()
+    if segment_store is not None:
+        segment_store.close()
     print("Exiting.")
 
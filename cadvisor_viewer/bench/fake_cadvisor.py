@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic cAdvisor stand-in for benchmarking the viewer without a cluster.
+Serves /api/v1.3/subcontainers[/<cgroup>] for N nodes x M containers, each
+node on its own loopback address (127.0.x.y) and the same port, with
+configurable non-target cgroup noise and response latency. Also writes the
+pod inventory that the kubectl stub (bench/kubectl) returns.
+
+Usage:
+  python3 fake_cadvisor.py --nodes 10 --containers 20 --port 18080 --inventory /tmp/inventory.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NETWORK_FUNCTIONS = ("amf", "smf", "upf", "nrf", "ausf", "udm", "udr", "pcf", "nssf", "bsf", "scp")
+# cAdvisor housekeeping period; samples are this far apart
+SAMPLE_PERIOD_SECONDS = 1.0
+
+
+def node_ip(index):
+    return f"127.0.{1 + index // 250}.{1 + index % 250}"
+
+def rfc3339(ts):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(ts)) + '.%09dZ' % int((ts % 1) * 1e9)
+
+
+class FakeContainer:
+    """One cgroup with counters that grow at a fixed, seeded rate."""
+
+    def __init__(self, cgroup_name, container_id, rng):
+        self.name = cgroup_name
+        self.id = container_id
+        self.cpu_rate = rng.uniform(0.01, 2.0) * 1e9   # ns of CPU per second
+        self.memory = rng.uniform(20, 500) * 1024 * 1024
+        self.net_rate = rng.uniform(1e3, 5e7)           # bytes per second
+        self.disk_rate = rng.uniform(0, 1e6)
+        self.born = time.time() - rng.uniform(0, 3600)
+
+    def sample(self, ts, rng):
+        age = ts - self.born
+        return {
+            "timestamp": rfc3339(ts),
+            "cpu": {"usage": {"total": int(self.cpu_rate * age), "user": int(self.cpu_rate * age * 0.7),
+                              "system": int(self.cpu_rate * age * 0.3), "per_cpu_usage": [int(self.cpu_rate * age / 4)] * 4},
+                    "cfs": {"periods": int(age * 10), "throttled_periods": int(age * 0.1), "throttled_time": int(age * 1e6)},
+                    "load_average": 0},
+            "memory": {"usage": int(self.memory * 1.2), "working_set": int(self.memory * rng.uniform(0.98, 1.02)),
+                       "rss": int(self.memory * 0.9), "cache": int(self.memory * 0.2), "max_usage": int(self.memory * 1.5)},
+            "network": {"interfaces": [
+                {"name": "eth0", "rx_bytes": int(self.net_rate * age), "tx_bytes": int(self.net_rate * age * 0.8),
+                 "rx_packets": int(self.net_rate * age / 800), "tx_packets": int(self.net_rate * age / 900),
+                 "rx_errors": 0, "tx_errors": 0, "rx_dropped": 0, "tx_dropped": 0},
+            ]},
+            "diskio": {"io_service_bytes": [{"device": "/dev/sda", "major": 8, "minor": 0,
+                                             "stats": {"Read": int(self.disk_rate * age * 0.1), "Write": int(self.disk_rate * age),
+                                                       "Sync": 0, "Async": int(self.disk_rate * age), "Total": int(self.disk_rate * age * 1.1)}}]},
+            "filesystem": [{"device": "overlay", "type": "vfs", "capacity": 100 * 1024 ** 3, "usage": 1024 ** 3,
+                            "inodes_free": 1000000}],
+            "processes": {"process_count": 3, "fd_count": 40},
+        }
+
+    def entry(self, num_stats, now, rng):
+        last = now - (now % SAMPLE_PERIOD_SECONDS)
+        stats = [self.sample(last - (num_stats - 1 - k) * SAMPLE_PERIOD_SECONDS, rng) for k in range(num_stats)]
+        return {"name": self.name, "id": self.id, "aliases": [self.id, self.name],
+                "namespace": "containerd", "spec": {"has_cpu": True, "has_memory": True, "has_network": True},
+                "stats": stats}
+
+
+class FakeNode:
+    def __init__(self, index, containers, noise, rng):
+        self.name = f"bench-node-{index:03d}"
+        self.ip = node_ip(index)
+        self.containers = []
+        self.pods = []
+        for j in range(containers):
+            nf = NETWORK_FUNCTIONS[j % len(NETWORK_FUNCTIONS)]
+            pod_uid = f"{index:04x}{j:04x}-0000-4000-8000-000000000000"
+            container_id = f"{index:08x}{j:08x}".ljust(64, 'a')
+            cgroup = f"/kubepods.slice/kubepods-burstable.slice/kubepods-burstable-pod{pod_uid.replace('-', '_')}.slice/cri-containerd-{container_id}.scope"
+            self.containers.append(FakeContainer(cgroup, container_id, rng))
+            self.pods.append(dict(uid=pod_uid, name=f"open5gs-{nf}-{index:04x}{j:04x}-bench", container_id=container_id, nf=nf))
+        # Non-target cgroups cAdvisor also reports (system services, other namespaces)
+        self.noise = [FakeContainer(f"/system.slice/noise-{k}.service", f"noise-{k}", rng) for k in range(noise)]
+
+    def subcontainers(self, prefix, num_stats, rng):
+        now = time.time()
+        selected = [c for c in self.noise + self.containers if c.name.startswith(prefix)]
+        return [c.entry(num_stats, now, rng) for c in selected]
+
+
+def make_handler(node, latency_seconds, jitter_seconds):
+    rng = random.Random(node.name)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True # Headers and body go out in separate writes
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            if not self.path.startswith('/api/v1.3/subcontainers'):
+                self.send_error(404)
+                return
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                query = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                query = {}
+            prefix = self.path[len('/api/v1.3/subcontainers'):]
+            body = json.dumps(node.subcontainers(prefix, max(1, int(query.get('num_stats', 1))), rng)).encode()
+            delay = latency_seconds + rng.uniform(-jitter_seconds, jitter_seconds)
+            if delay > 0:
+                time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST
+
+    return Handler
+
+
+def inventory(nodes):
+    """Pod lists per namespace in the Kubernetes API format, for the kubectl stub."""
+    def pod(uid, name, node_name, ip=None, containers=()):
+        return {"metadata": {"uid": uid, "name": name, "resourceVersion": "1"}, "spec": {"nodeName": node_name},
+                "status": {"phase": "Running", "podIP": ip, "containerStatuses": [
+                    {"name": cname, "containerID": f"containerd://{cid}", "state": {"running": {"startedAt": "2024-01-01T00:00:00Z"}}}
+                    for cname, cid in containers]}}
+    return {
+        "cadvisor": [pod(f"cadvisor-{n.name}", f"cadvisor-{n.name}", n.name, ip=n.ip) for n in nodes],
+        "open5gs": [pod(p['uid'], p['name'], n.name, containers=[(p['nf'], p['container_id'])]) for n in nodes for p in n.pods],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic cAdvisor servers for benchmarking.")
+    parser.add_argument('--nodes', type=int, default=4)
+    parser.add_argument('--containers', type=int, default=20, help="target containers per node")
+    parser.add_argument('--noise', type=int, default=30, help="non-target cgroups per node")
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--jitter-ms', type=float, default=2.0)
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--inventory', required=True, help="path to write the pod inventory for the kubectl stub")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    nodes = [FakeNode(i, args.containers, args.noise, rng) for i in range(args.nodes)]
+    servers = []
+    for node in nodes:
+        try:
+            server = ThreadingHTTPServer((node.ip, args.port), make_handler(node, args.latency_ms / 1000, args.jitter_ms / 1000))
+        except OSError as e:
+            print(f"[ERROR] Cannot listen on {node.ip}:{args.port}: {e}", file=sys.stderr)
+            sys.exit(1)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+
+    with open(args.inventory, 'w') as f:
+        json.dump(inventory(nodes), f)
+    print("READY", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the cAdvisor viewer against synthetic cAdvisor servers.
+Starts fake_cadvisor.py in a subprocess, puts the kubectl stub first on
+PATH, runs the real collector (app.background_collector) and serves the
+Flask app on a local port while concurrent clients poll /metrics like the
+dashboard does. Reports collector cycle times, /metrics latency percentiles
+and peak RSS as JSON, and optionally fails when a baseline is exceeded.
+
+Usage:
+  python3 run_bench.py --nodes 10 --containers 30 --clients 8 --duration 30 --output results.json
+  python3 run_bench.py --baseline results.json --tolerance 0.2
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# Result keys compared against a baseline (lower is better)
+REGRESSION_KEYS = (
+    ("cycle_seconds", "p99"),
+    ("metrics_latency_seconds", "p99"),
+    ("peak_rss_mib",),
+)
+
+
+def percentiles(values):
+    values = sorted(values)
+    def pct(q):
+        return values[max(0, math.ceil(q * len(values)) - 1)] if values else None
+    return dict(count=len(values), mean=sum(values) / len(values) if values else None,
+                p50=pct(0.50), p95=pct(0.95), p99=pct(0.99), max=values[-1] if values else None)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def poll_metrics(base_url, stop_at, compress):
+    """One dashboard-like client: full fetch, then cursor + ETag polling. Returns latencies."""
+    import requests
+    session = requests.Session()
+    headers = {'Accept-Encoding': 'gzip' if compress else 'identity'}
+    latencies, errors = [], 0
+    cursor, etag = None, None
+    while time.time() < stop_at:
+        url = f"{base_url}/metrics" + (f"?since={cursor}" if cursor else "")
+        request_headers = dict(headers, **({'If-None-Match': etag} if etag else {}))
+        start = time.perf_counter()
+        try:
+            response = session.get(url, headers=request_headers, timeout=10)
+            response.content
+        except requests.exceptions.RequestException:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        if response.status_code == 200:
+            etag = response.headers.get('ETag')
+            cursor = response.headers.get('X-Metrics-Cursor', cursor)
+        elif response.status_code != 304:
+            errors += 1
+    return latencies, errors
+
+def compare(results, baseline, tolerance):
+    """Returns a list of regressions of results against baseline."""
+    regressions = []
+    for path in REGRESSION_KEYS:
+        new, old = results, baseline
+        for key in path:
+            new = new.get(key) if isinstance(new, dict) else None
+            old = old.get(key) if isinstance(old, dict) else None
+        if new is None or old is None or old <= 0: continue
+        if new > old * (1 + tolerance):
+            regressions.append(dict(metric='.'.join(path), baseline=old, current=new, ratio=new / old))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cAdvisor viewer with synthetic cAdvisor nodes.")
+    parser.add_argument('--nodes', type=int, default=4)
+    parser.add_argument('--containers', type=int, default=20, help="target containers per node")
+    parser.add_argument('--noise', type=int, default=30, help="non-target cgroups per node")
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--jitter-ms', type=float, default=2.0)
+    parser.add_argument('--interval', type=float, default=1.0, help="collection interval in seconds")
+    parser.add_argument('--warmup-cycles', type=int, default=3)
+    parser.add_argument('--duration', type=float, default=20.0, help="measurement time in seconds")
+    parser.add_argument('--clients', type=int, default=4, help="concurrent /metrics pollers")
+    parser.add_argument('--no-compress', action='store_true', help="clients do not accept gzip")
+    parser.add_argument('--output', default='-', help="results file ('-' for stdout)")
+    parser.add_argument('--baseline', help="previous results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative slowdown vs baseline")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="cadvisor-bench-")
+    inventory_path = os.path.join(workdir, "inventory.json")
+    cadvisor_port = free_port()
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'fake_cadvisor.py'), '--nodes', str(args.nodes),
+         '--containers', str(args.containers), '--noise', str(args.noise), '--latency-ms', str(args.latency_ms),
+         '--jitter-ms', str(args.jitter_ms), '--port', str(cadvisor_port), '--inventory', inventory_path],
+        stdout=subprocess.PIPE, text=True,
+    )
+    if fake.stdout.readline().strip() != "READY":
+        print("[ERROR] Fake cAdvisor failed to start.", file=sys.stderr)
+        sys.exit(1)
+    os.environ['BENCH_INVENTORY'] = inventory_path
+    os.environ['PATH'] = BENCH_DIR + os.pathsep + os.environ.get('PATH', '')
+
+    # The app logs to stdout; keep stdout for the results
+    with contextlib.redirect_stdout(sys.stderr):
+        import app
+        from werkzeug.serving import make_server
+
+        app.CADVISOR_PORT = cadvisor_port
+        app.COLLECTION_INTERVAL_SECONDS = args.interval
+        app.CYCLE_DEADLINE_SECONDS = args.interval * 0.9
+        app.collector_stats.interval_seconds = args.interval
+        app.node_scheduler.base_interval = args.interval
+
+        collector = threading.Thread(target=app.background_collector, daemon=True, name="collector")
+        collector.start()
+        warmup_deadline = time.time() + 60
+        while app.collector_stats.cycles < args.warmup_cycles and time.time() < warmup_deadline:
+            time.sleep(0.1)
+
+        logging.getLogger('werkzeug').setLevel(logging.ERROR) # No per-request access log
+        server = make_server('127.0.0.1', 0, app.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        cycles_before = app.collector_stats.cycles
+        overruns_before = app.collector_stats.overruns
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=max(1, args.clients)) as pool:
+            client_results = list(pool.map(lambda _: poll_metrics(base_url, started + args.duration, not args.no_compress),
+                                           range(args.clients)))
+        elapsed = time.time() - started
+        report = app.collector_stats.report()
+        cycles = report['cycles'] - cycles_before
+        cycle_times = list(app.collector_stats.cycle.recent)[-cycles:] if cycles else []
+
+        app.stop_event.set()
+        server.shutdown()
+        collector.join(timeout=5)
+        fake.terminate()
+        fake.wait()
+
+    latencies = [latency for client_latencies, _ in client_results for latency in client_latencies]
+    results = dict(
+        timestamp=time.time(),
+        python=platform.python_version(),
+        config=vars(args),
+        containers_total=args.nodes * args.containers,
+        cycles=cycles,
+        cycle_overruns=report['overruns'] - overruns_before,
+        cycle_seconds=percentiles(cycle_times),
+        scrape_seconds=percentiles([s['scrape_seconds']['p50'] for s in report['nodes'].values() if s['scrape_seconds']['p50'] is not None]),
+        payload_bytes_per_node=percentiles([s['payload_bytes']['last'] for s in report['nodes'].values() if s['payload_bytes']['last'] is not None]),
+        missed_samples=sum(s['missed_samples'] for s in report['nodes'].values()),
+        data_lock=report['locks'].get('data_lock'),
+        metrics_requests=len(latencies),
+        metrics_errors=sum(errors for _, errors in client_results),
+        metrics_rps=len(latencies) / elapsed if elapsed else None,
+        metrics_latency_seconds=percentiles(latencies),
+        peak_rss_mib=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, # KiB on Linux
+    )
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results['regressions'] = regressions
+        for regression in regressions:
+            print(f"[REGRESSION] {regression['metric']}: {regression['baseline']:.6g} -> {regression['current']:.6g} "
+                  f"(x{regression['ratio']:.2f})", file=sys.stderr)
+        exit_code = 1 if regressions else 0
+
+    text = json.dumps(results, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+        print(f"[INFO] Results written to {args.output}", file=sys.stderr)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
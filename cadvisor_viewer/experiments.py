@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Experiment markers and per-run resource cost reports.
+An experiment is a named [start, stop] interval (e.g. a PacketRusher run
+with N UEs). Its report integrates the stored per-container samples over
+that interval, per network function: CPU-seconds, average CPU, average and
+peak memory, and the cost per UE. Markers and the reports of finished
+experiments are kept in one JSON file, so a report is computed only once.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+
+class ExperimentLog:
+    """Experiment markers and cached reports, persisted to a JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._experiments = {} # {id: experiment dict}
+        try:
+            with open(path) as f:
+                self._experiments = {e['id']: e for e in json.load(f)}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # Keep the damaged file for inspection instead of overwriting it
+            print(f"Warning: Cannot read experiment log '{path}' ({e}); moved to '{path}.corrupt'.", file=sys.stderr)
+            os.replace(path, path + '.corrupt')
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(sorted(self._experiments.values(), key=lambda e: e['start']), f)
+        os.replace(tmp, self.path)
+
+    def active(self):
+        with self._lock:
+            return next((dict(e) for e in self._experiments.values() if e['stop'] is None), None)
+
+    def start(self, name, ues=None, notes=None, recording=None, now=None):
+        """Starts an experiment. Raises ValueError while another one is running."""
+        with self._lock:
+            running = next((e for e in self._experiments.values() if e['stop'] is None), None)
+            if running is not None:
+                raise ValueError(f"experiment '{running['name']}' ({running['id']}) is still running")
+            experiment = dict(id=uuid.uuid4().hex[:12], name=name, ues=ues, notes=notes, recording=recording,
+                              start=now or time.time(), stop=None, report=None)
+            self._experiments[experiment['id']] = experiment
+            self._save()
+            return dict(experiment)
+
+    def stop(self, experiment_id=None, now=None):
+        """Stops the given (default: the running) experiment. Returns it, or None if there is nothing to stop."""
+        with self._lock:
+            if experiment_id is None:
+                experiment = next((e for e in self._experiments.values() if e['stop'] is None), None)
+            else:
+                experiment = self._experiments.get(experiment_id)
+            if experiment is None or experiment['stop'] is not None:
+                return None
+            experiment['stop'] = now or time.time()
+            self._save()
+            return dict(experiment)
+
+    def get(self, experiment_id):
+        with self._lock:
+            experiment = self._experiments.get(experiment_id)
+            return dict(experiment) if experiment else None
+
+    def list(self):
+        with self._lock:
+            return [{k: v for k, v in e.items() if k != 'report'}
+                    for e in sorted(self._experiments.values(), key=lambda e: e['start'])]
+
+    def store_report(self, experiment_id, report):
+        """Caches the report of a finished experiment."""
+        with self._lock:
+            experiment = self._experiments.get(experiment_id)
+            if experiment is not None and experiment['stop'] is not None:
+                experiment['report'] = report
+                self._save()
+
+    def delete(self, experiment_id):
+        with self._lock:
+            if self._experiments.pop(experiment_id, None) is None:
+                return False
+            self._save()
+            return True
+
+
+def container_usage(samples, start, stop):
+    """
+    Integrates one container's (timestamp, cpu_mcore, memory_mib) samples,
+    in time order, over [start, stop]. A sample's CPU rate covers the interval
+    since the previous sample, clipped to the window. Returns
+    (cpu_seconds, covered_seconds, memory_events) with memory_events as
+    [(timestamp, memory_mib)] for the memory sweep.
+    """
+    cpu_seconds = covered = 0.0
+    memory_events = []
+    prev_ts = None
+    for ts, cpu, mem in samples:
+        if prev_ts is not None and ts > start and prev_ts < stop:
+            dt = min(ts, stop) - max(prev_ts, start)
+            if cpu is not None and cpu == cpu and dt > 0:
+                cpu_seconds += cpu / 1000.0 * dt
+                covered += dt
+        if start <= ts <= stop and mem is not None and mem == mem:
+            memory_events.append((ts, mem))
+        prev_ts = ts
+        if ts > stop: break
+    return cpu_seconds, covered, memory_events
+
+def memory_sweep(events_by_container, start, stop):
+    """
+    Time-weighted average and peak of the summed memory of several containers.
+    Each container contributes its latest value (from its first sample on).
+    """
+    events = sorted((ts, cid, mem) for cid, events in events_by_container.items() for ts, mem in events)
+    current = {}
+    total = peak = area = 0.0
+    last_ts = None
+    first_ts = events[0][0] if events else start
+    for ts, cid, mem in events:
+        if last_ts is not None:
+            area += total * (ts - last_ts)
+        total += mem - current.get(cid, 0.0)
+        current[cid] = mem
+        peak = max(peak, total)
+        last_ts = ts
+    if last_ts is not None:
+        area += total * (stop - last_ts)
+    return (area / (stop - first_ts) if stop > first_ts else total), (peak if events else None)
+
+def usage_report(experiment, containers, nf_of, now=None):
+    """
+    Builds the report of an experiment from containers, an iterable of
+    (container_id, meta, samples) where meta has pod_name / container_name /
+    node_name and samples yields (timestamp, cpu_mcore, memory_mib) in time order.
+    """
+    start = experiment['start']
+    stop = experiment['stop'] or now or time.time()
+    duration = max(stop - start, 1e-9)
+    ues = experiment.get('ues') or None
+
+    nfs = defaultdict(lambda: dict(cpu_seconds=0.0, containers=0, pods=set(), memory=dict()))
+    for container_id, meta, samples in containers:
+        cpu_seconds, covered, memory_events = container_usage(samples, start, stop)
+        if not covered and not memory_events: continue
+        nf = nfs[nf_of(meta.get('pod_name', ''))]
+        nf['cpu_seconds'] += cpu_seconds
+        nf['containers'] += 1
+        nf['pods'].add(meta.get('pod_name'))
+        nf['memory'][container_id] = memory_events
+
+    report_nfs = {}
+    for name, nf in sorted(nfs.items()):
+        memory_avg, memory_peak = memory_sweep(nf['memory'], start, stop)
+        entry = dict(
+            pods=len(nf['pods']), containers=nf['containers'],
+            cpu_seconds=nf['cpu_seconds'], cpu_avg_mcore=nf['cpu_seconds'] * 1000.0 / duration,
+            memory_avg_mib=memory_avg, memory_peak_mib=memory_peak,
+        )
+        if ues:
+            entry['cpu_ms_per_ue'] = nf['cpu_seconds'] * 1000.0 / ues
+            entry['memory_peak_kib_per_ue'] = memory_peak * 1024.0 / ues if memory_peak is not None else None
+        report_nfs[name] = entry
+
+    total_cpu = sum(e['cpu_seconds'] for e in report_nfs.values())
+    totals = dict(cpu_seconds=total_cpu, cpu_avg_mcore=total_cpu * 1000.0 / duration,
+                  memory_avg_mib=sum(e['memory_avg_mib'] for e in report_nfs.values()),
+                  memory_peak_mib_sum=sum(e['memory_peak_mib'] or 0.0 for e in report_nfs.values()))
+    if ues:
+        totals['cpu_ms_per_ue'] = total_cpu * 1000.0 / ues
+    return dict(experiment={k: v for k, v in experiment.items() if k != 'report'}, duration_seconds=duration,
+                generated=time.time(), complete=experiment['stop'] is not None, nfs=report_nfs, totals=totals)
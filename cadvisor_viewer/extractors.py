@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Config-driven metric extraction from cAdvisor stats samples.
+Each metric names a dotted path into a stats sample and is either a gauge
+(value as is) or a rate (per-second increase of a monotonic counter, with
+counter resets treated as a restart from zero).
+
+Path syntax:
+  cpu.cfs.throttled_periods                 plain field
+  network.interfaces[*].rx_bytes            sum over all list items
+  network.interfaces[ogstun].rx_bytes       item whose 'name' (or 'device') matches
+"""
+
+import re
+
+_TOKEN = re.compile(r'^([A-Za-z0-9_]+)(?:\[([^\]]+)\])?$')
+
+
+def compile_path(path):
+    """Compiles a path into a function stats -> number (or None when absent)."""
+    tokens = []
+    for part in path.split('.'):
+        match = _TOKEN.match(part)
+        if not match:
+            raise ValueError(f"invalid metric path '{path}'")
+        tokens.append((match.group(1), match.group(2)))
+    tokens = tuple(tokens)
+    return lambda stats: _walk(stats, tokens)
+
+def _walk(node, tokens):
+    if not tokens:
+        return node if isinstance(node, (int, float)) and not isinstance(node, bool) else None
+    (key, selector), rest = tokens[0], tokens[1:]
+    child = node.get(key) if isinstance(node, dict) else None
+    if child is None:
+        return None
+    if selector is None:
+        return _walk(child, rest)
+    if not isinstance(child, list):
+        return None
+    if selector == '*':
+        items = child
+    else:
+        items = [item for item in child if isinstance(item, dict) and selector in (item.get('name'), item.get('device'))]
+    values = [v for v in (_walk(item, rest) for item in items) if v is not None]
+    return sum(values) if values else None
+
+
+class MetricSpec:
+    """One extracted metric: (name, kind 'rate' | 'gauge', path, scale, help text)."""
+
+    __slots__ = ('name', 'kind', 'path', 'scale', 'help', 'extract')
+
+    def __init__(self, name, kind, path, scale=1.0, help=''):
+        if kind not in ('rate', 'gauge'):
+            raise ValueError(f"metric '{name}': kind must be 'rate' or 'gauge'")
+        self.name = name
+        self.kind = kind
+        self.path = path
+        self.scale = scale
+        self.help = help
+        self.extract = compile_path(path)
+
+
+class RateEngine:
+    """
+    Turns stats samples into rows of metric values, one value per spec.
+    Keeps the last raw counter values per key (container ID) to compute the
+    rate of the first sample in the next batch.
+    """
+
+    def __init__(self, specs):
+        self.specs = tuple(spec if isinstance(spec, MetricSpec) else MetricSpec(*spec) for spec in specs)
+        self.fields = tuple(spec.name for spec in self.specs)
+        self._last = {} # {key: (ts_ns, [raw values])}
+
+    def process(self, key, samples):
+        """samples: [(ts_ns, stats), ...] in time order. Returns one tuple of values per sample."""
+        last = self._last.get(key)
+        rows = []
+        for ts_ns, stats in samples:
+            raw = [spec.extract(stats) for spec in self.specs]
+            row = []
+            for i, spec in enumerate(self.specs):
+                value = raw[i]
+                if spec.kind == 'gauge':
+                    row.append(None if value is None else value * spec.scale)
+                    continue
+                previous = last[1][i] if last else None
+                if value is None or previous is None or ts_ns <= last[0]:
+                    row.append(None)
+                    continue
+                increase = value - previous if value >= previous else value # Counter reset
+                row.append(increase * spec.scale * 1e9 / (ts_ns - last[0]))
+            rows.append(tuple(row))
+            last = (ts_ns, raw)
+        if last is not None:
+            self._last[key] = last
+        return rows
+
+    def forget(self, key):
+        self._last.pop(key, None)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Federation of several collector instances into one API.
+Every collector owns a shard (a hash range of nodes, one or more
+namespaces, or a whole cluster; see /shard). The federating instance polls
+each collector's snapshot (/metrics, /nodes, /shard) once per cycle and
+merges them into one {node: {container_id: entry}} payload. Node names are
+prefixed with the collector's cluster name ('<cluster>/<node>') when it has
+one, so equal node names in different clusters do not collide.
+"""
+
+import sys
+import threading
+import time
+from concurrent.futures import wait
+
+import requests
+
+# An upstream that has not answered for this long is left out of the merged view
+UPSTREAM_STALE_SECONDS = 60.0
+
+
+class Upstream:
+    """One collector instance and the last state fetched from it."""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        # requests.Session is not thread-safe: the poller and request threads each get their own
+        self._local = threading.local()
+        self.identity = {}
+        self.payload = {}
+        self.nodes = {}
+        self.etag = None
+        self.last_success = None
+        self.last_error = None
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def node_key(self, node_name):
+        cluster = self.identity.get('cluster')
+        return f"{cluster}/{node_name}" if cluster else node_name
+
+    def refresh(self, timeout):
+        """Fetches the upstream's identity, snapshot and node status. Raises on failure."""
+        self.identity = self._get_json('/shard', timeout)
+        headers = {'If-None-Match': self.etag} if self.etag else {}
+        response = self.session.get(f"{self.url}/metrics", headers=headers, timeout=timeout)
+        if response.status_code != 304:
+            response.raise_for_status()
+            self.payload = response.json()
+            self.etag = response.headers.get('ETag')
+        self.nodes = self._get_json('/nodes', timeout)
+        self.last_success = time.time()
+        self.last_error = None
+
+    def _get_json(self, path, timeout, params=None):
+        response = self.session.get(f"{self.url}{path}", params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def status(self, now):
+        return dict(url=self.url, cluster=self.identity.get('cluster'), namespaces=self.identity.get('namespaces'),
+                    shard=self.identity.get('shard'), nodes=len(self.payload),
+                    containers=sum(len(c) for c in self.payload.values()),
+                    staleness_seconds=now - self.last_success if self.last_success else None,
+                    last_error=self.last_error)
+
+
+class Federation:
+    """Polls a set of collectors and merges their snapshots."""
+
+    def __init__(self, urls, timeout):
+        self.upstreams = [Upstream(url) for url in urls]
+        self.timeout = timeout
+
+    def _fresh(self, now):
+        return [u for u in self.upstreams
+                if u.last_success is not None and now - u.last_success <= UPSTREAM_STALE_SECONDS]
+
+    def poll(self, executor, deadline):
+        """Refreshes all upstreams concurrently, waiting until deadline (time.time() based)."""
+        futures = {executor.submit(u.refresh, self.timeout): u for u in self.upstreams}
+        done, not_done = wait(futures, timeout=max(0, deadline - time.time()))
+        for future in not_done:
+            futures[future].last_error = "missed the cycle deadline"
+        for future in done:
+            if future.exception() is not None:
+                upstream = futures[future]
+                upstream.last_error = str(future.exception())
+                print(f"Federation Warning: Cannot fetch from '{upstream.url}': {upstream.last_error}", file=sys.stderr)
+        return len(done) - sum(1 for f in done if f.exception() is not None)
+
+    def merged_payload(self, now=None):
+        """The snapshot payloads of all fresh upstreams as one {node: {container_id: entry}} payload."""
+        merged = {}
+        for upstream in self._fresh(now or time.time()):
+            for node_name, containers in upstream.payload.items():
+                merged.setdefault(upstream.node_key(node_name), {}).update(containers)
+        return {node_name: merged[node_name] for node_name in sorted(merged)}
+
+    def node_status(self, now=None):
+        """Merged /nodes of all fresh upstreams, with the upstream URL added to every node."""
+        now = now or time.time()
+        status = {}
+        for upstream in self._fresh(now):
+            for node_name, node in upstream.nodes.items():
+                status[upstream.node_key(node_name)] = dict(node, upstream=upstream.url)
+        return dict(sorted(status.items()))
+
+    def query(self, path, params):
+        """
+        Sends one request (e.g. /metrics?resolution=1m) to every fresh upstream
+        and merges the {node: {container_id: entry}} answers. Upstreams that
+        fail are left out. Returns (payload, newest cursor or None).
+        """
+        merged, newest = {}, None
+        for upstream in self._fresh(time.time()):
+            try:
+                response = upstream.session.get(f"{upstream.url}{path}", params=params, timeout=self.timeout)
+                response.raise_for_status()
+                payload = response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"Federation Warning: Query to '{upstream.url}' failed: {e}", file=sys.stderr)
+                continue
+            cursor = response.headers.get('X-Metrics-Cursor')
+            if cursor is not None and (newest is None or float(cursor) > newest):
+                newest = float(cursor)
+            for node_name, containers in payload.items():
+                merged.setdefault(upstream.node_key(node_name), {}).update(containers)
+        return {node_name: merged[node_name] for node_name in sorted(merged)}, newest
+
+    def status(self, now=None):
+        now = now or time.time()
+        return [u.status(now) for u in self.upstreams]
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Self-instrumentation of the collector: per-node scrape timings and payload
+sizes, lock wait/hold times, cycle overruns and missed samples, plus an
+optional stdlib sampling profiler (sys._current_frames) for the collector
+and scrape threads. Served by /debug/collector and as Prometheus metrics.
+"""
+
+import math
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+# Recent observations kept per distribution for percentiles
+RECENT_OBSERVATIONS = 256
+# Frames kept per sampled stack (innermost last)
+PROFILE_STACK_DEPTH = 24
+# Innermost frames of threads that are parked (idle pool workers, Event.wait); counted as idle
+IDLE_FRAMES = ('thread.py:_worker', 'threading.py:wait')
+
+
+class Distribution:
+    """Count/sum/max of all observations plus the most recent ones for percentiles."""
+
+    __slots__ = ('count', 'total', 'max', 'last', 'recent')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = None
+        self.recent = deque(maxlen=RECENT_OBSERVATIONS)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max: self.max = value
+        self.last = value
+        self.recent.append(value)
+
+    def summary(self):
+        recent = sorted(self.recent)
+        def pct(q):
+            return recent[max(0, math.ceil(q * len(recent)) - 1)] if recent else None
+        return dict(count=self.count, sum=self.total, max=self.max, last=self.last,
+                    mean=self.total / self.count if self.count else None,
+                    p50=pct(0.50), p95=pct(0.95), p99=pct(0.99))
+
+
+class TimedLock:
+    """threading.Lock replacement that records how long callers wait for it and hold it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._acquired_at = 0.0
+        self.wait = Distribution()
+        self.hold = Distribution()
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        if acquired:
+            # Only the holder touches the stats, so they need no lock of their own
+            self._acquired_at = time.perf_counter()
+            self.wait.observe(self._acquired_at - start)
+        return acquired
+
+    def release(self):
+        self.hold.observe(time.perf_counter() - self._acquired_at)
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ScrapeTrace:
+    """Timings and counts of one node scrape, filled in along the fetch/ingest path."""
+
+    __slots__ = ('started', 'http_seconds', 'parse_seconds', 'process_seconds', 'store_seconds',
+                 'payload_bytes', 'requests', 'new_samples', 'missed_samples', 'stale_containers', 'error')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.http_seconds = 0.0
+        self.parse_seconds = 0.0
+        self.process_seconds = 0.0
+        self.store_seconds = 0.0
+        self.payload_bytes = 0
+        self.requests = 0
+        self.new_samples = 0
+        self.missed_samples = 0
+        self.stale_containers = 0
+        self.error = None
+
+
+class CountingReader:
+    """Wraps a response stream to account bytes and time spent waiting on the network."""
+
+    def __init__(self, raw, trace):
+        self._raw = raw
+        self._trace = trace
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self._raw.read(size)
+        self._trace.http_seconds += time.perf_counter() - start
+        self._trace.payload_bytes += len(data)
+        return data
+
+
+class NodeStats:
+    __slots__ = ('scrape', 'http', 'parse', 'process', 'store', 'payload_bytes', 'scrapes', 'errors',
+                 'new_samples', 'missed_samples', 'stale_containers', 'deadline_misses', 'last_error', 'last_error_at')
+
+    def __init__(self):
+        self.scrape = Distribution()
+        self.http = Distribution()
+        self.parse = Distribution()
+        self.process = Distribution()
+        self.store = Distribution()
+        self.payload_bytes = Distribution()
+        self.scrapes = 0
+        self.errors = Counter()
+        self.new_samples = 0
+        self.missed_samples = 0
+        self.stale_containers = 0
+        self.deadline_misses = 0
+        self.last_error = None
+        self.last_error_at = None
+
+
+class CollectorStats:
+    """Collector-wide instrumentation; scrape workers and the collector thread record into it."""
+
+    def __init__(self, interval_seconds):
+        self.interval_seconds = interval_seconds
+        self.started = time.time()
+        self.cycle = Distribution()
+        self.cycles = 0
+        self.overruns = 0
+        self.nodes = {} # {node_name: NodeStats}
+        self.locks = {} # {name: TimedLock}
+        self._lock = threading.Lock()
+
+    def register_lock(self, name, lock):
+        self.locks[name] = lock
+        return lock
+
+    def record_scrape(self, node_name, trace):
+        with self._lock:
+            node = self.nodes.get(node_name)
+            if node is None:
+                node = self.nodes[node_name] = NodeStats()
+            node.scrapes += 1
+            node.scrape.observe(time.perf_counter() - trace.started)
+            if trace.error is not None:
+                kind, message = trace.error
+                node.errors[kind] += 1
+                node.last_error = message
+                node.last_error_at = time.time()
+                return
+            node.http.observe(trace.http_seconds)
+            node.parse.observe(trace.parse_seconds)
+            node.process.observe(trace.process_seconds)
+            node.store.observe(trace.store_seconds)
+            node.payload_bytes.observe(trace.payload_bytes)
+            node.new_samples += trace.new_samples
+            node.missed_samples += trace.missed_samples
+            node.stale_containers += trace.stale_containers
+
+    def record_deadline_miss(self, node_name):
+        with self._lock:
+            node = self.nodes.get(node_name)
+            if node is None:
+                node = self.nodes[node_name] = NodeStats()
+            node.deadline_misses += 1
+
+    def record_cycle(self, seconds):
+        with self._lock:
+            self.cycles += 1
+            self.cycle.observe(seconds)
+            if seconds > self.interval_seconds:
+                self.overruns += 1
+
+    def forget_nodes(self, live_nodes):
+        with self._lock:
+            for node_name in [n for n in self.nodes if n not in live_nodes]:
+                del self.nodes[node_name]
+
+    def report(self):
+        """JSON-serializable view for /debug/collector."""
+        with self._lock:
+            nodes = {}
+            for node_name, node in sorted(self.nodes.items()):
+                nodes[node_name] = dict(
+                    scrapes=node.scrapes, errors=dict(node.errors), last_error=node.last_error,
+                    last_error_at=node.last_error_at, deadline_misses=node.deadline_misses,
+                    new_samples=node.new_samples, missed_samples=node.missed_samples,
+                    stale_containers=node.stale_containers,
+                    scrape_seconds=node.scrape.summary(), http_seconds=node.http.summary(),
+                    parse_seconds=node.parse.summary(), process_seconds=node.process.summary(),
+                    store_seconds=node.store.summary(), payload_bytes=node.payload_bytes.summary(),
+                )
+            return dict(
+                uptime_seconds=time.time() - self.started, interval_seconds=self.interval_seconds,
+                cycles=self.cycles, overruns=self.overruns, cycle_seconds=self.cycle.summary(),
+                locks={name: dict(wait_seconds=lock.wait.summary(), hold_seconds=lock.hold.summary())
+                       for name, lock in self.locks.items()},
+                nodes=nodes,
+            )
+
+    def prometheus_lines(self, openmetrics=False):
+        """Prometheus (or OpenMetrics) text lines for the collector's own metrics."""
+        lines = []
+        def family(name, kind, help_text, samples):
+            # OpenMetrics names the counter family without the _total suffix of its samples
+            family_name = name[:-len('_total')] if openmetrics and kind == 'counter' else name
+            lines.append(f"# HELP {family_name} {help_text}")
+            lines.append(f"# TYPE {family_name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{labels} {value!r}")
+
+        with self._lock:
+            nodes = sorted(self.nodes.items())
+            node_label = lambda n: '{node="' + n.replace('\\', '\\\\').replace('"', '\\"') + '"}'
+            family('cadvisor_viewer_cycles_total', 'counter', 'Collection cycles run.', [('', self.cycles)])
+            family('cadvisor_viewer_cycle_overruns_total', 'counter',
+                   'Collection cycles that took longer than the collection interval.', [('', self.overruns)])
+            family('cadvisor_viewer_cycle_duration_seconds', 'gauge', 'Duration of the last collection cycle.',
+                   [('', self.cycle.last)] if self.cycle.last is not None else [])
+            for name, lock in self.locks.items():
+                family(f'cadvisor_viewer_{name}_wait_seconds_total', 'counter', f'Time spent waiting for {name}.',
+                       [('', lock.wait.total)])
+                family(f'cadvisor_viewer_{name}_hold_seconds_total', 'counter', f'Time {name} was held.',
+                       [('', lock.hold.total)])
+            family('cadvisor_viewer_scrape_duration_seconds', 'gauge', 'Duration of the last scrape of a node.',
+                   [(node_label(n), s.scrape.last) for n, s in nodes if s.scrape.last is not None])
+            family('cadvisor_viewer_scrape_http_seconds', 'gauge', 'Network time of the last scrape of a node.',
+                   [(node_label(n), s.http.last) for n, s in nodes if s.http.last is not None])
+            family('cadvisor_viewer_scrape_parse_seconds', 'gauge', 'JSON decode time of the last scrape of a node.',
+                   [(node_label(n), s.parse.last) for n, s in nodes if s.parse.last is not None])
+            family('cadvisor_viewer_scrape_payload_bytes', 'gauge', 'Response bytes of the last scrape of a node.',
+                   [(node_label(n), s.payload_bytes.last) for n, s in nodes if s.payload_bytes.last is not None])
+            family('cadvisor_viewer_scrape_errors_total', 'counter', 'Failed scrapes of a node.',
+                   [(node_label(n), sum(s.errors.values())) for n, s in nodes])
+            family('cadvisor_viewer_scrape_deadline_misses_total', 'counter', 'Scrapes that missed the cycle deadline.',
+                   [(node_label(n), s.deadline_misses) for n, s in nodes])
+            family('cadvisor_viewer_missed_samples_total', 'counter',
+                   'cAdvisor samples that aged out before they were scraped.',
+                   [(node_label(n), s.missed_samples) for n, s in nodes])
+        return lines
+
+
+class SamplingProfiler:
+    """
+    Periodically samples the stacks of threads whose name starts with one of
+    thread_prefixes and counts them. Costs nothing while stopped.
+    """
+
+    def __init__(self, thread_prefixes, interval_seconds=0.005):
+        self.thread_prefixes = tuple(thread_prefixes)
+        self.interval_seconds = interval_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle = 0
+        self.started_at = None
+        # Guards stacks, samples and idle against report() on request threads
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running: return
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+            self.idle = 0
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            idle, stacks = 0, []
+            for ident, frame in sys._current_frames().items():
+                if not names.get(ident, '').startswith(self.thread_prefixes): continue
+                code = frame.f_code
+                if f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}" in IDLE_FRAMES:
+                    idle += 1
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                stacks.append(';'.join(reversed(stack)))
+            with self._lock:
+                self.idle += idle
+                self.stacks.update(stacks)
+                self.samples += 1
+
+    def report(self, limit=30):
+        """Top stacks (collapsed, outermost first) and top functions by self and inclusive samples."""
+        with self._lock:
+            stacks = self.stacks.copy()
+            samples, idle = self.samples, self.idle
+        self_counts, inclusive = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = [f.rsplit(':', 1)[0] for f in stack.split(';')]
+            self_counts[frames[-1]] += count
+            for function in set(frames):
+                inclusive[function] += count
+        return dict(
+            running=self.running, started_at=self.started_at, samples=samples, idle_thread_samples=idle,
+            interval_seconds=self.interval_seconds,
+            top_self=self_counts.most_common(limit), top_inclusive=inclusive.most_common(limit),
+            top_stacks=stacks.most_common(limit),
+        )
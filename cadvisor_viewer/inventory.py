@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Watch-based Kubernetes pod inventory for the cAdvisor viewer.
+Lists a namespace once, then follows the API watch stream from the list's
+resourceVersion, so pod restarts, reschedules and scale events are seen
+without re-running a full 'kubectl get pods -o json'.
+"""
+
+import json
+import subprocess
+import sys
+from urllib.parse import urlencode
+
+# Server-side timeout of one watch request; the watch is resumed afterwards
+WATCH_TIMEOUT_SECONDS = 300
+# Delay before retrying after kubectl failed
+RETRY_DELAY_SECONDS = 5
+
+
+class PodWatcher:
+    """
+    Keeps a consumer up to date with the pods of one namespace.
+
+    on_event(event_type, payload) is called with:
+      - ('SYNC', [pod, ...]) after every full list (startup, or resync after 410 Gone)
+      - ('ADDED' | 'MODIFIED' | 'DELETED', pod) for each watch event
+    """
+
+    def __init__(self, namespace, on_event, field_selector=None, context=None):
+        self.namespace = namespace
+        self.on_event = on_event
+        self.field_selector = field_selector
+        self.context = context # kubectl context (cluster); None uses the current one
+        self.resource_version = None
+
+    def _api_path(self, **params):
+        if self.field_selector:
+            params['fieldSelector'] = self.field_selector
+        query = urlencode(params)
+        return f"/api/v1/namespaces/{self.namespace}/pods" + (f"?{query}" if query else "")
+
+    def _kubectl(self, *args):
+        return ['kubectl'] + (['--context', self.context] if self.context else []) + list(args)
+
+    def list_pods(self):
+        """Lists all pods once and remembers the list's resourceVersion. Returns the pods or None."""
+        command = self._kubectl('get', '--raw', self._api_path())
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, check=True, timeout=60)
+            pod_list = json.loads(result.stdout)
+        except FileNotFoundError:
+            print("Error: 'kubectl' command not found.", file=sys.stderr)
+            return None
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, json.JSONDecodeError) as e:
+            print(f"Error listing pods in namespace '{self.namespace}': {e}", file=sys.stderr)
+            return None
+
+        self.resource_version = pod_list.get('metadata', {}).get('resourceVersion')
+        return pod_list.get('items', [])
+
+    def watch(self, stop_event):
+        """
+        Streams watch events starting at the current resourceVersion until the
+        server closes the watch or stop_event is set. Clears the resourceVersion
+        when it is too old (410 Gone) so the next run() iteration relists.
+        """
+        command = self._kubectl('get', '--raw', self._api_path(
+            watch='1', resourceVersion=self.resource_version,
+            allowWatchBookmarks='true', timeoutSeconds=str(WATCH_TIMEOUT_SECONDS),
+        ))
+        try:
+            proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        except FileNotFoundError:
+            print("Error: 'kubectl' command not found.", file=sys.stderr)
+            stop_event.wait(RETRY_DELAY_SECONDS)
+            return
+
+        try:
+            for line in proc.stdout:
+                if stop_event.is_set():
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                event_type = event.get('type')
+                obj = event.get('object', {})
+
+                if event_type == 'ERROR':
+                    if obj.get('code') == 410:
+                        print(f"Watch on '{self.namespace}' expired, relisting.", file=sys.stderr)
+                        self.resource_version = None
+                    else:
+                        print(f"Watch error on '{self.namespace}': {obj.get('message')}", file=sys.stderr)
+                    break
+
+                rv = obj.get('metadata', {}).get('resourceVersion')
+                if rv:
+                    self.resource_version = rv
+                if event_type in ('ADDED', 'MODIFIED', 'DELETED'):
+                    self.on_event(event_type, obj)
+        finally:
+            proc.kill()
+            proc.wait()
+
+        if proc.returncode not in (0, -9) and not stop_event.is_set():
+            # kubectl itself failed (e.g. HTTP 410 for a stale resourceVersion): relist after a pause
+            self.resource_version = None
+            stop_event.wait(RETRY_DELAY_SECONDS)
+
+    def run(self, stop_event):
+        """Thread target: list once, then keep watching until stop_event is set."""
+        while not stop_event.is_set():
+            if self.resource_version is None:
+                pods = self.list_pods()
+                if pods is None:
+                    stop_event.wait(RETRY_DELAY_SECONDS)
+                    continue
+                self.on_event('SYNC', pods)
+            self.watch(stop_event)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Fan-out of collector results to streaming (Server-Sent Events) clients.
+The collector publishes one batch per cycle; every subscriber has a small
+bounded queue and an optional node / network-function filter.
+"""
+
+import json
+import queue
+import threading
+
+# Batches buffered per subscriber before it is considered too slow and dropped
+SUBSCRIBER_QUEUE_SIZE = 16
+
+
+class Subscription:
+    """One connected client. nodes / nfs are sets to filter on, or None for everything."""
+
+    def __init__(self, nodes=None, nfs=None):
+        self.nodes = nodes
+        self.nfs = nfs
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+    @property
+    def filter_key(self):
+        return (frozenset(self.nodes) if self.nodes else None, frozenset(self.nfs) if self.nfs else None)
+
+    def get(self, timeout):
+        """Returns the next serialized batch, or None on timeout / when the subscription was dropped."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+def filter_batch(batch, nodes, nfs, nf_of):
+    """Restricts a {node: {container_id: entry}} batch to the given nodes and network functions."""
+    filtered = {}
+    for node_name, containers in batch.items():
+        if nodes and node_name not in nodes: continue
+        kept = {cid: entry for cid, entry in containers.items() if not nfs or nf_of(entry['pod_name']) in nfs}
+        if kept:
+            filtered[node_name] = kept
+    return filtered
+
+
+class Broadcaster:
+    """Keeps the subscriber set and serializes each batch once per distinct filter."""
+
+    def __init__(self, nf_of):
+        self.nf_of = nf_of
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, nodes=None, nfs=None):
+        subscription = Subscription(nodes, nfs)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def encode(self, batch, subscription):
+        """Serializes a batch for one subscriber (used for the initial snapshot)."""
+        nodes, nfs = subscription.filter_key
+        if nodes or nfs:
+            batch = filter_batch(batch, nodes, nfs, self.nf_of)
+        return json.dumps(batch, separators=(',', ':'))
+
+    def publish(self, batch):
+        """Delivers a batch to every subscriber; subscribers whose queue is full are dropped."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        encoded = {}
+        for subscription in subscribers:
+            key = subscription.filter_key
+            if key not in encoded:
+                nodes, nfs = key
+                encoded[key] = json.dumps(filter_batch(batch, nodes, nfs, self.nf_of) if nodes or nfs else batch,
+                                          separators=(',', ':'))
+            try:
+                subscription.queue.put_nowait(encoded[key])
+            except queue.Full:
+                # Slow client: drop it, the browser reconnects and starts from a fresh snapshot
+                self.unsubscribe(subscription)
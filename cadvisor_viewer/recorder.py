@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Recording of raw (container-filtered) cAdvisor scrape results for offline
+replay. A recording is a directory of gzip-compressed JSON-lines chunks:
+  <dir>/<first_record_ms>.jsonl.gz    closed chunks, oldest first
+  <dir>/<first_record_ms>.jsonl.gz.part  the chunk being written
+One line per node scrape:
+  {"t": wall time, "cycle": n, "node": name, "containers": {cid: pod info}, "entries": {cid: cAdvisor entry}}
+"""
+
+import glob
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+
+# A chunk is closed after this many records or this many seconds, whichever comes first
+RECORD_CHUNK_RECORDS = 2000
+RECORD_CHUNK_SECONDS = 300
+RECORD_COMPRESS_LEVEL = 6
+
+
+class ScrapeRecorder:
+    """Appends scrape records to a recording directory; safe to call from several scrape workers."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.records = 0
+        self.started = time.time()
+        self._chunk = None
+        self._chunk_path = None
+        self._chunk_records = 0
+        self._chunk_started = 0.0
+        self._closed = False
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, node_name, cycle, containers_on_node, entries, now=None):
+        now = now or time.time()
+        line = json.dumps(dict(t=now, cycle=cycle, node=node_name, containers=containers_on_node, entries=entries),
+                          separators=(',', ':')).encode() + b'\n'
+        with self._lock:
+            if self._closed: return # A scrape that raced with stop
+            if self._chunk is not None and (self._chunk_records >= RECORD_CHUNK_RECORDS
+                                            or now - self._chunk_started >= RECORD_CHUNK_SECONDS):
+                self._close_chunk()
+            if self._chunk is None:
+                self._chunk_path = os.path.join(self.directory, f"{int(now * 1000):016d}.jsonl.gz")
+                self._chunk = gzip.open(self._chunk_path + '.part', 'wb', compresslevel=RECORD_COMPRESS_LEVEL)
+                self._chunk_records = 0
+                self._chunk_started = now
+            self._chunk.write(line)
+            self._chunk_records += 1
+            self.records += 1
+
+    def _close_chunk(self):
+        self._chunk.close()
+        os.replace(self._chunk_path + '.part', self._chunk_path)
+        self._chunk = None
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._chunk is not None:
+                self._close_chunk()
+
+
+def iter_recording(directory):
+    """Yields the records of a recording in order. A truncated last chunk (crash while recording) is read up to the damage."""
+    paths = sorted(glob.glob(os.path.join(directory, '*.jsonl.gz')) + glob.glob(os.path.join(directory, '*.jsonl.gz.part')))
+    for path in paths:
+        try:
+            with gzip.open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        break # Partial last line
+        except (EOFError, OSError, zlib.error) as e:
+            print(f"Warning: Recording chunk {path} is truncated ({e}), continuing with the next one.", file=sys.stderr)
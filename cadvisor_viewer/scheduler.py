@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Per-node scrape scheduling for the collector.
+Every node has its own interval (stretched when its scrapes are slow), an
+exponential backoff after failures and a circuit breaker: after
+FAILURE_THRESHOLD consecutive failures the node is only probed once per
+open period, with a short timeout, until a probe succeeds. Nodes with large
+payloads get a random start delay within the cycle, so big scrapes (and
+their JSON decoding) do not all start at the same instant.
+"""
+
+import random
+import threading
+import time
+
+# Consecutive failures that open a node's circuit
+FAILURE_THRESHOLD = 3
+# Backoff cap after failures, and how long an open circuit waits before a probe (doubling per failed probe)
+MAX_BACKOFF_SECONDS = 60.0
+BREAKER_OPEN_SECONDS = 30.0
+BREAKER_MAX_OPEN_SECONDS = 300.0
+# A node's interval is at least this multiple of its (smoothed) scrape duration
+SLOW_SCRAPE_FACTOR = 1.5
+# Start delay: up to this fraction of the base interval, scaled by payload size up to the reference size
+JITTER_FRACTION = 0.2
+JITTER_REFERENCE_BYTES = 4 * 1024 * 1024
+# Scrapes run on collection cycle ticks; a node is due this fraction of the base interval early
+DUE_SLACK_FRACTION = 0.25
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+
+class NodeSchedule:
+    __slots__ = ('interval', 'next_due', 'failures', 'state', 'open_seconds', 'avg_duration', 'payload_bytes',
+                 'last_attempt', 'last_success', 'last_error')
+
+    def __init__(self, interval, now):
+        self.interval = interval
+        self.next_due = now
+        self.failures = 0
+        self.state = CLOSED
+        self.open_seconds = BREAKER_OPEN_SECONDS
+        self.avg_duration = None
+        self.payload_bytes = 0
+        self.last_attempt = None
+        self.last_success = None
+        self.last_error = None
+
+
+class NodeScheduler:
+    """Decides which nodes to scrape in a collection cycle and learns from the outcomes."""
+
+    def __init__(self, base_interval, rng=None):
+        self.base_interval = base_interval
+        self._nodes = {} # {node_name: NodeSchedule}
+        self._lock = threading.Lock()
+        self._rng = rng or random.Random()
+
+    def _node(self, node_name, now):
+        node = self._nodes.get(node_name)
+        if node is None:
+            node = self._nodes[node_name] = NodeSchedule(self.base_interval, now)
+        return node
+
+    def due(self, node_name, now=None):
+        """
+        Returns None when the node should be skipped this cycle, otherwise
+        (mode, start_delay) with mode 'scrape', or 'probe' for an open circuit
+        (a single attempt that should use a short timeout).
+        """
+        now = now or time.time()
+        with self._lock:
+            node = self._node(node_name, now)
+            if now < node.next_due - DUE_SLACK_FRACTION * self.base_interval:
+                return None
+            node.last_attempt = now
+            if node.state == OPEN:
+                node.state = HALF_OPEN
+                node.next_due = now + node.open_seconds # No second probe while this one runs
+                return 'probe', 0.0
+            node.next_due = now + node.interval
+            scale = min(1.0, node.payload_bytes / JITTER_REFERENCE_BYTES)
+            return 'scrape', self._rng.uniform(0, JITTER_FRACTION * self.base_interval * scale)
+
+    def record_success(self, node_name, duration, payload_bytes, now=None):
+        now = now or time.time()
+        with self._lock:
+            node = self._node(node_name, now)
+            node.failures = 0
+            node.state = CLOSED
+            node.open_seconds = BREAKER_OPEN_SECONDS
+            node.last_success = now
+            node.last_error = None
+            node.payload_bytes = payload_bytes
+            node.avg_duration = duration if node.avg_duration is None else 0.8 * node.avg_duration + 0.2 * duration
+            node.interval = max(self.base_interval, node.avg_duration * SLOW_SCRAPE_FACTOR)
+            node.next_due = (node.last_attempt or now) + node.interval
+
+    def record_failure(self, node_name, error, now=None):
+        now = now or time.time()
+        with self._lock:
+            node = self._node(node_name, now)
+            node.failures += 1
+            node.last_error = error
+            if node.state == HALF_OPEN:
+                # Failed probe: stay open, and wait longer before the next one
+                node.state = OPEN
+                node.open_seconds = min(node.open_seconds * 2, BREAKER_MAX_OPEN_SECONDS)
+                node.next_due = now + node.open_seconds
+            elif node.failures >= FAILURE_THRESHOLD:
+                node.state = OPEN
+                node.next_due = now + node.open_seconds
+            else:
+                backoff = min(self.base_interval * 2 ** node.failures, MAX_BACKOFF_SECONDS)
+                node.next_due = now + self._rng.uniform(0.5, 1.0) * backoff
+
+    def forget(self, live_nodes):
+        with self._lock:
+            for node_name in [n for n in self._nodes if n not in live_nodes]:
+                del self._nodes[node_name]
+
+    def status(self, now=None):
+        """{node_name: {...}} with the schedule state and data staleness of every node."""
+        now = now or time.time()
+        with self._lock:
+            return {
+                node_name: dict(
+                    state=node.state, interval_seconds=node.interval, failures=node.failures,
+                    next_scrape_in=max(0.0, node.next_due - now),
+                    staleness_seconds=now - node.last_success if node.last_success else None,
+                    last_success=node.last_success, last_error=node.last_error,
+                    avg_scrape_seconds=node.avg_duration, payload_bytes=node.payload_bytes,
+                )
+                for node_name, node in sorted(self._nodes.items())
+            }
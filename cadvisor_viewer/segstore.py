@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+On-disk storage for calculated container samples.
+Every container gets a directory of append-only segment files. A segment is
+a fixed-size file holding up to SEGMENT_CAPACITY records in three columns
+(timestamp float64, cpu_mcore float32, memory_mib float32) behind a small
+header. Segments are written and read through mmap, so reloading history or
+answering a range query reads the columns in place without parsing or copying.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+SEGMENT_MAGIC = b'CVSEG001'
+# magic, capacity, count, first_ts, last_ts
+HEADER = struct.Struct('<8sIIdd')
+HEADER_SIZE = 64
+# Records per segment file (~1 MiB per segment)
+SEGMENT_CAPACITY = 65536
+NaN = float('nan')
+
+
+def _segment_size(capacity):
+    return HEADER_SIZE + capacity * (8 + 4 + 4)
+
+
+class Segment:
+    """One mmapped segment file; writable when opened by the store's writer."""
+
+    def __init__(self, path, writable=False, capacity=SEGMENT_CAPACITY, first_ts=None):
+        self.path = path
+        if first_ts is not None:
+            # New segment: preallocate the whole file and write the header
+            with open(path, 'wb') as f:
+                f.truncate(_segment_size(capacity))
+                f.write(HEADER.pack(SEGMENT_MAGIC, capacity, 0, first_ts, first_ts))
+        self._file = open(path, 'r+b' if writable else 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        magic, self.capacity, _, _, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != SEGMENT_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a segment file")
+        self._ts_off = HEADER_SIZE
+        self._cpu_off = self._ts_off + 8 * self.capacity
+        self._mem_off = self._cpu_off + 4 * self.capacity
+
+    @property
+    def count(self):
+        return HEADER.unpack_from(self._mm, 0)[2]
+
+    @property
+    def time_range(self):
+        _, _, _, first_ts, last_ts = HEADER.unpack_from(self._mm, 0)
+        return first_ts, last_ts
+
+    def full(self):
+        return self.count >= self.capacity
+
+    def append(self, timestamp, cpu_mcore, memory_mib):
+        """Writes one record; the header count is bumped last so readers never see a partial record."""
+        n = self.count
+        struct.pack_into('<d', self._mm, self._ts_off + 8 * n, timestamp)
+        struct.pack_into('<f', self._mm, self._cpu_off + 4 * n, NaN if cpu_mcore is None else cpu_mcore)
+        struct.pack_into('<f', self._mm, self._mem_off + 4 * n, NaN if memory_mib is None else memory_mib)
+        first_ts = self.time_range[0]
+        HEADER.pack_into(self._mm, 0, SEGMENT_MAGIC, self.capacity, n + 1, first_ts, timestamp)
+
+    def columns(self, start=None, end=None):
+        """
+        Returns zero-copy memoryviews (timestamps, cpu_mcore, memory_mib) for
+        the records with start <= timestamp <= end. The views must be released
+        before the segment is closed.
+        """
+        n = self.count
+        buf = memoryview(self._mm)
+        ts = buf[self._ts_off:self._ts_off + 8 * n].cast('d')
+        lo = 0 if start is None else _bisect_left(ts, start)
+        hi = n if end is None else _bisect_right(ts, end)
+        cols = (ts[lo:hi],
+                buf[self._cpu_off + 4 * lo:self._cpu_off + 4 * hi].cast('f'),
+                buf[self._mem_off + 4 * lo:self._mem_off + 4 * hi].cast('f'))
+        ts.release()
+        buf.release()
+        return cols
+
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        try:
+            self._mm.close()
+        except BufferError:
+            pass # Views still exported; the mapping goes away with them
+        self._file.close()
+
+
+def _bisect_left(col, value):
+    lo, hi = 0, len(col)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if col[mid] < value: lo = mid + 1
+        else: hi = mid
+    return lo
+
+def _bisect_right(col, value):
+    lo, hi = 0, len(col)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if value < col[mid]: hi = mid
+        else: lo = mid + 1
+    return lo
+
+
+class SegmentStore:
+    """
+    Directory of per-container segment files:
+      <root>/<container_id>/meta.json         pod/container/node labels
+      <root>/<container_id>/<first_ts_ms>.seg  segments, oldest first
+    """
+
+    def __init__(self, root, retention_seconds, segment_capacity=SEGMENT_CAPACITY):
+        self.root = root
+        self.retention_seconds = retention_seconds
+        self.segment_capacity = segment_capacity
+        self._writers = {} # {container_id: Segment}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, container_id):
+        return os.path.join(self.root, container_id)
+
+    def _segment_paths(self, container_id):
+        try:
+            names = sorted(n for n in os.listdir(self._dir(container_id)) if n.endswith('.seg'))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self._dir(container_id), n) for n in names]
+
+    def write_meta(self, container_id, meta):
+        with self._lock:
+            os.makedirs(self._dir(container_id), exist_ok=True)
+            tmp = os.path.join(self._dir(container_id), 'meta.json.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp, os.path.join(self._dir(container_id), 'meta.json'))
+
+    def read_meta(self, container_id):
+        try:
+            with open(os.path.join(self._dir(container_id), 'meta.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def containers(self):
+        """Container IDs that have stored data."""
+        try:
+            return sorted(n for n in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, n)))
+        except FileNotFoundError:
+            return []
+
+    def append(self, container_id, timestamp, cpu_mcore, memory_mib):
+        """Appends one calculated sample, rolling over to a new segment when the active one is full."""
+        with self._lock:
+            segment = self._writers.get(container_id)
+            if segment is None or segment.full():
+                if segment is not None:
+                    segment.flush(); segment.close()
+                segment = self._open_writer(container_id, timestamp)
+                self._writers[container_id] = segment
+            segment.append(timestamp, cpu_mcore, memory_mib)
+
+    def _open_writer(self, container_id, timestamp):
+        paths = self._segment_paths(container_id)
+        if paths:
+            try:
+                segment = Segment(paths[-1], writable=True)
+                if not segment.full():
+                    return segment
+                segment.close()
+            except (OSError, ValueError) as e:
+                print(f"Warning: Ignoring unreadable segment {paths[-1]}: {e}", file=sys.stderr)
+        os.makedirs(self._dir(container_id), exist_ok=True)
+        path = os.path.join(self._dir(container_id), f"{int(timestamp * 1000):016d}.seg")
+        return Segment(path, writable=True, capacity=self.segment_capacity, first_ts=timestamp)
+
+    def range(self, container_id, start=None, end=None):
+        """
+        Yields (timestamps, cpu_mcore, memory_mib) memoryviews per segment
+        overlapping [start, end]. Views are only valid until the next iteration.
+        """
+        for path in self._segment_paths(container_id):
+            try:
+                segment = Segment(path)
+            except (OSError, ValueError):
+                continue
+            try:
+                first_ts, last_ts = segment.time_range
+                if (end is not None and first_ts > end) or (start is not None and last_ts < start) or not segment.count:
+                    continue
+                cols = segment.columns(start, end)
+                try:
+                    yield cols
+                finally:
+                    for col in cols: col.release()
+            finally:
+                segment.close()
+
+    def flush(self):
+        with self._lock:
+            for segment in self._writers.values():
+                segment.flush()
+
+    def close_writer(self, container_id):
+        """Closes the active segment of a container that stopped producing samples."""
+        with self._lock:
+            segment = self._writers.pop(container_id, None)
+            if segment is not None:
+                segment.flush(); segment.close()
+
+    def enforce_retention(self, now=None):
+        """Deletes segments whose newest record is older than the retention period."""
+        cutoff = (now or time.time()) - self.retention_seconds
+        removed = 0
+        for container_id in self.containers():
+            # Under the lock, so append() cannot open a segment in a directory being removed
+            with self._lock:
+                active = self._writers.get(container_id)
+                active_path = active.path if active else None
+                for path in self._segment_paths(container_id):
+                    if path == active_path: continue
+                    try:
+                        segment = Segment(path)
+                        last_ts = segment.time_range[1]
+                        segment.close()
+                    except (OSError, ValueError):
+                        continue
+                    if last_ts < cutoff:
+                        try:
+                            os.remove(path)
+                            removed += 1
+                        except FileNotFoundError:
+                            pass
+                if not self._segment_paths(container_id) and active_path is None:
+                    try:
+                        for name in os.listdir(self._dir(container_id)):
+                            os.remove(os.path.join(self._dir(container_id), name))
+                        os.rmdir(self._dir(container_id))
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        print(f"Warning: Cannot remove {self._dir(container_id)}: {e}", file=sys.stderr)
+        return removed
+
+    def close(self):
+        with self._lock:
+            for segment in self._writers.values():
+                segment.flush(); segment.close()
+            self._writers.clear()
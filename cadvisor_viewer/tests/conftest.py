@@ -0,0 +1,142 @@
+import json
+import os
+import sys
+import time
+
+import pytest
+import requests
+
+# The viewer's modules are imported as top-level modules, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Every fake container uses half a core and 50 MiB
+CPU_NS_PER_SECOND = 5 * 10 ** 8
+MEMORY_BYTES = 50 << 20
+
+
+def rfc3339(ts):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(ts)) + '.%09dZ' % round((ts % 1) * 1e9)
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.status_code = status_code
+        self.content = json.dumps(data).encode()
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise ValueError(f"HTTP {self.status_code}")
+
+    def close(self):
+        pass
+
+
+class FakeCadvisor:
+    """
+    Stands in for the requests.Session of every cAdvisor: answers
+    /api/v1.3/subcontainers[<cgroup>] with the entries of the containers
+    under that cgroup, one stats sample per second of its clock. Every
+    request path is recorded in requests; while down, requests fail.
+    """
+
+    def __init__(self, now):
+        self.now = now
+        self.containers = {} # {container_id: (cgroup name, [stats])}
+        self.requests = []
+        self.down = False
+
+    def add(self, container_id, pod_cgroup):
+        self.containers[container_id] = (f"{pod_cgroup}/{container_id}", [])
+
+    def tick(self, seconds):
+        for _ in range(seconds):
+            self.now += 1
+            for container_id, (_, samples) in self.containers.items():
+                k = len(samples) + 1
+                samples.append({
+                    'timestamp': rfc3339(self.now),
+                    'cpu': {'usage': {'total': k * CPU_NS_PER_SECOND}},
+                    'memory': {'working_set': MEMORY_BYTES},
+                    'network': {'interfaces': [{'name': 'eth0', 'rx_bytes': k * 1000, 'tx_bytes': k * 500}]},
+                })
+
+    def post(self, url, json=None, timeout=None, stream=False):
+        path = url.split('/api/v1.3/subcontainers', 1)[1]
+        self.requests.append(path)
+        if self.down:
+            raise requests.exceptions.ConnectionError("connection refused")
+        num_stats = (json or {}).get('num_stats', 60)
+        entries = [{'name': path or '/', 'stats': []}] # The cgroup itself, no container ID
+        for container_id, (name, samples) in self.containers.items():
+            if name.startswith(path + '/'):
+                entries.append({'name': name, 'id': container_id, 'aliases': [], 'stats': samples[-num_stats:]})
+        return FakeResponse(entries)
+
+
+class Collector:
+    """Places pods on nodes and runs collection cycles of the app against a FakeCadvisor."""
+
+    def __init__(self, app, cadvisor):
+        self.app = app
+        self.cadvisor = cadvisor
+        self.pods = {} # {node_name: {container_id: info}}
+
+    def add_pod(self, node_name, pod_name, container_name='main'):
+        """Adds a running pod with one container; returns the container ID."""
+        container_id = f"{len(self.cadvisor.containers) + 1:064x}"
+        self.cadvisor.add(container_id, f"/kubepods/pod{container_id[-8:]}")
+        containers = dict(self.pods.get(node_name, {}))
+        containers[container_id] = {'pod_name': pod_name, 'container_name': container_name, 'namespace': 'open5gs'}
+        self.pods[node_name] = containers
+        self.app.target_pods_on_nodes_map = dict(self.pods)
+        return container_id
+
+    def remove_pod(self, container_id):
+        self.pods = {node: {cid: info for cid, info in containers.items() if cid != container_id}
+                     for node, containers in self.pods.items()}
+        self.pods = {node: containers for node, containers in self.pods.items() if containers}
+        self.app.target_pods_on_nodes_map = dict(self.pods)
+        with self.app.data_lock:
+            self.app.evict_container_state([container_id])
+
+    def scrape(self, seconds=3):
+        """Advances cAdvisor's clock and scrapes every node, without publishing the results."""
+        self.cadvisor.tick(seconds)
+        for node_name, containers in sorted(self.pods.items()):
+            self.app.update_and_calculate_metrics_for_node(node_name, '10.0.0.1', containers)
+
+    def cycle(self, seconds=3):
+        """One collection cycle: scrape, publish the snapshot and push its new samples to streams."""
+        self.scrape(seconds)
+        previous, snapshot = self.app.publish_snapshot(dict(self.pods))
+        if self.app.broadcaster.subscriber_count():
+            self.app.broadcaster.publish(self.app.snapshot_delta(previous.payload, snapshot.payload))
+        return snapshot
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    """A Collector on a fresh app state; samples start 100 s ago."""
+    import app
+    from aggregates import Aggregator
+    cadvisor = FakeCadvisor(time.time() - 100)
+    monkeypatch.setattr(app, 'get_cadvisor_session', lambda cadvisor_ip: cadvisor)
+    monkeypatch.setattr(app, 'target_pods_on_nodes_map', {})
+    monkeypatch.setattr(app, 'current_snapshot', app.Snapshot(0, {}))
+    monkeypatch.setattr(app, 'aggregator', Aggregator(app.SUMMARY_FIELDS, app.SUMMARY_WINDOWS, app.network_function_of))
+    monkeypatch.setattr(app, 'segment_store', None)
+    monkeypatch.setattr(app, 'federation', None)
+    yield Collector(app, cadvisor)
+    with app.data_lock:
+        app.evict_container_state(list(app.api_metric_history) + list(app.container_history))
+    app.node_fragments.clear()
+    app.collector_stats.forget_nodes(set())
+    app.node_scheduler.forget(set())
+
+@pytest.fixture
+def client(collector):
+    return collector.app.app.test_client()
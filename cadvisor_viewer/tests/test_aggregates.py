@@ -0,0 +1,70 @@
+import pytest
+
+from aggregates import Aggregator, SlidingWindow
+
+
+def test_window_percentiles_use_nearest_rank():
+    window = SlidingWindow(60)
+    for i, value in enumerate([5, 1, 4, 2, 3, 10, 9, 8, 7, 6]):
+        window.add(float(i), float(value))
+    stats = window.stats()
+    assert stats['count'] == 10
+    assert stats['mean'] == 5.5
+    assert (stats['p50'], stats['p95'], stats['p99'], stats['peak']) == (5.0, 10.0, 10.0, 10.0)
+
+def test_window_percentiles_of_few_values():
+    window = SlidingWindow(60)
+    assert window.stats() is None
+    window.add(0.0, 7.0)
+    assert window.stats() == dict(count=1, mean=7.0, p50=7.0, p95=7.0, p99=7.0, peak=7.0)
+    window.add(1.0, 3.0)
+    assert window.stats()['p50'] == 3.0
+
+def test_window_expiry_drops_old_values_including_duplicates():
+    window = SlidingWindow(10)
+    for t, value in [(0, 4.0), (5, 4.0), (12, 1.0), (14, 9.0)]:
+        window.add(float(t), value)
+    window.expire(now=15.0) # Drops the entry at t=0 only
+    assert window.ordered == [1.0, 4.0, 9.0]
+    assert window.stats()['mean'] == pytest.approx(14.0 / 3)
+    window.expire(now=100.0)
+    assert window.stats() is None and window.total == 0.0
+
+def test_aggregator_sums_groups_per_cycle():
+    aggregator = Aggregator(('cpu',), (('1m', 60),), nf_of=lambda pod: pod.split('-')[0])
+    aggregator.add('node1', 'c1', 'amf-0', [(1.0, (100.0,))])
+    aggregator.add('node2', 'c2', 'amf-1', [(1.0, (50.0,)), (2.0, (float('nan'),))])
+    aggregator.add('node2', 'c3', 'upf-0', [(1.0, (None,))])
+    summary = aggregator.end_cycle(now=2.0)
+    amf = summary['nf']['amf']
+    assert amf['members'] == 2
+    assert (amf['cpu']['sum'], amf['cpu']['mean'], amf['cpu']['peak']) == (150.0, 75.0, 150.0)
+    assert amf['cpu']['windows']['1m']['per_container']['count'] == 2
+    assert summary['nf']['upf']['cpu']['sum'] is None
+    assert summary['node']['node2']['cpu']['sum'] == 50.0
+
+def test_aggregator_drops_members_that_are_no_longer_live():
+    aggregator = Aggregator(('cpu',), (('1m', 60),), nf_of=lambda pod: pod.split('-')[0])
+    aggregator.add('node1', 'c1', 'amf-0', [(1.0, (100.0,))])
+    aggregator.add('node1', 'c2', 'amf-1', [(1.0, (20.0,))])
+    aggregator.end_cycle(now=1.0)
+    summary = aggregator.end_cycle(now=2.0, live_ids={'c2'})
+    assert summary['nf']['amf']['members'] == 1
+    assert summary['nf']['amf']['cpu']['sum'] == 20.0
+    assert summary['nf']['amf']['cpu']['peak'] == 120.0 # Peak since startup
+    # Once every sample has expired, the empty group disappears
+    summary = aggregator.end_cycle(now=1000.0, live_ids=set())
+    assert summary['nf'] == {} and summary['node'] == {}
+
+def test_summary_endpoint_serves_the_snapshots_aggregates(collector, client):
+    collector.add_pod('node1', 'open5gs-amf-0')
+    collector.add_pod('node2', 'open5gs-amf-1')
+    collector.cycle() # Samples from 100 s ago: in the 5m window, already out of the 1m one
+    response = client.get('/summary')
+    summary = response.get_json()
+    amf = summary['nf']['amf']
+    assert amf['members'] == 2
+    assert amf['cpu_mcore']['sum'] == 1000.0 and amf['memory_mib']['mean'] == 50.0
+    assert amf['cpu_mcore']['windows']['5m']['per_container']['p50'] == 500.0
+    assert sorted(summary['node']) == ['node1', 'node2']
+    assert client.get('/summary', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
@@ -0,0 +1,48 @@
+import time
+
+from instrument import CollectorStats, ScrapeTrace, TimedLock
+
+
+def test_collector_stats_record_scrapes_errors_and_cycles():
+    stats = CollectorStats(interval_seconds=3.0)
+    lock = stats.register_lock('data_lock', TimedLock())
+    with lock:
+        pass
+    trace = ScrapeTrace()
+    trace.payload_bytes, trace.new_samples, trace.requests = 2048, 5, 1
+    stats.record_scrape('node1', trace)
+    failed = ScrapeTrace()
+    failed.error = ('ConnectTimeout', 'timed out')
+    stats.record_scrape('node1', failed)
+    stats.record_deadline_miss('node2')
+    stats.record_cycle(1.0)
+    stats.record_cycle(4.0)
+    report = stats.report()
+    assert (report['cycles'], report['overruns']) == (2, 1)
+    node = report['nodes']['node1']
+    assert (node['scrapes'], node['errors'], node['last_error']) == (2, {'ConnectTimeout': 1}, 'timed out')
+    assert node['new_samples'] == 5 and node['payload_bytes']['count'] == 1
+    assert report['nodes']['node2']['deadline_misses'] == 1
+    assert report['locks']['data_lock']['hold_seconds']['count'] == 1
+    stats.forget_nodes({'node2'})
+    assert list(stats.report()['nodes']) == ['node2']
+
+def test_debug_collector_reports_per_node_scrape_timings(collector, client):
+    collector.add_pod('node1', 'open5gs-amf-0')
+    collector.cycle(seconds=3)
+    collector.cycle(seconds=3)
+    report = client.get('/debug/collector').get_json()
+    node = report['nodes']['node1']
+    assert node['scrapes'] == 2 and node['errors'] == {}
+    assert node['new_samples'] == 6 and node['missed_samples'] == 0
+    assert node['payload_bytes']['count'] == 2 and node['payload_bytes']['max'] > 0
+    assert 'data_lock' in report['locks']
+    assert report['profiler']['running'] is False
+
+def test_profiler_is_started_and_stopped_over_http(client):
+    started = client.post('/debug/collector/profile?action=start').get_json()
+    assert started['running'] is True
+    time.sleep(0.05)
+    stopped = client.post('/debug/collector/profile?action=stop').get_json()
+    assert stopped['running'] is False and stopped['samples'] >= 0
+    assert client.post('/debug/collector/profile?action=pause').status_code == 400
@@ -0,0 +1,65 @@
+import pytest
+
+from experiments import ExperimentLog, container_usage, memory_sweep
+
+
+@pytest.fixture
+def experiment_log(collector, tmp_path, monkeypatch):
+    log = ExperimentLog(str(tmp_path / 'experiments.json'))
+    monkeypatch.setattr(collector.app, 'experiment_log', log)
+    return log
+
+
+def test_container_usage_clips_intervals_to_the_window():
+    samples = [(0.0, None, 10.0), (1.0, 1000.0, 10.0), (2.0, 500.0, 20.0), (3.0, 500.0, 30.0)]
+    cpu_seconds, covered, memory_events = container_usage(samples, 0.5, 2.5)
+    # [0.5, 1] at 1 core, [1, 2] and [2, 2.5] at half a core
+    assert (cpu_seconds, covered) == (0.5 * 1.0 + 1.0 * 0.5 + 0.5 * 0.5, 2.0)
+    assert memory_events == [(1.0, 10.0), (2.0, 20.0)]
+
+def test_memory_sweep_sums_the_latest_value_of_every_container():
+    average, peak = memory_sweep({'a': [(0.0, 10.0), (2.0, 30.0)], 'b': [(1.0, 20.0)]}, 0.0, 4.0)
+    assert peak == 50.0
+    assert average == pytest.approx((10.0 * 1 + 30.0 * 1 + 50.0 * 2) / 4)
+
+def test_report_integrates_the_samples_of_the_run(collector, client, experiment_log):
+    collector.add_pod('node1', 'open5gs-amf-7c9d5b8f6-x2x7k', 'amf')
+    collector.add_pod('node2', 'open5gs-upf-0', 'upf')
+    t0 = collector.cadvisor.now
+    for _ in range(3):
+        collector.cycle(seconds=3) # Samples at t0 + 1 .. t0 + 9
+    experiment = experiment_log.start('packetrusher-100ue', ues=100, now=t0 + 2)
+    experiment_log.stop(now=t0 + 8)
+
+    report = client.get(f"/experiments/{experiment['id']}").get_json()
+    assert report['complete'] is True and report['duration_seconds'] == pytest.approx(6.0)
+    assert sorted(report['nfs']) == ['amf', 'upf']
+    amf = report['nfs']['amf']
+    # Half a core for 6 s
+    assert amf['cpu_seconds'] == pytest.approx(3.0) and amf['cpu_avg_mcore'] == pytest.approx(500.0)
+    assert amf['cpu_ms_per_ue'] == pytest.approx(30.0)
+    assert amf['memory_avg_mib'] == pytest.approx(50.0) and amf['memory_peak_mib'] == pytest.approx(50.0)
+    assert report['totals']['cpu_seconds'] == pytest.approx(6.0)
+    # Finished experiments are reported from the cache
+    assert experiment_log.get(experiment['id'])['report'] == report
+
+def test_experiments_are_started_stopped_compared_and_deleted_over_http(collector, client, experiment_log):
+    collector.add_pod('node1', 'open5gs-amf-0')
+    started = client.post('/experiments/start', json={'name': 'run-a', 'ues': 10})
+    assert started.status_code == 201 and started.get_json()['ues'] == 10
+    assert client.post('/experiments/start?name=run-b').status_code == 409
+    assert client.post('/experiments/start?ues=ten').status_code == 400
+    assert client.get('/experiments').get_json()['active']['name'] == 'run-a'
+
+    stopped = client.post('/experiments/stop')
+    assert stopped.status_code == 200 and stopped.get_json()['complete'] is True
+    assert client.post('/experiments/stop').status_code == 409
+    experiment_id = started.get_json()['id']
+    compared = client.get('/experiments/compare').get_json()
+    assert [row['id'] for row in compared] == [experiment_id]
+
+    # Markers survive a restart
+    assert ExperimentLog(experiment_log.path).get(experiment_id)['name'] == 'run-a'
+    assert client.delete(f"/experiments/{experiment_id}").status_code == 204
+    assert client.get(f"/experiments/{experiment_id}").status_code == 404
+    assert client.delete(f"/experiments/{experiment_id}").status_code == 404
@@ -0,0 +1,72 @@
+import pytest
+
+from extractors import MetricSpec, RateEngine, compile_path
+
+SECOND = 1_000_000_000
+
+STATS = {
+    'cpu': {'usage': {'total': 5}},
+    'network': {'interfaces': [
+        {'name': 'eth0', 'rx_bytes': 100},
+        {'name': 'n3', 'rx_bytes': 40},
+        {'name': 'lo', 'rx_bytes': None},
+    ]},
+    'flag': True,
+}
+
+
+def test_compile_path_follows_keys_and_selectors():
+    assert compile_path('cpu.usage.total')(STATS) == 5
+    assert compile_path('network.interfaces[*].rx_bytes')(STATS) == 140
+    assert compile_path('network.interfaces[n3].rx_bytes')(STATS) == 40
+    assert compile_path('network.interfaces[n6].rx_bytes')(STATS) is None
+    assert compile_path('cpu.missing')(STATS) is None
+    assert compile_path('cpu[*].total')(STATS) is None # Not a list
+    assert compile_path('flag')(STATS) is None # Booleans are not numbers
+
+def test_compile_path_rejects_bad_syntax():
+    with pytest.raises(ValueError):
+        compile_path('cpu..total')
+
+def counter_engine(scale=1.0):
+    return RateEngine([MetricSpec('rate', 'rate', 'c', scale), MetricSpec('level', 'gauge', 'g', 2.0)])
+
+def test_first_sample_has_no_rate_and_gauges_are_scaled():
+    engine = counter_engine()
+    assert engine.process('k', [(0, {'c': 10, 'g': 3})]) == [(None, 6.0)]
+
+def test_rate_is_increase_per_second_across_batches():
+    engine = counter_engine(scale=0.5)
+    engine.process('k', [(0, {'c': 10, 'g': 1})])
+    rows = engine.process('k', [(2 * SECOND, {'c': 30, 'g': 1}), (3 * SECOND, {'c': 40, 'g': 1})])
+    assert [row[0] for row in rows] == [5.0, 5.0]
+
+def test_counter_reset_counts_the_new_value_as_the_increase():
+    engine = counter_engine()
+    rows = engine.process('k', [(0, {'c': 1000}), (SECOND, {'c': 1100}), (2 * SECOND, {'c': 30})])
+    assert [row[0] for row in rows] == [None, 100.0, 30.0]
+    assert rows[0][1] is None # Gauge absent
+
+def test_missing_value_or_repeated_timestamp_gives_no_rate():
+    engine = counter_engine()
+    rows = engine.process('k', [(0, {'c': 10}), (SECOND, {}), (2 * SECOND, {'c': 20}), (2 * SECOND, {'c': 25})])
+    assert [row[0] for row in rows] == [None, None, None, None]
+
+def test_keys_are_independent_and_forget_drops_state():
+    engine = counter_engine()
+    engine.process('a', [(0, {'c': 10})])
+    assert engine.process('b', [(SECOND, {'c': 50})]) == [(None, None)]
+    engine.forget('a')
+    assert engine.process('a', [(SECOND, {'c': 20})]) == [(None, None)]
+
+def test_metric_spec_rejects_unknown_kinds():
+    with pytest.raises(ValueError):
+        MetricSpec('x', 'counter', 'c')
+
+def test_extra_metrics_are_served_next_to_cpu_and_memory(collector, client):
+    amf = collector.add_pod('node1', 'open5gs-amf-0')
+    collector.cycle(seconds=3)
+    entry = client.get('/metrics').get_json()['node1'][amf]
+    assert entry['net_rx_bytes_per_s'] == [None, 1000.0, 1000.0]
+    assert entry['net_tx_bytes_per_s'] == [None, 500.0, 500.0]
+    assert entry['disk_read_bytes_per_s'] == [None] * 3 # Not in the samples
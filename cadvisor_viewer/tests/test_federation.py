@@ -0,0 +1,110 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from aggregates import Aggregator
+from federation import Federation, Upstream
+
+
+class UpstreamResponse:
+    def __init__(self, data, headers=None, status_code=200):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._data = data
+
+    def json(self):
+        return json.loads(json.dumps(self._data))
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"HTTP {self.status_code}")
+
+
+class UpstreamSession:
+    """Answers GETs of one collector instance from canned /shard, /metrics and /nodes bodies."""
+
+    def __init__(self, base_url, routes):
+        self.base_url = base_url
+        self.routes = routes # {path: (data, headers)}
+        self.requests = []
+        self.down = False
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        path = url[len(self.base_url):]
+        self.requests.append((path, dict(headers or {}), params))
+        if self.down:
+            raise requests.exceptions.ConnectionError("connection refused")
+        data, response_headers = self.routes[path]
+        if headers and 'ETag' in response_headers and headers.get('If-None-Match') == response_headers['ETag']:
+            return UpstreamResponse(None, response_headers, status_code=304)
+        return UpstreamResponse(data, response_headers)
+
+
+@pytest.fixture
+def upstreams(collector, client):
+    """Two collectors of different clusters with the same node name, served from this app's own answers."""
+    collector.add_pod('node1', 'open5gs-amf-0', 'amf')
+    collector.cycle()
+    response = client.get('/metrics')
+    payload, nodes = response.get_json(), client.get('/nodes').get_json()
+    (container_id, entry), = payload['node1'].items()
+    headers = {'ETag': response.headers['ETag'], 'X-Metrics-Cursor': response.headers['X-Metrics-Cursor']}
+    sessions = {}
+    for cluster, cid in (('east', container_id), ('west', 'f' * 64)):
+        url = f"http://{cluster}:5000"
+        sessions[url] = UpstreamSession(url, {
+            '/shard': ({'role': 'collector', 'cluster': cluster, 'namespaces': ['open5gs']}, {}),
+            '/metrics': ({'node1': {cid: entry}}, headers),
+            '/nodes': (nodes, {}),
+        })
+    return sessions
+
+@pytest.fixture
+def federation(upstreams, monkeypatch):
+    """A Federation of the upstreams, talking to their UpstreamSessions from every thread."""
+    monkeypatch.setattr(Upstream, 'session', property(lambda self: upstreams[self.url]))
+    return Federation(list(upstreams), timeout=1.0)
+
+
+def test_merged_payload_prefixes_nodes_with_their_cluster(upstreams, federation):
+    with ThreadPoolExecutor(2) as executor:
+        assert federation.poll(executor, time.time() + 5) == 2
+        merged = federation.merged_payload()
+        assert list(merged) == ['east/node1', 'west/node1']
+        assert list(merged['west/node1']) == ['f' * 64]
+        assert federation.node_status()['east/node1']['upstream'] == 'http://east:5000'
+
+        # Unchanged snapshots are revalidated, not downloaded again
+        east = upstreams['http://east:5000']
+        assert federation.poll(executor, time.time() + 5) == 2
+        assert east.requests[-2][1]['If-None-Match'] == east.routes['/metrics'][1]['ETag']
+        assert federation.merged_payload() == merged
+
+        # A failing upstream keeps its last state until it goes stale
+        east.down = True
+        assert federation.poll(executor, time.time() + 5) == 1
+        assert list(federation.merged_payload()) == ['east/node1', 'west/node1']
+        assert list(federation.merged_payload(now=time.time() + 120)) == []
+    assert 'connection refused' in federation.status()[0]['last_error']
+
+def test_federating_instance_serves_the_merged_snapshot(collector, client, upstreams, federation, monkeypatch):
+    app = collector.app
+    with ThreadPoolExecutor(2) as executor:
+        federation.poll(executor, time.time() + 5)
+    monkeypatch.setattr(app, 'federation', federation)
+    monkeypatch.setattr(app, 'current_snapshot', app.Snapshot(0, {}))
+    monkeypatch.setattr(app, 'aggregator', Aggregator(app.SUMMARY_FIELDS, app.SUMMARY_WINDOWS, app.network_function_of))
+    app.publish_federated_snapshot(federation.merged_payload())
+
+    assert list(client.get('/metrics').get_json()) == ['east/node1', 'west/node1']
+    assert list(client.get('/nodes').get_json()) == ['east/node1', 'west/node1']
+    shard = client.get('/shard').get_json()
+    assert shard['role'] == 'federation' and [u['cluster'] for u in shard['upstreams']] == ['east', 'west']
+    # Custom resolutions are forwarded to the collectors and merged
+    response = client.get('/metrics?resolution=1m&nf=amf')
+    assert list(response.get_json()) == ['east/node1', 'west/node1']
+    assert upstreams['http://west:5000'].requests[-1] == ('/metrics', {}, {'resolution': '1m'})
+    assert response.headers['X-Metrics-Cursor'] == upstreams['http://west:5000'].routes['/metrics'][1]['X-Metrics-Cursor']
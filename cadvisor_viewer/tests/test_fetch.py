@@ -0,0 +1,21 @@
+import app
+
+
+def test_targeted_mode_fetches_each_pod_cgroup_after_one_full_walk(collector):
+    amf = collector.add_pod('node1', 'open5gs-amf-0')
+    smf = collector.add_pod('node1', 'open5gs-smf-0')
+    collector.scrape()
+    assert collector.cadvisor.requests == ['']
+    collector.cadvisor.requests.clear()
+    collector.scrape()
+    assert sorted(collector.cadvisor.requests) == sorted(f"/kubepods/pod{cid[-8:]}" for cid in (amf, smf))
+    assert all(len(app.api_metric_history[cid]) == 6 for cid in (amf, smf))
+
+def test_many_pod_cgroups_are_fetched_through_their_common_parent(collector, monkeypatch):
+    monkeypatch.setattr(app, 'CADVISOR_MAX_POD_REQUESTS', 2)
+    containers = [collector.add_pod('node1', f'open5gs-nf{i}-0') for i in range(3)]
+    collector.scrape()
+    collector.cadvisor.requests.clear()
+    collector.scrape()
+    assert collector.cadvisor.requests == ['/kubepods']
+    assert all(len(app.api_metric_history[cid]) == 6 for cid in containers)
@@ -0,0 +1,38 @@
+import time
+
+import app
+
+SECOND = 1_000_000_000
+
+
+def rfc3339(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+
+def test_parse_timestamp_keeps_nanoseconds_and_zones():
+    assert app.parse_timestamp_to_ns('2024-05-01T12:00:00.123456789Z') == 1714564800 * SECOND + 123456789
+    assert app.parse_timestamp_to_ns('2024-05-01T12:00:00Z') == 1714564800 * SECOND
+    assert app.parse_timestamp_to_ns('2024-05-01T14:00:00.5+02:00') == 1714564800 * SECOND + 500000000
+    assert app.parse_timestamp_to_ns('yesterday') is None
+    assert app.parse_timestamp_to_ns(None) is None
+
+def test_decode_new_samples_sorts_deduplicates_and_skips_stored_ones():
+    stats = [{'timestamp': rfc3339(t), 'cpu': {'usage': {'total': t}}} for t in (3, 1, 2, 2)]
+    stats.append({'timestamp': rfc3339(4)}) # No CPU counter
+    samples = app.decode_new_samples(stats, last_ts_ns=1 * SECOND)
+    assert [(ts, cpu) for ts, cpu, _ in samples] == [(2 * SECOND, 2), (3 * SECOND, 3)]
+
+def test_interval_cpu_rates_are_seeded_with_the_last_row_and_skip_resets():
+    rows = [(2 * SECOND, 3 * SECOND), (3 * SECOND, 3 * SECOND + SECOND // 2), (4 * SECOND, 100)]
+    assert app.interval_cpu_mcore((1 * SECOND, 2 * SECOND), rows) == [1000.0, 500.0, None]
+    assert app.interval_cpu_mcore(None, rows[:1]) == [None]
+
+def test_overlapping_scrapes_store_every_sample_once(collector, client):
+    amf = collector.add_pod('node1', 'open5gs-amf-0')
+    # cAdvisor returns its last CADVISOR_NUM_STATS samples; two new ones per scrape overlap the previous scrape
+    for _ in range(4):
+        collector.scrape(seconds=2)
+    collector.app.publish_snapshot(dict(collector.pods))
+    entry = client.get('/metrics').get_json()['node1'][amf]
+    assert [round(t - entry['timestamps'][0]) for t in entry['timestamps']] == list(range(8))
+    assert entry['cpu_mcore'] == [None] + [500.0] * 7
@@ -0,0 +1,92 @@
+import gzip
+import json
+
+
+def test_metrics_lists_every_container_with_its_points(collector, client):
+    amf = collector.add_pod('node1', 'open5gs-amf-7c9d5b8f6-x2x7k', 'amf')
+    collector.add_pod('node2', 'open5gs-upf-0', 'upf')
+    collector.cycle(seconds=4)
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert sorted(payload) == ['node1', 'node2']
+    entry = payload['node1'][amf]
+    assert (entry['pod_name'], entry['container_name'], entry['namespace']) == ('open5gs-amf-7c9d5b8f6-x2x7k', 'amf', 'open5gs')
+    assert len(entry['timestamps']) == 4
+    assert entry['cpu_mcore'][1:] == [500.0, 500.0, 500.0]
+    assert entry['memory_mib'] == [50.0] * 4
+    newest = max(e['timestamps'][-1] for containers in payload.values() for e in containers.values())
+    assert float(response.headers['X-Metrics-Cursor']) == newest
+
+def test_since_cursor_returns_only_newer_points(collector, client):
+    amf = collector.add_pod('node1', 'open5gs-amf-0')
+    smf = collector.add_pod('node1', 'open5gs-smf-0')
+    collector.cycle()
+    cursor = client.get('/metrics').headers['X-Metrics-Cursor']
+    collector.cycle(seconds=2)
+    response = client.get(f'/metrics?since={cursor}')
+    payload = response.get_json()
+    assert set(payload['node1']) == {amf, smf}
+    for entry in payload['node1'].values():
+        assert len(entry['timestamps']) == 2 and entry['timestamps'][0] > float(cursor)
+        assert len(entry['cpu_mcore']) == len(entry['memory_mib']) == 2
+    cursor = response.headers['X-Metrics-Cursor']
+    # Nothing new: every live container is still listed, with empty arrays
+    payload = client.get(f'/metrics?since={cursor}').get_json()
+    assert {cid: entry['timestamps'] for cid, entry in payload['node1'].items()} == {amf: [], smf: []}
+
+def test_unchanged_data_is_answered_with_304(collector, client):
+    collector.add_pod('node1', 'open5gs-amf-0')
+    collector.cycle()
+    etag = client.get('/metrics').headers['ETag']
+    response = client.get('/metrics', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.data == b''
+    # The ETag covers the query string
+    assert client.get('/metrics?since=0', headers={'If-None-Match': etag}).status_code == 200
+    collector.cycle()
+    assert client.get('/metrics', headers={'If-None-Match': etag}).status_code == 200
+
+def test_live_series_answers_are_not_validated_by_the_snapshot(collector, client):
+    amf = collector.add_pod('node1', 'open5gs-amf-0')
+    collector.cycle()
+    first = client.get('/metrics?window=3600')
+    assert 'ETag' not in first.headers
+    # Scraped but not published yet: the series have changed, the snapshot has not
+    collector.scrape()
+    second = client.get('/metrics?window=3600', headers={'If-None-Match': '*'})
+    assert second.status_code == 200
+    assert len(second.get_json()['node1'][amf]['timestamps']) == len(first.get_json()['node1'][amf]['timestamps']) + 3
+
+def test_large_responses_are_gzipped(collector, client):
+    for i in range(5):
+        collector.add_pod('node1', f'open5gs-amf-{i}')
+    collector.cycle(seconds=5)
+    plain = client.get('/metrics')
+    compressed = client.get('/metrics', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+    assert 'Content-Encoding' not in plain.headers
+
+def test_small_responses_are_not_compressed(collector, client):
+    response = client.get('/metrics', headers={'Accept-Encoding': 'gzip'})
+    assert response.get_json() == {} and 'Content-Encoding' not in response.headers
+
+def test_rollup_resolution_and_errors(collector, client):
+    amf = collector.add_pod('node1', 'open5gs-amf-0')
+    collector.cycle(seconds=5)
+    entry = client.get('/metrics?resolution=1m').get_json()['node1'][amf]
+    assert entry['memory_mib'] == entry['memory_mib_min'] == entry['memory_mib_max'] == [50.0] * len(entry['timestamps'])
+    assert client.get('/metrics?resolution=5s').status_code == 400
+
+def test_node_and_nf_filters_apply_to_polling(collector, client):
+    amf = collector.add_pod('node1', 'open5gs-amf-0')
+    collector.add_pod('node1', 'open5gs-smf-0')
+    upf = collector.add_pod('node2', 'open5gs-upf-0')
+    collector.cycle()
+    assert {node: list(c) for node, c in client.get('/metrics?nf=amf,upf').get_json().items()} == \
+        {'node1': [amf], 'node2': [upf]}
+    assert list(client.get('/metrics?node=node2').get_json()) == ['node2']
+    cursor = client.get('/metrics').headers['X-Metrics-Cursor']
+    payload = client.get(f'/metrics?since={cursor}&nf=upf').get_json()
+    assert list(payload) == ['node2'] and list(payload['node2']) == [upf]
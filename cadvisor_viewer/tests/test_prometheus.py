@@ -0,0 +1,57 @@
+import re
+
+# One sample line: name{labels} value
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (\S+)$')
+
+
+def families(text):
+    """{family name: (type, [sample lines])}, checking that every sample follows its HELP and TYPE lines."""
+    result, current = {}, None
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            current = line.split(' ')[2]
+            result[current] = [None, []]
+        elif line.startswith('# TYPE '):
+            name, kind = line.split(' ')[2:4]
+            assert name == current
+            result[current][0] = kind
+        elif line != '# EOF':
+            match = SAMPLE.match(line)
+            assert match and match.group(1).startswith(current), line
+            float(match.group(3))
+            result[current][1].append(line)
+    return {name: tuple(entry) for name, entry in result.items()}
+
+def test_exposition_has_the_latest_value_of_every_container(collector, client):
+    collector.add_pod('node1', 'open5gs-amf-7c9d5b8f6-x2x7k', 'amf')
+    collector.add_pod('node1', 'open5gs-upf-0', 'upf')
+    collector.cycle()
+    response = client.get('/metrics/prometheus')
+    assert response.headers['Content-Type'] == 'text/plain; version=0.0.4; charset=utf-8'
+    parsed = families(response.get_data(as_text=True))
+    kind, samples = parsed['open5gs_container_cpu_mcore']
+    assert kind == 'gauge' and len(samples) == 2
+    amf = next(s for s in samples if 'nf="amf"' in s)
+    assert 'pod="open5gs-amf-7c9d5b8f6-x2x7k",container="amf",node="node1",namespace="open5gs"' in amf
+    assert amf.endswith(' 500.0')
+    assert parsed['open5gs_container_memory_mib'][1][0].endswith(' 50.0')
+    assert parsed['cadvisor_viewer_snapshot_version'][1] == ['cadvisor_viewer_snapshot_version 1']
+    assert parsed['cadvisor_viewer_cycles_total'][0] == 'counter'
+
+def test_openmetrics_is_negotiated_and_terminated(collector, client):
+    collector.add_pod('node1', 'open5gs-amf-0')
+    collector.cycle()
+    response = client.get('/metrics/prometheus', headers={'Accept': 'application/openmetrics-text; version=1.0.0'})
+    assert response.headers['Content-Type'].startswith('application/openmetrics-text; version=1.0.0')
+    text = response.get_data(as_text=True)
+    assert text.endswith('\n# EOF\n')
+    parsed = families(text)
+    # OpenMetrics counter families drop the _total suffix of their samples
+    assert parsed['cadvisor_viewer_cycles'][0] == 'counter'
+    assert parsed['cadvisor_viewer_cycles'][1][0].startswith('cadvisor_viewer_cycles_total ')
+
+def test_label_values_are_escaped(collector, client):
+    collector.add_pod('node"1', 'open5gs-amf-0', 'a\\b')
+    collector.cycle()
+    text = client.get('/metrics/prometheus').get_data(as_text=True)
+    assert 'container="a\\\\b",node="node\\"1"' in text
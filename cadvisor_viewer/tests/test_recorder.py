@@ -0,0 +1,54 @@
+import gzip
+import os
+
+import recorder
+from recorder import ScrapeRecorder, iter_recording
+
+
+def test_recorder_rotates_chunks_and_reads_them_back_in_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(recorder, 'RECORD_CHUNK_RECORDS', 2)
+    rec = ScrapeRecorder(str(tmp_path))
+    for cycle in range(5):
+        rec.write('node1', cycle, {'c': {'pod_name': 'amf-0'}}, {'c': {'stats': []}}, now=1000.0 + cycle)
+    assert sorted(p.endswith('.part') for p in os.listdir(tmp_path)) == [False, False, True]
+    rec.close()
+    rec.write('node1', 5, {}, {}) # After close: ignored
+    assert rec.records == 5
+    assert len([p for p in os.listdir(tmp_path) if p.endswith('.jsonl.gz')]) == 3
+    assert [r['cycle'] for r in iter_recording(str(tmp_path))] == [0, 1, 2, 3, 4]
+
+def test_truncated_chunk_is_read_up_to_the_damage(tmp_path):
+    rec = ScrapeRecorder(str(tmp_path))
+    for cycle in range(3):
+        rec.write('node1', cycle, {}, {}, now=1000.0)
+    rec.close()
+    path = os.path.join(str(tmp_path), os.listdir(tmp_path)[0])
+    with gzip.open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(gzip.compress(data)[:-12]) # Lost the gzip trailer and the end of the last record
+    assert [r['cycle'] for r in iter_recording(str(tmp_path))] == [0, 1]
+
+def test_replay_reproduces_the_recorded_metrics(collector, client, tmp_path, monkeypatch):
+    app = collector.app
+    monkeypatch.setattr(app, 'RECORD_DIR', str(tmp_path))
+    collector.add_pod('node1', 'open5gs-amf-0')
+    collector.add_pod('node2', 'open5gs-upf-0')
+    directory = app.start_recording('run 1')
+    assert directory == os.path.join(str(tmp_path), 'run_1')
+    assert client.get('/record').get_json()['recording'] is True
+    for _ in range(3):
+        collector.cycle()
+    recorded = client.get('/metrics').get_json()
+    stopped = client.post('/record/stop').get_json()
+    assert stopped == {'recording': False, 'directory': directory, 'records': 6}
+    assert client.post('/record/stop').status_code == 409
+
+    # A fresh instance replays the recording
+    with app.data_lock:
+        app.evict_container_state(list(app.api_metric_history))
+    app.node_fragments.clear()
+    monkeypatch.setattr(app, 'target_pods_on_nodes_map', {})
+    monkeypatch.setattr(app, 'current_snapshot', app.Snapshot(0, {}))
+    assert app.replay_recording(directory) == (3, 6)
+    assert client.get('/metrics').get_json() == recorded
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+import app
+from instrument import ScrapeTrace
+from segstore import SegmentStore
+
+CONTAINER_ID = 'c' * 64
+CONTAINERS = {CONTAINER_ID: {'pod_name': 'amf-0', 'container_name': 'amf', 'namespace': 'open5gs', 'pod_ip': None}}
+
+
+def cadvisor_stats(base, first, last):
+    """cAdvisor entries for one container, one per second, using half a core."""
+    stats = []
+    for k in range(first, last):
+        ts = base + k
+        stamp = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(ts)) + '.%09dZ' % int((ts % 1) * 1e9)
+        stats.append({'timestamp': stamp, 'cpu': {'usage': {'total': 10 ** 9 + k * 5 * 10 ** 8}},
+                      'memory': {'working_set': 50 << 20}})
+    return {CONTAINER_ID: {'stats': stats}}
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'segment_store', SegmentStore(str(tmp_path), 3600))
+    yield tmp_path
+    with app.data_lock:
+        app.evict_container_state([CONTAINER_ID])
+    app.persisted_meta.clear()
+
+def restart(root):
+    """Drops the in-memory state as a restart would, keeping the segment files."""
+    app.segment_store.close()
+    with app.data_lock:
+        app.evict_container_state([CONTAINER_ID])
+    app.persisted_meta.clear()
+    app.segment_store = SegmentStore(str(root), 3600)
+
+def test_restored_samples_are_not_ingested_again(store):
+    base = time.time() - 30
+    app.ingest_node_entries('node1', CONTAINERS, cadvisor_stats(base, 0, 10), ScrapeTrace())
+    restart(store)
+    app.restore_history([CONTAINER_ID])
+    # cAdvisor still returns the overlapping last seconds after the restart
+    app.ingest_node_entries('node1', CONTAINERS, cadvisor_stats(base, 5, 15), ScrapeTrace())
+    app.segment_store.flush()
+
+    timestamps, values = app.api_metric_history[CONTAINER_ID].query()
+    assert [round(t - base) for t in timestamps] == list(range(15))
+    # No rate for the very first sample, nor for the first one after the restart (the raw counters start empty)
+    cpu = values['cpu_mcore']
+    assert cpu[0] is None and cpu[10] is None
+    assert cpu[1:10] + cpu[11:] == pytest.approx([500.0] * 13)
+    persisted = [t for columns in app.segment_store.range(CONTAINER_ID) for t in columns[0].tolist()]
+    assert [round(t - base) for t in persisted] == list(range(15))
+
+def test_samples_ingested_before_the_restore_are_kept_after_the_restored_ones(store, monkeypatch):
+    base = time.time() - 30
+    app.ingest_node_entries('node1', CONTAINERS, cadvisor_stats(base, 0, 10), ScrapeTrace())
+    restart(store)
+    monkeypatch.setattr(app, 'target_pods_on_nodes_map', {})
+    monkeypatch.setattr(app, 'target_pod_index', {})
+
+    # A collector cycle runs between the publication of the new target map and the restore
+    stored_range = app.segment_store.range
+    def range_after_a_cycle(container_id, since=None):
+        app.ingest_node_entries('node1', app.target_pods_on_nodes_map['node1'], cadvisor_stats(base, 12, 15), ScrapeTrace())
+        return stored_range(container_id, since)
+    monkeypatch.setattr(app.segment_store, 'range', range_after_a_cycle)
+    pod = {
+        'metadata': {'name': 'amf-0', 'uid': 'uid-1'},
+        'spec': {'nodeName': 'node1'},
+        'status': {'phase': 'Running', 'containerStatuses': [
+            {'name': 'amf', 'state': {'running': {'startedAt': '2026-01-01T00:00:00Z'}}, 'containerID': f'containerd://{CONTAINER_ID}'}]},
+    }
+    app.handle_target_pod_event('open5gs', 'ADDED', pod)
+
+    series = app.api_metric_history[CONTAINER_ID]
+    timestamps, _ = series.query()
+    assert [round(t - base) for t in timestamps] == list(range(10)) + [12, 13, 14]
+    # The scrape worker's reference still points at the stored series
+    app.ingest_node_entries('node1', CONTAINERS, cadvisor_stats(base, 12, 16), ScrapeTrace())
+    assert app.api_metric_history[CONTAINER_ID] is series and round(series.raw.last_timestamp() - base) == 15
@@ -0,0 +1,110 @@
+import pytest
+
+from scheduler import (BREAKER_MAX_OPEN_SECONDS, BREAKER_OPEN_SECONDS, CLOSED, DUE_SLACK_FRACTION, FAILURE_THRESHOLD,
+                       HALF_OPEN, JITTER_FRACTION, MAX_BACKOFF_SECONDS, OPEN, NodeScheduler)
+
+BASE = 5.0
+START = 1000.0
+
+
+class UpperBound:
+    """Deterministic stand-in for random.Random: uniform() returns its upper bound."""
+
+    def uniform(self, low, high):
+        return high
+
+
+def scheduler():
+    return NodeScheduler(BASE, rng=UpperBound())
+
+def test_new_node_is_due_and_then_waits_one_interval():
+    s = scheduler()
+    assert s.due('n', now=START) == ('scrape', 0.0) # No payload seen yet, no start delay
+    s.record_success('n', duration=0.1, payload_bytes=0, now=START)
+    assert s.due('n', now=START + 1) is None
+    assert s.due('n', now=START + BASE * (1 - DUE_SLACK_FRACTION))[0] == 'scrape'
+
+def test_slow_scrapes_stretch_the_interval():
+    s = scheduler()
+    s.due('n', now=START)
+    s.record_success('n', duration=10.0, payload_bytes=0, now=START + 10)
+    assert s.status(now=START + 10)['n']['interval_seconds'] == 15.0
+
+def test_failures_back_off_exponentially_up_to_the_cap():
+    s = scheduler()
+    s.due('n', now=START)
+    s.record_failure('n', 'timeout', now=START)
+    status = s.status(now=START)['n']
+    assert (status['state'], status['failures'], status['next_scrape_in']) == (CLOSED, 1, 2 * BASE)
+    s.record_failure('n', 'timeout', now=START)
+    assert s.status(now=START)['n']['next_scrape_in'] == 4 * BASE
+
+    s = NodeScheduler(40.0, rng=UpperBound())
+    s.record_failure('n', 'timeout', now=START)
+    assert s.status(now=START)['n']['next_scrape_in'] == MAX_BACKOFF_SECONDS
+
+def test_circuit_opens_probes_and_closes_on_success():
+    s = scheduler()
+    now = START
+    for _ in range(FAILURE_THRESHOLD):
+        s.due('n', now=now)
+        s.record_failure('n', 'refused', now=now)
+    status = s.status(now=now)['n']
+    assert status['state'] == OPEN and status['next_scrape_in'] == BREAKER_OPEN_SECONDS
+    assert s.due('n', now=now + 1) is None
+
+    now += BREAKER_OPEN_SECONDS
+    assert s.due('n', now=now) == ('probe', 0.0)
+    assert s.status(now=now)['n']['state'] == HALF_OPEN
+    assert s.due('n', now=now + 1) is None # One probe at a time
+
+    s.record_success('n', duration=0.1, payload_bytes=0, now=now)
+    status = s.status(now=now)['n']
+    assert (status['state'], status['failures'], status['last_error']) == (CLOSED, 0, None)
+    assert s.due('n', now=now + BASE)[0] == 'scrape'
+
+def test_failed_probes_double_the_open_period_up_to_the_cap():
+    s = scheduler()
+    now = START
+    for _ in range(FAILURE_THRESHOLD):
+        s.record_failure('n', 'refused', now=now)
+    open_seconds = BREAKER_OPEN_SECONDS
+    while open_seconds < BREAKER_MAX_OPEN_SECONDS:
+        now += open_seconds
+        assert s.due('n', now=now) == ('probe', 0.0)
+        s.record_failure('n', 'refused', now=now)
+        open_seconds = min(open_seconds * 2, BREAKER_MAX_OPEN_SECONDS)
+        status = s.status(now=now)['n']
+        assert status['state'] == OPEN and status['next_scrape_in'] == open_seconds
+    # A success resets the open period for the next time the circuit opens
+    now += open_seconds
+    s.due('n', now=now)
+    s.record_success('n', duration=0.1, payload_bytes=0, now=now)
+    for _ in range(FAILURE_THRESHOLD):
+        s.record_failure('n', 'refused', now=now)
+    assert s.status(now=now)['n']['next_scrape_in'] == BREAKER_OPEN_SECONDS
+
+def test_large_payloads_get_a_start_delay():
+    s = scheduler()
+    s.due('n', now=START)
+    s.record_success('n', duration=0.1, payload_bytes=64 * 1024 * 1024, now=START)
+    mode, delay = s.due('n', now=START + BASE)
+    assert mode == 'scrape' and delay == pytest.approx(JITTER_FRACTION * BASE)
+
+def test_forget_drops_nodes_that_are_gone():
+    s = scheduler()
+    s.due('a', now=START)
+    s.due('b', now=START)
+    s.forget({'b'})
+    assert list(s.status(now=START)) == ['b']
+
+def test_nodes_endpoint_shows_scrape_state_and_data_age(collector, client):
+    collector.add_pod('node1', 'open5gs-amf-0')
+    collector.cycle()
+    node = client.get('/nodes').get_json()['node1']
+    assert (node['state'], node['failures'], node['last_error']) == (CLOSED, 0, None)
+    assert 95 < node['data_age_seconds'] < 120 # The fake samples start 100 s ago
+    collector.cadvisor.down = True
+    collector.cycle()
+    node = client.get('/nodes').get_json()['node1']
+    assert node['failures'] == 1 and 'connection refused' in node['last_error']
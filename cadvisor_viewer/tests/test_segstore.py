@@ -0,0 +1,70 @@
+import os
+
+from segstore import Segment, SegmentStore
+
+
+def stored(store, container_id, start=None, end=None):
+    rows = []
+    for timestamps, cpu, mem in store.range(container_id, start, end):
+        rows += zip(timestamps.tolist(), cpu.tolist(), mem.tolist())
+    return rows
+
+def test_append_rolls_over_segments_and_range_reads_across_them(tmp_path):
+    store = SegmentStore(str(tmp_path), retention_seconds=3600, segment_capacity=4)
+    for t in range(10):
+        store.append('c1', 100.0 + t, float(t), 2.0 * t)
+    store.flush()
+    assert len(store._segment_paths('c1')) == 3
+    assert [row[0] for row in stored(store, 'c1')] == [100.0 + t for t in range(10)]
+    assert stored(store, 'c1', 103.0, 105.0) == [(103.0, 3.0, 6.0), (104.0, 4.0, 8.0), (105.0, 5.0, 10.0)]
+    assert stored(store, 'c1', 200.0) == []
+    store.close()
+
+def test_missing_values_read_back_as_nan(tmp_path):
+    store = SegmentStore(str(tmp_path), retention_seconds=3600)
+    store.append('c1', 1.0, None, 5.0)
+    (ts, cpu, mem), = stored(store, 'c1')
+    assert cpu != cpu and mem == 5.0
+    store.close()
+
+def test_writer_reopens_a_partly_filled_segment(tmp_path):
+    store = SegmentStore(str(tmp_path), retention_seconds=3600, segment_capacity=4)
+    store.append('c1', 1.0, 1, 1)
+    store.close()
+    store = SegmentStore(str(tmp_path), retention_seconds=3600, segment_capacity=4)
+    store.append('c1', 2.0, 2, 2)
+    assert len(store._segment_paths('c1')) == 1
+    assert [row[0] for row in stored(store, 'c1')] == [1.0, 2.0]
+    store.close()
+
+def test_retention_removes_old_segments_but_not_the_active_one(tmp_path):
+    store = SegmentStore(str(tmp_path), retention_seconds=100, segment_capacity=2)
+    for t in (0.0, 1.0, 2.0, 3.0, 500.0):
+        store.append('c1', t, 1, 1)
+    store.flush()
+    assert store.enforce_retention(now=550.0) == 2
+    assert [row[0] for row in stored(store, 'c1')] == [500.0]
+    # The active segment is old too, but stays while it is being written
+    assert store.enforce_retention(now=10000.0) == 0
+    assert store.containers() == ['c1']
+    store.close()
+
+def test_retention_removes_the_directory_of_a_finished_container(tmp_path):
+    store = SegmentStore(str(tmp_path), retention_seconds=100, segment_capacity=2)
+    store.write_meta('c1', {'pod_name': 'amf'})
+    store.append('c1', 0.0, 1, 1)
+    store.close_writer('c1')
+    assert store.read_meta('c1') == {'pod_name': 'amf'}
+    assert store.enforce_retention(now=1000.0) == 1
+    assert store.containers() == []
+    assert not os.path.exists(os.path.join(str(tmp_path), 'c1'))
+
+def test_segment_rejects_foreign_files(tmp_path):
+    path = tmp_path / 'x.seg'
+    path.write_bytes(b'not a segment' + bytes(100))
+    try:
+        Segment(str(path))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
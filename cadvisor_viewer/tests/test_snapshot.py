@@ -0,0 +1,35 @@
+import copy
+import json
+
+
+def test_requests_are_served_from_the_published_snapshot(collector, client):
+    collector.add_pod('node1', 'open5gs-amf-0')
+    collector.cycle()
+    body = client.get('/metrics').data
+    # Scraped but not yet published: readers keep getting the last snapshot
+    collector.scrape()
+    assert client.get('/metrics').data == body
+    collector.app.publish_snapshot(dict(collector.pods))
+    assert client.get('/metrics').data != body
+
+def test_published_snapshots_are_never_modified(collector):
+    amf = collector.add_pod('node1', 'open5gs-amf-0')
+    snapshot = collector.cycle()
+    payload = copy.deepcopy(snapshot.payload)
+    body = snapshot.body
+    newer = collector.cycle()
+    assert snapshot.payload == payload and snapshot.body == body
+    assert json.loads(body) == payload
+    assert newer.version == snapshot.version + 1
+    assert len(newer.payload['node1'][amf]['timestamps']) == len(payload['node1'][amf]['timestamps']) + 3
+
+def test_snapshot_drops_containers_that_are_gone(collector, client):
+    amf = collector.add_pod('node1', 'open5gs-amf-0')
+    smf = collector.add_pod('node1', 'open5gs-smf-0')
+    collector.cycle()
+    collector.remove_pod(amf)
+    collector.cycle()
+    assert list(client.get('/metrics').get_json()['node1']) == [smf]
+    collector.remove_pod(smf)
+    collector.cycle()
+    assert client.get('/metrics').get_json() == {}
@@ -0,0 +1,54 @@
+import json
+
+from pubsub import SUBSCRIBER_QUEUE_SIZE, Broadcaster, filter_batch
+
+
+def nf_of(pod_name):
+    return pod_name.split('-')[0]
+
+BATCH = {
+    'node1': {'a': {'pod_name': 'amf-0'}, 'b': {'pod_name': 'smf-0'}},
+    'node2': {'c': {'pod_name': 'amf-1'}},
+}
+
+
+def test_filter_batch_by_node_and_network_function():
+    assert filter_batch(BATCH, {'node1'}, None, nf_of) == {'node1': BATCH['node1']}
+    assert filter_batch(BATCH, None, {'amf'}, nf_of) == {'node1': {'a': BATCH['node1']['a']}, 'node2': BATCH['node2']}
+    assert filter_batch(BATCH, {'node2'}, {'smf'}, nf_of) == {}
+
+def test_publish_serializes_once_per_filter_and_drops_slow_subscribers():
+    broadcaster = Broadcaster(nf_of)
+    everything = broadcaster.subscribe()
+    amf = broadcaster.subscribe(nfs={'amf'})
+    broadcaster.publish(BATCH)
+    assert json.loads(everything.get(timeout=0)) == BATCH
+    assert set(json.loads(amf.get(timeout=0))) == {'node1', 'node2'}
+    for _ in range(SUBSCRIBER_QUEUE_SIZE + 1):
+        broadcaster.publish(BATCH)
+    assert everything.closed and broadcaster.subscriber_count() == 0
+
+def events(response):
+    """Yields the SSE events of a streamed response as {field: value} dicts."""
+    for chunk in response.response:
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        for event in chunk.strip().split('\n\n'):
+            yield dict(line.split(': ', 1) for line in event.split('\n'))
+
+def test_stream_sends_the_snapshot_then_each_cycles_new_samples(collector, client):
+    amf = collector.add_pod('node1', 'open5gs-amf-0')
+    collector.add_pod('node1', 'open5gs-smf-0')
+    collector.cycle()
+    response = client.get('/stream?nf=amf', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    stream = events(response)
+    first = next(stream)
+    assert first['event'] == 'snapshot'
+    assert list(json.loads(first['data'])['node1']) == [amf]
+
+    collector.cycle(seconds=2)
+    delta = json.loads(next(stream)['data'])
+    assert list(delta['node1']) == [amf]
+    assert len(delta['node1'][amf]['timestamps']) == 2
+    response.close()
+    assert collector.app.broadcaster.subscriber_count() == 0
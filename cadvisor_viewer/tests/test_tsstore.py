@@ -0,0 +1,52 @@
+from tsstore import ContainerSeries, RollupTier, SeriesRing
+
+
+def test_ring_wraps_around_keeping_the_newest_rows():
+    ring = SeriesRing(4, ('v',))
+    for t in range(10):
+        ring.append(float(t), t * 10)
+    assert len(ring) == 4
+    assert [row[0] for row in ring] == [6.0, 7.0, 8.0, 9.0]
+    assert ring.row(0) == (6.0, 60.0)
+    assert ring.row(-1) == (9.0, 90.0)
+    assert ring.last_timestamp() == 9.0
+
+def test_ring_query_since_and_limit_across_the_wrap():
+    ring = SeriesRing(5, ('v',))
+    for t in range(8): # rows 3..7 kept, stored across the end of the arrays
+        ring.append(float(t), t)
+    timestamps, values = ring.query(since=4.5)
+    assert timestamps == [5.0, 6.0, 7.0]
+    assert values['v'] == [5.0, 6.0, 7.0]
+    assert ring.query(limit=2)[0] == [6.0, 7.0]
+    assert ring.query(since=100) == ([], {'v': []})
+
+def test_ring_stores_none_as_nan_and_returns_none():
+    ring = SeriesRing(3, ('a', 'b'))
+    ring.append(1.0, None, 2)
+    ring.append(2.0, 3) # Missing trailing value
+    assert ring.query()[1] == {'a': [None, 3.0], 'b': [2.0, None]}
+
+def test_rollup_buckets_min_avg_max_and_open_bucket():
+    tier = RollupTier(60, 10, ('v',))
+    for t, v in [(0, 1), (30, 3), (59, 2), (60, 10), (90, None), (125, 4)]:
+        tier.add(t, [v])
+    timestamps, values = tier.query()
+    assert timestamps == [0.0, 60.0, 120.0] # The last one is the still-open bucket
+    assert values['v_min'] == [1.0, 10.0, 4.0]
+    assert values['v_avg'] == [2.0, 10.0, 4.0]
+    assert values['v_max'] == [3.0, 10.0, 4.0]
+    assert tier.query(since=60)[0] == [60.0, 120.0]
+    assert tier.query(limit=1)[0] == [120.0]
+
+def test_container_series_ignores_samples_not_newer_than_the_last():
+    series = ContainerSeries(raw_capacity=10, tiers=(("1m", 60, 10),))
+    assert series.append(10.0, 100, 50)
+    assert series.append(13.0, 200, 60)
+    assert not series.append(13.0, 999, 999)
+    assert not series.append(7.0, 999, 999)
+    timestamps, values = series.query()
+    assert timestamps == [10.0, 13.0]
+    assert values['cpu_mcore'] == [100.0, 200.0]
+    assert series.query("1m")[1]['cpu_mcore_max'] == [200.0]
+    assert series.last_good_memory == 60
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compact in-memory time-series store for the cAdvisor viewer.
+Each series is a fixed-capacity ring buffer with one preallocated numeric
+array per column, plus downsampled min/avg/max rollup tiers. The arrays are
+allocated up front: about 50 KB per container for CPU and memory alone and
+about 170 KB with the default extra metrics (ContainerSeries.nbytes()), so
+a few hundred containers take tens of MB.
+"""
+
+import math
+from array import array
+
+NaN = float('nan')
+
+# Rollup tiers: (name, bucket width in seconds, number of buckets kept)
+ROLLUP_TIERS = (
+    ("1m", 60, 12 * 60),    # 12 hours of 1-minute buckets
+    ("10m", 600, 2 * 144),  # 2 days of 10-minute buckets
+)
+# Number of raw samples kept per container (1 hour at a 3 s interval)
+RAW_CAPACITY = 1200
+
+
+class SeriesRing:
+    """
+    Fixed-capacity ring buffer of (timestamp, value, ...) rows stored as
+    one preallocated array per column. Missing float values are NaN.
+    """
+
+    __slots__ = ('capacity', 'fields', 'timestamps', 'columns', 'start', 'size')
+
+    def __init__(self, capacity, fields, ts_typecode='d', value_typecode='f'):
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self.timestamps = array(ts_typecode, bytes(array(ts_typecode).itemsize * capacity))
+        self.columns = {f: array(value_typecode, bytes(array(value_typecode).itemsize * capacity)) for f in self.fields}
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, timestamp, *values):
+        """Appends one row, overwriting the oldest row once full. None is stored as NaN."""
+        if self.size < self.capacity:
+            idx = (self.start + self.size) % self.capacity
+            self.size += 1
+        else:
+            idx = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.timestamps[idx] = timestamp
+        for i, field in enumerate(self.fields):
+            value = values[i] if i < len(values) else None
+            self.columns[field][idx] = NaN if value is None else value
+
+    def _index(self, i):
+        return (self.start + i) % self.capacity
+
+    def row(self, i):
+        """Returns row i (0 = oldest, -1 = newest) as (timestamp, value, ...)."""
+        if i < 0: i += self.size
+        if not 0 <= i < self.size: raise IndexError(i)
+        idx = self._index(i)
+        return (self.timestamps[idx],) + tuple(self.columns[f][idx] for f in self.fields)
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self.row(i)
+
+    def last_timestamp(self):
+        return self.timestamps[self._index(self.size - 1)] if self.size else None
+
+    def _first_at_or_after(self, since):
+        """Binary search over the (chronological) ring for the first row with timestamp >= since."""
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamps[self._index(mid)] < since: lo = mid + 1
+            else: hi = mid
+        return lo
+
+    def _slice(self, col, first):
+        """Chronological copy of col[first:] as a list (at most two array slices)."""
+        n = self.size - first
+        begin = self._index(first)
+        if begin + n <= self.capacity:
+            return col[begin:begin + n].tolist()
+        return col[begin:].tolist() + col[:begin + n - self.capacity].tolist()
+
+    def query(self, since=None, limit=None):
+        """
+        Returns (timestamps, {field: values}) in chronological order, optionally
+        restricted to timestamps >= since and/or to the newest `limit` rows.
+        NaN values are returned as None.
+        """
+        first = 0 if since is None else self._first_at_or_after(since)
+        if limit is not None: first = max(first, self.size - limit)
+        if first >= self.size:
+            return [], {f: [] for f in self.fields}
+        timestamps = self._slice(self.timestamps, first)
+        values = {}
+        for field in self.fields:
+            values[field] = [None if v != v else v for v in self._slice(self.columns[field], first)]
+        return timestamps, values
+
+    def nbytes(self):
+        return self.timestamps.itemsize * self.capacity + sum(c.itemsize * self.capacity for c in self.columns.values())
+
+
+class RollupTier:
+    """Downsamples appended samples into fixed-width buckets holding min/avg/max per field."""
+
+    __slots__ = ('bucket_seconds', 'fields', 'ring', 'bucket_start', 'count', 'sums', 'mins', 'maxs')
+
+    def __init__(self, bucket_seconds, capacity, fields):
+        self.bucket_seconds = bucket_seconds
+        self.fields = tuple(fields)
+        rollup_fields = [f"{f}_{agg}" for f in self.fields for agg in ('min', 'avg', 'max')]
+        self.ring = SeriesRing(capacity, rollup_fields)
+        self.bucket_start = None
+        self._reset()
+
+    def _reset(self):
+        n = len(self.fields)
+        self.count = [0] * n
+        self.sums = [0.0] * n
+        self.mins = [math.inf] * n
+        self.maxs = [-math.inf] * n
+
+    def _flush(self):
+        row = []
+        for i in range(len(self.fields)):
+            if self.count[i]:
+                row += [self.mins[i], self.sums[i] / self.count[i], self.maxs[i]]
+            else:
+                row += [None, None, None]
+        self.ring.append(self.bucket_start, *row)
+        self._reset()
+
+    def add(self, timestamp, values):
+        bucket_start = timestamp - (timestamp % self.bucket_seconds)
+        if self.bucket_start is not None and bucket_start != self.bucket_start:
+            self._flush()
+        self.bucket_start = bucket_start
+        for i, value in enumerate(values):
+            if value is None or value != value: continue
+            self.count[i] += 1
+            self.sums[i] += value
+            if value < self.mins[i]: self.mins[i] = value
+            if value > self.maxs[i]: self.maxs[i] = value
+
+    def query(self, since=None, limit=None):
+        """Closed buckets plus the still-open one, in the SeriesRing.query() format."""
+        timestamps, values = self.ring.query(since, limit)
+        if self.bucket_start is not None and any(self.count) and (since is None or self.bucket_start >= since):
+            timestamps.append(float(self.bucket_start))
+            for i, field in enumerate(self.fields):
+                has = self.count[i] > 0
+                values[f"{field}_min"].append(self.mins[i] if has else None)
+                values[f"{field}_avg"].append(self.sums[i] / self.count[i] if has else None)
+                values[f"{field}_max"].append(self.maxs[i] if has else None)
+            if limit is not None and len(timestamps) > limit:
+                timestamps = timestamps[-limit:]
+                values = {k: v[-limit:] for k, v in values.items()}
+        return timestamps, values
+
+
+class ContainerSeries:
+    """
+    Calculated samples of one container: raw ring, rollup tiers and last good
+    memory value. The first two fields are always cpu_mcore and memory_mib;
+    extra fields (e.g. extracted counter rates) may follow.
+    """
+
+    FIELDS = ('cpu_mcore', 'memory_mib')
+
+    __slots__ = ('fields', 'raw', 'tiers', 'last_good_memory')
+
+    def __init__(self, raw_capacity=RAW_CAPACITY, tiers=ROLLUP_TIERS, fields=FIELDS):
+        self.fields = tuple(fields)
+        self.raw = SeriesRing(raw_capacity, self.fields)
+        self.tiers = {name: RollupTier(seconds, capacity, self.fields) for name, seconds, capacity in tiers}
+        self.last_good_memory = None
+
+    def __len__(self):
+        return len(self.raw)
+
+    def append(self, timestamp, cpu_mcore, memory_mib, *extra):
+        """
+        Appends one sample; missing extra values are stored as None. Samples
+        not newer than the last one are ignored (returns False), so the ring
+        and the rollups stay sorted.
+        """
+        if self.raw.size and timestamp <= self.raw.last_timestamp():
+            return False
+        values = (cpu_mcore, memory_mib) + extra
+        self.raw.append(timestamp, *values)
+        if len(values) < len(self.fields):
+            values += (None,) * (len(self.fields) - len(values))
+        for tier in self.tiers.values():
+            tier.add(timestamp, values)
+        if memory_mib is not None and memory_mib > 0.01:
+            self.last_good_memory = memory_mib
+        return True
+
+    def prepend(self, older):
+        """
+        Puts the samples of older (a series of the same layout) in front of
+        this one's, in place, so holders of this series see them too. Our
+        samples not newer than the last of older are dropped; older is consumed.
+        """
+        for row in self.raw:
+            older.append(*row)
+        self.raw, self.tiers, self.last_good_memory = older.raw, older.tiers, older.last_good_memory
+
+    def query(self, resolution="raw", since=None, limit=None):
+        """Returns (timestamps, {field: values}) for 'raw' or one of the rollup tier names."""
+        if resolution == "raw":
+            return self.raw.query(since, limit)
+        return self.tiers[resolution].query(since, limit)
+
+    def nbytes(self):
+        return self.raw.nbytes() + sum(t.ring.nbytes() for t in self.tiers.values())
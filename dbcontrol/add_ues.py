@@ -1,79 +1,507 @@
 #!/usr/bin/env python3
+"""
+Bulk loader for the 'open5gs.subscribers' MongoDB collection.
+
+Streams subscriber documents from a file or stdin (YAML as written by
+create_ues.py, JSON Lines or raw BSON), or straight from the generator
+(--generate), and inserts them in unordered batches over several concurrent
+connections. Prints live docs/s. With --checkpoint, progress is saved after
+every batch so a failed or interrupted load resumes where it stopped.
+
+Examples:
+  ./add_ues.py                                         # subscribers.yaml, as before
+  ./add_ues.py --input subscribers.jsonl --workers 8 --batch-size 2000
+  ./add_ues.py --generate 1000000 --checkpoint load.ckpt --write-concern 1
+  ./create_ues.py --count 1000000 --output - --format bson | ./add_ues.py --input - --format bson
+"""
 import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import struct
 import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from ruamel.yaml import YAML
-from pymongo import MongoClient
- 
-from utils import get_mongodb_ip
+import bson
+from pymongo import DeleteMany, InsertOne, ReplaceOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+from pymongo.write_concern import WriteConcern
+from bson import decode_file_iter
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+from utils import get_client
+from create_ues import (CREDENTIAL_SLOTS, TemplateEncoder, add_credential_arguments, credential_options, format_of,
+                        iter_encoded)
+
+# MongoDB duplicate key error; such documents are already loaded (e.g. when resuming)
+DUPLICATE_KEY = 11000
+# Start of a top-level YAML key: the boundary between two subscriber blocks
+TOP_LEVEL_KEY = re.compile(rb"\n(?=[^\s#-])")
+READ_CHUNK_BYTES = 1024 * 1024
+# Field holding a subscriber's content hash (sync mode)
+SYNC_HASH_FIELD = "_sync_hash"
+# Marker of the top-level imsi string element in raw BSON
+IMSI_ELEMENT = b"\x02imsi\x00"
+# IMSIs per DeleteMany in sync mode
+DELETE_BATCH = 1000
+# Seconds between progress lines
+PROGRESS_INTERVAL = 2.0
+
+
+class YamlTemplateMatcher:
+    """
+    Recognizes subscriber blocks exactly as create_ues.py writes them and
+    re-encodes them as raw BSON from the pre-encoded template, skipping YAML
+    parsing (over 1 ms per subscriber). Returns None for any other block.
+    """
+
+    def __init__(self, slots=("imsi",)):
+        # The YAML pieces do not depend on the slot widths; the BSON ones do
+        self.yaml = TemplateEncoder("yaml", {name: 15 for name in slots})
+        self.bson = {} # {((slot, width), ...): TemplateEncoder}
+
+    def match(self, block):
+        pieces = self.yaml.pieces
+        if not block.startswith(pieces[0]):
+            return None
+        position = len(pieces[0])
+        values = {}
+        for name, piece in zip(self.yaml.order, pieces[1:]):
+            end = block.find(piece, position)
+            if end < 0:
+                return None
+            value = block[position:end]
+            if name != "index":
+                if len(value) < 2 or value[:1] != b"'" or value[-1:] != b"'":
+                    return None
+                values[name] = value[1:-1].decode()
+            position = end + len(piece)
+        if position != len(block):
+            return None
+        widths = tuple((name, len(value)) for name, value in sorted(values.items()))
+        encoder = self.bson.get(widths)
+        if encoder is None:
+            encoder = self.bson[widths] = TemplateEncoder("bson", dict(widths))
+        return RawBSONDocument(encoder.encode(0, values))
+
+def iter_yaml_documents(stream, skip=0):
+    """
+    Yields the subscribers of a YAML file laid out like create_ues.py writes
+    it (a top-level mapping of 'subscriber_N:' blocks), one block at a time,
+    so the file is never held in memory. Blocks that match the generator's
+    template are converted directly; others are parsed as YAML. The first
+    skip blocks are dropped unparsed.
+    """
+    yaml = YAML(typ="safe")
+    # Files written with and without --credentials; the last matching one is tried first
+    matchers = [YamlTemplateMatcher(), YamlTemplateMatcher(("imsi", *CREDENTIAL_SLOTS))]
+    def load(block):
+        for i, matcher in enumerate(matchers):
+            doc = matcher.match(block)
+            if doc is not None:
+                if i:
+                    matchers.insert(0, matchers.pop(i))
+                return doc
+        loaded = yaml.load(block.decode("utf-8"))
+        return next(iter(loaded.values())) if isinstance(loaded, dict) and loaded else None
+    rest = b""
+    for chunk in iter(lambda: stream.read(READ_CHUNK_BYTES), b""):
+        # Blocks end where a line starts with a top-level key; the last one may continue in the next chunk
+        blocks = TOP_LEVEL_KEY.split(rest + chunk)
+        rest = blocks.pop()
+        if skip:
+            dropped = min(skip, len(blocks))
+            del blocks[:dropped]
+            skip -= dropped
+        for block in blocks:
+            doc = load(block + b"\n")
+            if doc is not None: yield doc
+    if rest.strip() and not skip:
+        doc = load(rest)
+        if doc is not None: yield doc
+
+def iter_input(path, fmt, skip=0):
+    """Yields the documents of an input file ('-' for stdin), after skipping the first skip of them."""
+    binary = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        if fmt == "bson":
+            # Raw documents are sent to the server as they are, without decoding
+            docs = decode_file_iter(binary, CodecOptions(document_class=RawBSONDocument))
+        elif fmt == "jsonl":
+            lines = itertools.islice(binary, skip, None) # Skipped lines are not parsed
+            skip = 0
+            docs = (json.loads(line) for line in lines if line.strip())
+        else:
+            docs = iter_yaml_documents(binary, skip)
+            skip = 0
+        yield from itertools.islice(docs, skip, None)
+    finally:
+        if binary is not sys.stdin.buffer:
+            binary.close()
+
+def iter_generated(count, imsi_start, skip=0, credentials=None):
+    """Yields count generated subscribers (create_ues.py) as raw BSON, starting skip IMSIs in."""
+    first = str(int(imsi_start) + skip).zfill(len(imsi_start))
+    for encoded in iter_encoded("bson", max(0, count - skip), first, credentials):
+        yield RawBSONDocument(encoded)
 
-def feed_subscribers_minimal(yaml_file, mongo_uri):
+def batches(items, size):
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Checkpoint:
     """
-    Reads subscribers from a YAML file and inserts them directly into
-    the 'open5gs.subscribers' MongoDB collection. No checks or skipping logic.
+    Number of leading input documents that are known to be stored. Batches
+    finish out of order, so the position only advances over a contiguous
+    run of finished batches. Saved atomically as JSON.
     """
-    yaml = YAML()
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+        self.position = 0
+        self.inserted = 0
+        self._finished = {} # {batch start: batch length} finished beyond position
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get("source") != source:
+                raise ValueError(f"checkpoint {path} is for {saved.get('source')}, not {source}")
+            self.position = saved["position"]
+            self.inserted = saved.get("inserted", 0)
+
+    def finish(self, start, length):
+        self._finished[start] = length
+        while self.position in self._finished:
+            self.position += self._finished.pop(self.position)
+        self.save()
+
+    def save(self, done=False):
+        if not self.path: return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(dict(source=self.source, position=self.position, inserted=self.inserted, done=done), f)
+        os.replace(tmp, self.path)
+
+
+def insert_batch(collection, batch):
+    """Inserts one batch unordered. Returns its counts; raises on write errors other than duplicate keys."""
     try:
-        with open(yaml_file, "r") as f:
-            all_subscribers = yaml.load(f)
-    except Exception as e:
-        print(f"[ERROR] Failed to read {yaml_file}: {e}")
+        # inserted_ids is not filled for raw BSON documents, whose _id the server assigns
+        collection.insert_many(batch, ordered=False)
+        return {"inserted": len(batch)}
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        others = [err for err in errors if err.get("code") != DUPLICATE_KEY]
+        if others or e.details.get("writeConcernErrors"):
+            raise
+        return {"inserted": e.details.get("nInserted", 0), "already present": len(errors)}
+
+def write_batches(items, collection, write, checkpoint, batch_size, workers):
+    """
+    Applies write(collection, batch) to batches of items on workers threads,
+    keeping at most 2 * workers batches in flight, and prints live progress.
+    Returns the summed counts of all batches; on a failed batch, waits for
+    the others, saves the checkpoint and re-raises.
+    """
+    counts = Counter()
+    started = last_report = time.time()
+    position = checkpoint.position
+    failure = None
+
+    def report(final=False):
+        elapsed = max(time.time() - started, 1e-9)
+        total = sum(counts.values())
+        details = ", ".join(f"{n} {name}" for name, n in counts.items())
+        print(f"[INFO] {total} docs written ({details}), {total / elapsed:,.0f} docs/s",
+              end="\n" if final else "\r", flush=True)
+
+    def collect(future):
+        nonlocal failure
+        start, length = pending.pop(future)
+        try:
+            batch_counts = future.result()
+        except PyMongoError as e:
+            failure = failure or e
+            return
+        counts.update(batch_counts)
+        checkpoint.inserted += batch_counts.get("inserted", 0)
+        checkpoint.finish(start, length)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="write") as pool:
+        pending = {} # {future: (input position of the batch, batch length)}
+        for batch in batches(items, batch_size):
+            while len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+            if failure is not None:
+                break
+            pending[pool.submit(write, collection, batch)] = (position, len(batch))
+            position += len(batch)
+            if time.time() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.time()
+                report()
+        for future in list(pending):
+            collect(future)
+
+    report(final=True)
+    if failure is not None:
+        raise failure
+    checkpoint.save(done=True)
+    return counts
+
+
+# --- Sync mode ---
+
+def ensure_imsi_index(collection, dedupe):
+    """
+    Creates the unique index on imsi, unless one exists already (the WebUI
+    creates 'imsi_1'). With dedupe, extra documents of an IMSI that is
+    stored more than once (earlier blind reruns) are deleted first, keeping
+    the oldest. Returns the number of deleted duplicates.
+    """
+    if any(index.get("unique") and list(index["key"]) == [("imsi", 1)]
+           for index in collection.index_information().values()):
+        return 0
+    deleted = 0
+    if dedupe:
+        pipeline = [{"$group": {"_id": "$imsi", "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+                    {"$match": {"n": {"$gt": 1}}}]
+        for group in collection.aggregate(pipeline, allowDiskUse=True):
+            extra = sorted(group["ids"])[1:]
+            deleted += collection.delete_many({"_id": {"$in": extra}}).deleted_count
+    # Default name (imsi_1), the same as the WebUI's index
+    collection.create_index("imsi", unique=True)
+    return deleted
+
+def content_hash(doc):
+    """
+    Returns (hash, raw BSON without _id) of a subscriber document. Raw
+    documents without _id are hashed as they are, without decoding.
+    """
+    if isinstance(doc, RawBSONDocument) and doc.raw[5:9] != b"_id\x00":
+        raw = doc.raw
+    else:
+        plain = dict(bson.decode(doc.raw) if isinstance(doc, RawBSONDocument) else doc)
+        plain.pop("_id", None)
+        plain.pop(SYNC_HASH_FIELD, None)
+        raw = bson.encode(plain)
+    return hashlib.blake2b(raw, digest_size=16).hexdigest(), raw
+
+def raw_imsi(raw):
+    """The imsi string of a raw BSON subscriber, read without decoding the document (None if absent)."""
+    at = raw.find(IMSI_ELEMENT)
+    if at < 0:
+        return None
+    start = at + len(IMSI_ELEMENT) + 4
+    return raw[start:start + struct.unpack_from("<i", raw, start - 4)[0] - 1].decode()
+
+def with_hash(raw, digest):
+    """Appends the SYNC_HASH_FIELD string element to a raw BSON document (see content_hash)."""
+    value = digest.encode() + b"\x00"
+    element = b"\x02" + SYNC_HASH_FIELD.encode() + b"\x00" + struct.pack("<i", len(value)) + value
+    body = raw[4:-1] + element
+    return RawBSONDocument(struct.pack("<i", len(body) + 5) + body + b"\x00")
+
+def hashed(doc):
+    """The document as raw BSON without _id (Mongo assigns new object IDs) and with its content hash."""
+    digest, raw = content_hash(doc)
+    return with_hash(raw, digest)
+
+def stored_hashes(collection):
+    """{imsi: stored content hash or None} of every subscriber, read through a projection."""
+    cursor = collection.find({}, {"_id": 0, "imsi": 1, SYNC_HASH_FIELD: 1}, batch_size=10000)
+    return {doc.get("imsi"): doc.get(SYNC_HASH_FIELD) for doc in cursor}
+
+def sync_operations(docs, existing, counts, delete=True):
+    """
+    Yields the bulk operations that turn the collection into docs: inserts of
+    new IMSIs, replacements of documents whose content hash differs, then
+    deletes of stored IMSIs not in docs. existing ({imsi: hash}) is consumed;
+    counts gets 'unchanged' and 'duplicate input' tallies.
+    """
+    seen = set()
+    for doc in docs:
+        digest, raw = content_hash(doc)
+        imsi = raw_imsi(raw)
+        if imsi in seen:
+            counts["duplicate input"] += 1
+            continue
+        seen.add(imsi)
+        if imsi not in existing:
+            yield InsertOne(with_hash(raw, digest))
+        elif existing.pop(imsi) != digest:
+            yield ReplaceOne({"imsi": imsi}, with_hash(raw, digest))
+        else:
+            counts["unchanged"] += 1
+    if delete:
+        stale = list(existing)
+        existing.clear()
+        for i in range(0, len(stale), DELETE_BATCH):
+            yield DeleteMany({"imsi": {"$in": stale[i:i + DELETE_BATCH]}})
+
+def bulk_batch(collection, operations):
+    """Applies one batch of sync operations unordered. Returns its counts."""
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        if e.details.get("writeErrors") or e.details.get("writeConcernErrors"):
+            raise
+        result = None
+    if result is None or not result.acknowledged:
+        return {"operations": len(operations)}
+    return {"inserted": result.inserted_count, "updated": result.modified_count, "deleted": result.deleted_count}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Bulk loader: streams subscribers into open5gs.subscribers in concurrent, unordered batches."
+    )
+    parser.add_argument("--input", "--yaml-file", dest="input", default="subscribers.yaml",
+                        help="Subscriber file (YAML, JSON Lines or BSON), or '-' for stdin.")
+    parser.add_argument("--format", choices=("yaml", "jsonl", "bson"),
+                        help="Input format (default: from the file extension, else yaml).")
+    parser.add_argument("--generate", type=int, metavar="COUNT",
+                        help="Insert COUNT generated subscribers instead of reading a file.")
+    parser.add_argument("--imsi-start", default="208930000000001", help="First IMSI for --generate.")
+    add_credential_arguments(parser)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents per insert_many call.")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent insert connections.")
+    parser.add_argument("--write-concern", default="1",
+                        help="Write concern 'w': a number of nodes, or 'majority'. 0 does not wait for acknowledgement.")
+    parser.add_argument("--journal", action="store_true", help="Wait for the journal commit of every batch.")
+    parser.add_argument("--checkpoint", help="Progress file; an existing one resumes the load.")
+    parser.add_argument("--sync", action="store_true",
+                        help="Make the collection match the input: insert new IMSIs, replace changed subscribers "
+                             "and delete IMSIs not in the input; unchanged subscribers are not written.")
+    parser.add_argument("--keep-missing", action="store_true", help="With --sync, do not delete IMSIs missing from the input.")
+    parser.add_argument("--dry-run", action="store_true", help="With --sync, only count the changes.")
+    parser.add_argument("--mongo-uri", help="MongoDB URI (default: the MongoDB pod, or Service, in namespace open5gs).")
+    args = parser.parse_args(argv)
+
+    write_concern = int(args.write_concern) if args.write_concern.isdigit() else args.write_concern
+    if write_concern == 0 and args.checkpoint:
+        print("[ERROR] --checkpoint needs acknowledged writes (--write-concern 1 or higher).")
+        sys.exit(1)
+    if args.sync and args.checkpoint:
+        print("[ERROR] --sync is idempotent and needs no --checkpoint; rerun it to resume.")
         sys.exit(1)
+    credentials = None
+    if args.credentials:
+        if args.generate is None:
+            print("[ERROR] --credentials only applies to --generate; use create_ues.py --credentials for files.")
+            sys.exit(1)
+        try:
+            credentials = credential_options(args.seed, args.op, args.credential_workers)
+        except (ValueError, RuntimeError) as e:
+            print(f"[ERROR] {e}")
+            sys.exit(1)
+    if args.generate is not None:
+        source = f"generate:{args.generate}:{args.imsi_start}"
+        if credentials:
+            source += f":credentials:{args.seed}:{args.op.upper()}"
+    else:
+        fmt = format_of(args.input, args.format)
+        source = f"{fmt}:{os.path.abspath(args.input) if args.input != '-' else '-'}"
 
-    # all_subscribers should be a dictionary, e.g.:
-    # {
-    #   "subscriber_1": { ... },
-    #   "subscriber_2": { ... },
-    #   ...
-    # }
-    if not all_subscribers or not isinstance(all_subscribers, dict):
-        print(f"[ERROR] {yaml_file} did not load a valid top-level dict.")
+    try:
+        checkpoint = Checkpoint(args.checkpoint, source)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[ERROR] Cannot use checkpoint: {e}")
         sys.exit(1)
+    if checkpoint.position:
+        print(f"[INFO] Resuming after {checkpoint.position} documents ({checkpoint.inserted} inserted so far).")
+
+    if args.generate is not None:
+        docs = iter_generated(args.generate, args.imsi_start, checkpoint.position, credentials)
+    else:
+        docs = iter_input(args.input, fmt, checkpoint.position)
 
-    # Connect to MongoDB
+    # Connect to MongoDB; the shared pool holds at least one connection per worker
     try:
-        client = MongoClient(mongo_uri)
-        db = client["open5gs"]
-        subscribers_col = db["subscribers"]
-    except Exception as e:
+        client = get_client(args.mongo_uri, pool_size=max(args.workers, 1) + 1)
+        subscribers_col = client["open5gs"]["subscribers"].with_options(
+            write_concern=WriteConcern(w=write_concern, j=True if args.journal else None))
+        before_count = subscribers_col.estimated_document_count()
+    except PyMongoError as e:
         print(f"[ERROR] MongoDB connection issue: {e}")
         sys.exit(1)
-
-    before_count = subscribers_col.count_documents({})
     print(f"[INFO] Documents before insertion: {before_count}")
 
-    # Convert dictionary-of-subscribers to list-of-subscriber-docs
-    subscriber_docs = list(all_subscribers.values())
+    # The unique index makes reruns idempotent; sync first removes duplicates left by earlier blind inserts
+    try:
+        removed = ensure_imsi_index(subscribers_col, dedupe=args.sync and not args.dry_run)
+        if removed:
+            print(f"[INFO] Deleted {removed} duplicate subscribers.")
+    except OperationFailure as e:
+        if args.sync and not args.dry_run:
+            print(f"[ERROR] Cannot create the unique imsi index: {e}")
+            sys.exit(1)
+        print(f"[INFO] No unique imsi index ({e.details.get('codeName', e) if e.details else e}); "
+              "--sync removes duplicate subscribers and creates it.")
 
-    # Remove _id if present, so Mongo can assign new object IDs
-    for doc in subscriber_docs:
-        if "_id" in doc:
-            doc.pop("_id", None)
+    if args.sync:
+        sync(docs, subscribers_col, args)
+        return
 
+    started = time.time()
     try:
-        result = subscribers_col.insert_many(subscriber_docs, ordered=False)
-        inserted_count = len(result.inserted_ids)
-        print(f"[INFO] Inserted {inserted_count} documents.")
-    except Exception as e:
+        counts = write_batches(map(hashed, docs), subscribers_col, insert_batch, checkpoint,
+                               max(args.batch_size, 1), max(args.workers, 1))
+    except (PyMongoError, OSError, ValueError) as e:
         print(f"[ERROR] Insert error: {e}")
+        print(f"[ERROR] {checkpoint.position} leading documents are stored"
+              + (f"; rerun with --checkpoint {args.checkpoint} to resume." if args.checkpoint else "."))
         sys.exit(1)
+    except KeyboardInterrupt:
+        print(f"\n[INFO] Interrupted; {checkpoint.position} leading documents are stored.")
+        sys.exit(130)
 
-    after_count = subscribers_col.count_documents({})
-    print(f"[INFO] Documents after insertion: {after_count}")
+    elapsed = time.time() - started
+    total = counts["inserted"] + counts["already present"]
+    print(f"[INFO] Inserted {counts['inserted']} documents ({counts['already present']} already present) "
+          f"in {elapsed:.1f} s, {total / max(elapsed, 1e-9):,.0f} docs/s.")
+    print(f"[INFO] Documents after insertion: {subscribers_col.estimated_document_count()}")
 
-def main():
-    mongodb_ip = get_mongodb_ip(namespace="open5gs")
-    
-    parser = argparse.ArgumentParser(
-        description="Minimal feeder script: reads all YAML entries and inserts them into open5gs.subscribers."
-    )
-    parser.add_argument("--yaml-file", default="subscribers.yaml",
-                        help="Path to the YAML file to insert.")
-    parser.add_argument("--mongo-uri", default=f"mongodb://{mongodb_ip}:27017",
-                        help="MongoDB URI (with host:port, or auth if needed).")
-    args = parser.parse_args()
+def sync(docs, collection, args):
+    """--sync: diffs docs against the stored content hashes and applies only the needed writes."""
+    started = time.time()
+    try:
+        existing = stored_hashes(collection)
+    except PyMongoError as e:
+        print(f"[ERROR] Cannot read the stored subscribers: {e}")
+        sys.exit(1)
+    print(f"[INFO] Read {len(existing)} stored subscriber hashes in {time.time() - started:.1f} s.")
+
+    tallies = Counter()
+    operations = sync_operations(docs, existing, tallies, delete=not args.keep_missing)
+    try:
+        if args.dry_run:
+            for operation in operations:
+                tallies[type(operation).__name__] += 1
+            counts = Counter()
+        else:
+            counts = write_batches(operations, collection, bulk_batch, Checkpoint(None, "sync"),
+                                   max(args.batch_size, 1), max(args.workers, 1))
+    except (PyMongoError, OSError, ValueError) as e:
+        print(f"[ERROR] Sync error: {e}")
+        print("[ERROR] Applied writes are kept; rerun --sync to finish.")
+        sys.exit(1)
 
-    feed_subscribers_minimal(args.yaml_file, args.mongo_uri)
+    elapsed = time.time() - started
+    changes = ", ".join(f"{n} {name}" for name, n in sorted((counts + tallies).items())) or "no changes"
+    print(f"[INFO] Sync {'dry run ' if args.dry_run else ''}done in {elapsed:.1f} s: {changes}.")
+    print(f"[INFO] Documents after sync: {collection.estimated_document_count()}")
 
 if __name__ == "__main__":
     main()
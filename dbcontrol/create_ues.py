@@ -1,86 +1,332 @@
 #!/usr/bin/env python3
+"""
+Generates Open5GS subscriber documents for consecutive IMSIs and streams
+them to a file (or stdout) as YAML, JSON Lines or raw BSON.
+
+The template is serialized once per format with placeholders; every
+subscriber is then written by splicing its values into the pre-encoded
+pieces, so memory stays constant and a million subscribers take seconds.
+
+With --credentials every subscriber gets its own K, derived from a seed
+and the IMSI (so reruns give the same keys), and the matching OPc
+computed from OP with the Milenage AES step, in batches on a process
+pool. --key-list writes the IMSI/K/OPc list for the load generator.
+
+Examples:
+  ./create_ues.py --count 2048                                  # subscribers.yaml, as before
+  ./create_ues.py --count 1000000 --output subscribers.jsonl
+  ./create_ues.py --count 1000000 --credentials --seed run1 --key-list keys.csv --output subscribers.jsonl
+  ./create_ues.py --count 1000000 --format bson --output - | ./add_ues.py --input - --format bson
+"""
+import argparse
+import hashlib
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
 from ruamel.yaml import YAML
-import copy
-
-def main():
-    yaml = YAML()
-    output_file = "subscribers.yaml"
-    
-    # Number of subscribers to create
-    num_subscribers = 2048
-
-    # Start IMSI at "20893" plus enough digits, e.g. 208930000000001
-    # Adjust to match your desired numbering scheme
-    imsi_start_int = 208930000000001
-
-    # A basic template – modify any fields as needed
-    subscriber_template = {
-        "_id": "",
-        "imsi": "",  # Filled in loop
-        "subscribed_rau_tau_timer": 12,
-        "network_access_mode": 0,
-        "subscriber_status": 0,
-        "access_restriction_data": 32,
-        "slice": [
-            {
-                "sst": 1,
-                "sd": "ffffff",            # <-- Updated to 0xffffff
-                "default_indicator": True,
-                "session": [
-                    {
-                        "name": "internet",
-                        "type": 1,
-                        "pcc_rule": [],
-                        "ambr": {
-                            "uplink": {"value": 1, "unit": 3},
-                            "downlink": {"value": 1, "unit": 3}
-                        },
-                        "qos": {
-                            "index": 9,
-                            "arp": {
-                                "priority_level": 8,
-                                "pre_emption_capability": 1,
-                                "pre_emption_vulnerability": 1
-                            }
+
+try:
+    import bson # Ships with pymongo; only needed for --format bson
+except ImportError:
+    bson = None
+try:
+    # Only needed for --credentials (pip install cryptography)
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+
+FORMATS = ("yaml", "jsonl", "bson")
+# Subscribers rendered per write() call
+WRITE_BATCH = 10000
+# Per-subscriber slots of --credentials: K and OPc as 32 hex digits
+CREDENTIAL_SLOTS = {"security.k": 32, "security.opc": 32}
+# OP of the 3GPP TS 35.208 test set 1, whose K is the template's K
+DEFAULT_OP = "CDC202D5123E20F62B6D676AC72CB318"
+DEFAULT_SEED = "5g-cn-testbed"
+# IMSIs per credential task on the process pool
+CREDENTIAL_BATCH = 20000
+
+# A basic template – modify any fields as needed
+SUBSCRIBER_TEMPLATE = {
+    "imsi": "",  # Filled per subscriber
+    "subscribed_rau_tau_timer": 12,
+    "network_access_mode": 0,
+    "subscriber_status": 0,
+    "access_restriction_data": 32,
+    "slice": [
+        {
+            "sst": 1,
+            "sd": "ffffff",
+            "default_indicator": True,
+            "session": [
+                {
+                    "name": "internet",
+                    "type": 1,
+                    "pcc_rule": [],
+                    "ambr": {
+                        "uplink": {"value": 1, "unit": 3},
+                        "downlink": {"value": 1, "unit": 3}
+                    },
+                    "qos": {
+                        "index": 9,
+                        "arp": {
+                            "priority_level": 8,
+                            "pre_emption_capability": 1,
+                            "pre_emption_vulnerability": 1
                         }
                     }
-                ]
-            }
-        ],
-        "ambr": {
-            "uplink": {"value": 1, "unit": 3},
-            "downlink": {"value": 1, "unit": 3}
-        },
-        "security": {
-            "k": "465B5CE8B199B49FAA5F0A2EE238A6BC",
-            "amf": "8000",
-            "op": "",
-            "opc": "E8ED289DEBA952E4283B54E88E6183CA"
-        },
-        "schema_version": 1,
-        "__v": 0
-    }
-
-    all_subscribers = {}
-    
-    for i in range(num_subscribers):
-        # Generate a new subscriber dict (deep copy so we don't mutate the original)
-        subscriber_data = copy.deepcopy(subscriber_template)
-        
-        # Compute this subscriber's IMSI
-        # e.g. 208930000000001, 208930000000002, ...
-        imsi_int = imsi_start_int + i
-        subscriber_data["imsi"] = str(imsi_int)
-
-        # Each subscriber key can be subscriber_1, subscriber_2, etc.
-        subscriber_key = f"subscriber_{i + 1}"
-        all_subscribers[subscriber_key] = subscriber_data
-
-    # Dump to YAML
-    with open(output_file, "w") as f:
-        yaml.dump(all_subscribers, f)
-
-    print(f"Generated {num_subscribers} subscribers in {output_file}")
+                }
+            ]
+        }
+    ],
+    "ambr": {
+        "uplink": {"value": 1, "unit": 3},
+        "downlink": {"value": 1, "unit": 3}
+    },
+    "security": {
+        "k": "465B5CE8B199B49FAA5F0A2EE238A6BC",
+        "amf": "8000",
+        "op": "",
+        "opc": "E8ED289DEBA952E4283B54E88E6183CA"
+    },
+    "schema_version": 1,
+    "__v": 0
+}
+
+
+def imsi_range(imsi_start, count):
+    """IMSI strings from imsi_start, keeping its width (leading zeros). Raises ValueError on overflow."""
+    width = len(imsi_start)
+    first = int(imsi_start)
+    if len(str(first + count - 1)) > width:
+        raise ValueError(f"{count} IMSIs starting at {imsi_start} do not fit in {width} digits")
+    return (str(n).zfill(width) for n in range(first, first + count))
+
+
+class TemplateEncoder:
+    """
+    Pre-encodes SUBSCRIBER_TEMPLATE for one output format. Per-subscriber
+    values (the slots) are rendered as fixed-width sentinels, which are then
+    located in the encoded bytes; encode() only joins bytes.
+    """
+
+    def __init__(self, fmt, slots):
+        # slots: {name: width}; 'index' (the YAML key number) is always available
+        self.fmt = fmt
+        self.slots = dict(slots)
+        sentinels = {name: ("Z" + name.upper()).ljust(width, "Z")[:width] for name, width in self.slots.items()}
+        sentinels["index"] = "ZINDEXZ"
+        doc = dict(SUBSCRIBER_TEMPLATE)
+        for name in self.slots:
+            self._set(doc, name, sentinels[name])
+
+        if fmt == "yaml":
+            stream = io.StringIO()
+            YAML().dump({f"subscriber_{sentinels['index']}": doc}, stream)
+            encoded = stream.getvalue().encode()
+        elif fmt == "jsonl":
+            encoded = json.dumps(doc, separators=(",", ":")).encode() + b"\n"
+        elif fmt == "bson":
+            if bson is None:
+                raise RuntimeError("--format bson needs the 'bson' module (pip install pymongo)")
+            encoded = bson.encode(doc)
+        else:
+            raise ValueError(f"unknown format '{fmt}'")
+
+        # Split the encoded template into literal pieces around the sentinels
+        self.pieces, self.order = [], []
+        rest = encoded
+        positions = sorted((rest.find(sentinels[name].encode()), name) for name in sentinels)
+        offset = 0
+        for position, name in positions:
+            if position < 0: continue # e.g. no index in JSONL / BSON
+            self.pieces.append(rest[offset:position])
+            self.order.append(name)
+            offset = position + len(sentinels[name])
+        self.pieces.append(rest[offset:])
+        # YAML would read digit-only strings back as numbers
+        self.quote = b"'" if fmt == "yaml" else b""
+
+    @staticmethod
+    def _set(doc, path, value):
+        """Sets a dotted path in doc, copying the dicts along the way so the template stays untouched."""
+        keys = path.split(".")
+        for key in keys[:-1]:
+            doc[key] = dict(doc[key])
+            doc = doc[key]
+        doc[keys[-1]] = value
+
+    def encode(self, index, values):
+        """Encoded document for subscriber number index with values {slot: str}; every value must have the slot width."""
+        parts = [self.pieces[0]]
+        for name, piece in zip(self.order, self.pieces[1:]):
+            if name == "index":
+                parts.append(str(index).encode())
+            else:
+                parts += (self.quote, values[name].encode(), self.quote)
+            parts.append(piece)
+        return b"".join(parts)
+
+
+def milenage_opc(k, op):
+    """OPc = AES-128_K(OP) xor OP, as in Milenage; K, OP and OPc are 16 bytes."""
+    encrypted = Cipher(algorithms.AES(k), modes.ECB()).encryptor().update(op)
+    return (int.from_bytes(encrypted, "big") ^ int.from_bytes(op, "big")).to_bytes(16, "big")
+
+def derive_credentials(seed, op, imsis):
+    """
+    (K, OPc) as upper-case hex for every IMSI. K is the keyed BLAKE2b-128
+    of the IMSI, so it depends on the seed and the IMSI only.
+    """
+    keyed = hashlib.blake2b(key=seed, digest_size=16)
+    result = []
+    for imsi in imsis:
+        h = keyed.copy()
+        h.update(imsi.encode())
+        k = h.digest()
+        result.append((k.hex().upper(), milenage_opc(k, op).hex().upper()))
+    return result
+
+def iter_credentials(imsis, seed, op, workers):
+    """Yields (imsi, K, OPc) in IMSI order. Batches are derived on a pool of workers processes, a few batches ahead."""
+    chunks = iter(lambda: list(itertools.islice(imsis, CREDENTIAL_BATCH)), [])
+    if workers <= 1:
+        for chunk in chunks:
+            yield from ((imsi, k, opc) for imsi, (k, opc) in zip(chunk, derive_credentials(seed, op, chunk)))
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in itertools.chain(chunks, [None]):
+            if chunk is not None:
+                pending.append((chunk, pool.submit(derive_credentials, seed, op, chunk)))
+            while pending and (chunk is None or len(pending) > 2 * workers):
+                done, future = pending.popleft()
+                yield from ((imsi, k, opc) for imsi, (k, opc) in zip(done, future.result()))
+
+def credential_options(seed, op, workers):
+    """Validated keyword arguments of iter_credentials. Raises ValueError or RuntimeError."""
+    if Cipher is None:
+        raise RuntimeError("--credentials needs the 'cryptography' module (pip install cryptography)")
+    seed = seed.encode()
+    if not 0 < len(seed) <= 64:
+        raise ValueError("--seed must be 1 to 64 bytes")
+    try:
+        op = bytes.fromhex(op)
+    except ValueError:
+        op = b""
+    if len(op) != 16:
+        raise ValueError("--op must be 32 hex digits")
+    return {"seed": seed, "op": op, "workers": max(workers, 1)}
+
+def add_credential_arguments(parser):
+    parser.add_argument("--credentials", action="store_true",
+                        help="Give every subscriber its own K (from --seed and the IMSI) and the matching OPc.")
+    parser.add_argument("--seed", default=DEFAULT_SEED, help="Seed of the per-subscriber keys; the same seed gives the same keys.")
+    parser.add_argument("--op", default=DEFAULT_OP, help="Operator key OP (32 hex digits) the OPc values are derived from.")
+    parser.add_argument("--credential-workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes deriving the OPc values.")
+
+def iter_encoded(fmt, count, imsi_start, credentials=None, key_list=None):
+    """
+    Returns a generator of the encoded subscriber documents, one per IMSI,
+    with per-subscriber K/OPc if credentials (credential_options()) are
+    given. Each subscriber's 'imsi,key,opc,amf' line goes to the key_list
+    text file if one is given. Raises ValueError up front on a bad range.
+    """
+    slots = {"imsi": len(imsi_start)}
+    if credentials:
+        slots.update(CREDENTIAL_SLOTS)
+    encoder = TemplateEncoder(fmt, slots)
+    imsis = imsi_range(imsi_start, count)
+    if not credentials and not key_list:
+        return (encoder.encode(index, {"imsi": imsi}) for index, imsi in enumerate(imsis, 1))
+
+    security = SUBSCRIBER_TEMPLATE["security"]
+    if credentials:
+        rows = iter_credentials(imsis, **credentials)
+    else:
+        rows = ((imsi, security["k"], security["opc"]) for imsi in imsis)
+    def generate():
+        if key_list:
+            key_list.write("imsi,key,opc,amf\n")
+        for index, (imsi, k, opc) in enumerate(rows, 1):
+            if key_list:
+                key_list.write(f"{imsi},{k},{opc},{security['amf']}\n")
+            yield encoder.encode(index, {"imsi": imsi, "security.k": k, "security.opc": opc})
+    return generate()
+
+def format_of(path, fmt=None):
+    """The explicit format, or the one implied by the file extension (YAML by default)."""
+    if fmt:
+        return fmt
+    ext = os.path.splitext(path)[1].lower()
+    return {".jsonl": "jsonl", ".ndjson": "jsonl", ".bson": "bson"}.get(ext, "yaml")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Open5GS subscribers for consecutive IMSIs.")
+    parser.add_argument("--count", type=int, default=2048, help="Number of subscribers to create.")
+    parser.add_argument("--imsi-start", default="208930000000001",
+                        help="First IMSI (MCC+MNC+MSIN); its width is kept for all IMSIs.")
+    parser.add_argument("--output", default="subscribers.yaml", help="Output file, or '-' for stdout.")
+    parser.add_argument("--format", choices=FORMATS,
+                        help="Output format (default: from the file extension, else yaml).")
+    parser.add_argument("--key-list", help="Also write an 'imsi,key,opc,amf' CSV of the subscribers (for PacketRusher).")
+    add_credential_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if not args.imsi_start.isdigit():
+        print(f"[ERROR] --imsi-start must be digits, got '{args.imsi_start}'", file=sys.stderr)
+        sys.exit(1)
+    fmt = format_of(args.output, args.format)
+    # Both files are closed on every exit path; the key list holds every subscriber's K
+    with ExitStack() as files:
+        try:
+            credentials = None
+            if args.credentials:
+                credentials = credential_options(args.seed, args.op, args.credential_workers)
+            if args.output == "-":
+                out = sys.stdout.buffer
+            else:
+                out = files.enter_context(open(args.output, "wb", buffering=1024 * 1024))
+            key_list = None
+            if args.key_list:
+                fd = os.open(args.key_list, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                key_list = files.enter_context(open(fd, "w", buffering=1024 * 1024))
+            documents = iter_encoded(fmt, args.count, args.imsi_start, credentials, key_list)
+        except (ValueError, RuntimeError, OSError) as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            sys.exit(1)
+
+        started = time.time()
+        written = 0
+        try:
+            batch = []
+            for document in documents:
+                batch.append(document)
+                if len(batch) >= WRITE_BATCH:
+                    out.write(b"".join(batch))
+                    written += len(batch)
+                    batch = []
+            out.write(b"".join(batch))
+            written += len(batch)
+            out.flush()
+        except BrokenPipeError:
+            print(f"[ERROR] Output closed after {written} subscribers.", file=sys.stderr)
+            files.close()
+            os._exit(1) # Skip the implicit stdout flush, which would fail again
+
+    elapsed = time.time() - started
+    print(f"[INFO] Generated {written} subscribers ({fmt}{', per-subscriber K/OPc' if credentials else ''}) "
+          f"in {args.output} in {elapsed:.2f} s", file=sys.stderr)
+    if key_list:
+        print(f"[INFO] Wrote the key list to {args.key_list}", file=sys.stderr)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Single entry point for the dbcontrol scripts.
+
+  ./dbcontrol.py create ...    create_ues.py
+  ./dbcontrol.py add ...       add_ues.py
+  ./dbcontrol.py show ...      show_ues.py
+  ./dbcontrol.py delete ...    delete_all.py
+  ./dbcontrol.py discover      prints the MongoDB URI that would be used
+
+Several subcommands separated by '+' run one after another in the same
+process. They share the discovered MongoDB address and one pooled client,
+so only the first one pays for discovery and the connection handshake.
+The chain stops at the first subcommand that fails.
+
+Examples:
+  ./dbcontrol.py delete --reset --yes + add --generate 1000000 + show --summary
+  ./dbcontrol.py --mongo-uri mongodb://10.244.1.7:27017 show --imsi 208930000000001
+  ./dbcontrol.py --refresh discover
+"""
+import argparse
+import sys
+import time
+
+import utils
+import add_ues
+import create_ues
+import delete_all
+import show_ues
+
+# Separates chained subcommands
+CHAIN_SEPARATOR = "+"
+
+
+def discover(argv):
+    parser = argparse.ArgumentParser(prog="dbcontrol.py discover",
+                                     description="Print the MongoDB URI used by the subcommands.")
+    parser.parse_args(argv)
+    uri = utils.defaults["uri"] or utils.mongodb_uri(utils.defaults["namespace"])
+    print(uri)
+
+COMMANDS = {
+    "create": create_ues.main,
+    "add": add_ues.main,
+    "show": show_ues.main,
+    "delete": delete_all.main,
+    "discover": discover,
+}
+
+def split_chain(command, args):
+    """[(command, argv), ...] from 'command args + command args ...'. Raises ValueError on an unknown command."""
+    chain, argv = [], []
+    for arg in args + [CHAIN_SEPARATOR]:
+        if arg != CHAIN_SEPARATOR:
+            if command is None:
+                command = arg
+            else:
+                argv.append(arg)
+            continue
+        if command not in COMMANDS:
+            raise ValueError(f"'{command or ''}' is not a subcommand (choose from {', '.join(COMMANDS)})")
+        chain.append((command, argv))
+        command, argv = None, []
+    return chain
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage Open5GS subscribers in MongoDB.",
+                                     epilog=f"Chain subcommands with '{CHAIN_SEPARATOR}', e.g. "
+                                            f"'delete --reset --yes {CHAIN_SEPARATOR} add --generate 1000'.")
+    parser.add_argument("--mongo-uri", help="MongoDB URI for all subcommands (default: discovered).")
+    parser.add_argument("--namespace", default=utils.DEFAULT_NAMESPACE, help="Namespace of the MongoDB pod.")
+    parser.add_argument("--refresh", action="store_true", help="Rediscover MongoDB instead of using the cached address.")
+    parser.add_argument("command", choices=COMMANDS, help="Subcommand.")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Subcommand arguments; see '<subcommand> -h'.")
+    args = parser.parse_args(argv)
+
+    try:
+        chain = split_chain(args.command, args.args)
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        sys.exit(2)
+
+    utils.defaults.update(uri=args.mongo_uri, namespace=args.namespace)
+    if args.refresh and not args.mongo_uri:
+        utils.forget_mongodb_ip(args.namespace)
+
+    for command, command_argv in chain:
+        started = time.time()
+        if len(chain) > 1:
+            print(f"[INFO] dbcontrol: {command} {' '.join(command_argv)}", file=sys.stderr)
+        try:
+            COMMANDS[command](command_argv)
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                print(f"[ERROR] dbcontrol: '{command}' failed; stopping.", file=sys.stderr)
+                raise
+        if len(chain) > 1:
+            print(f"[INFO] dbcontrol: {command} took {time.time() - started:.1f} s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
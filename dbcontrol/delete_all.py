@@ -1,21 +1,159 @@
 #!/usr/bin/env python3
-from pymongo import MongoClient
-from utils import get_mongodb_ip
-def main():
-    # Update this URI to match your actual MongoDB endpoint
-    mongodb_ip = get_mongodb_ip(namespace="open5gs")
-    
-    mongo_uri = f"mongodb://{mongodb_ip}:27017"
-    
-    # Connect to MongoDB
-    client = MongoClient(mongo_uri)
-    db = client["open5gs"]
+"""
+Deletes subscribers from 'open5gs.subscribers'.
+
+Without options every subscriber is deleted with one delete_many, as
+before. A cohort can be selected by IMSI range, IMSI prefix or an
+arbitrary JSON filter; matching IMSIs are read through the imsi index and
+deleted in batches with progress output. --reset drops and recreates the
+collection with its indexes instead, which is far faster than deleting
+millions of documents.
+
+Examples:
+  ./delete_all.py --imsi-range 208930000000001 208930000010000
+  ./delete_all.py --imsi-prefix 2089300001
+  ./delete_all.py --filter '{"slice.sst": 2}'
+  ./delete_all.py --reset --yes
+"""
+import argparse
+import json
+import re
+import sys
+import time
+
+from pymongo.errors import PyMongoError
+
+from utils import get_client
+
+# IMSIs per delete_many call
+DELETE_BATCH = 5000
+# Seconds between progress lines
+PROGRESS_INTERVAL = 2.0
+
+
+def imsi_filter(args):
+    """The query selecting the subscribers to delete, from the command line options."""
+    if args.imsi_range:
+        first, last = args.imsi_range
+        if len(first) != len(last) or not (first + last).isdigit() or first > last:
+            raise ValueError("--imsi-range needs two IMSIs of the same width, first <= last")
+        # Equal-width digit strings compare like numbers, so this is an index range scan
+        return {"imsi": {"$gte": first, "$lte": last}}
+    if args.imsi_prefix:
+        if not args.imsi_prefix.isdigit():
+            raise ValueError("--imsi-prefix must be digits")
+        # An anchored prefix regex is answered from the imsi index
+        return {"imsi": {"$regex": "^" + re.escape(args.imsi_prefix)}}
+    if args.filter:
+        query = json.loads(args.filter)
+        if not isinstance(query, dict):
+            raise ValueError("--filter must be a JSON object")
+        return query
+    return {}
+
+def delete_in_batches(collection, query, batch_size):
+    """
+    Deletes the subscribers matching query in batches. IMSIs are read
+    through the imsi index in order, and each batch deletes the matching
+    documents of one contiguous IMSI key range. Returns the number of
+    deleted documents.
+    """
+    deleted = 0
+    started = last_report = time.time()
+    batch = []
+    def flush():
+        nonlocal deleted, batch
+        key_range = {"imsi": {"$gte": batch[0], "$lte": batch[-1]}}
+        deleted += collection.delete_many({"$and": [query, key_range]} if query else key_range).deleted_count
+        batch = []
+
+    cursor = collection.find(query, {"_id": 0, "imsi": 1}, batch_size=batch_size).sort("imsi", 1)
+    for doc in cursor:
+        if not isinstance(doc.get("imsi"), str): continue
+        batch.append(doc["imsi"])
+        if len(batch) >= batch_size:
+            flush()
+            if time.time() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.time()
+                print(f"[INFO] Deleted {deleted} subscribers, {deleted / (last_report - started):,.0f} docs/s",
+                      end="\r", flush=True)
+    if batch:
+        flush()
+    # Documents without a string imsi (missing, null, numbers) are not reachable by the batches above
+    if "imsi" not in query:
+        deleted += collection.delete_many({"$and": [query, {"imsi": {"$not": {"$type": "string"}}}]}).deleted_count
+    return deleted
+
+def reset_collection(db, name):
+    """
+    Drops the collection and recreates it with the same options and indexes.
+    Returns (dropped document count, names of the recreated indexes).
+    """
+    collection = db[name]
+    count = collection.estimated_document_count()
+    options = collection.options()
+    indexes = [index for index in collection.list_indexes() if index["name"] != "_id_"]
+    collection.drop()
+    db.create_collection(name, **options)
+    for index in indexes:
+        keys = list(index["key"].items())
+        extra = {k: v for k, v in index.items() if k not in ("key", "v", "ns")}
+        db[name].create_index(keys, **extra)
+    return count, [index["name"] for index in indexes]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Delete subscribers from open5gs.subscribers.")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument("--imsi-range", nargs=2, metavar=("FIRST", "LAST"), help="Delete IMSIs FIRST..LAST (inclusive).")
+    selection.add_argument("--imsi-prefix", help="Delete IMSIs starting with these digits.")
+    selection.add_argument("--filter", help="Delete subscribers matching this JSON query.")
+    selection.add_argument("--reset", action="store_true",
+                           help="Drop and recreate the whole collection and its indexes (fast).")
+    parser.add_argument("--batch-size", type=int, default=DELETE_BATCH, help="IMSIs per delete batch.")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the matching subscribers.")
+    parser.add_argument("--yes", action="store_true", help="Do not ask before --reset.")
+    parser.add_argument("--mongo-uri", help="MongoDB URI (default: the MongoDB pod, or Service, in namespace open5gs).")
+    args = parser.parse_args(argv)
+
+    try:
+        query = imsi_filter(args)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    # Connect to MongoDB (shared, pooled client)
+    try:
+        db = get_client(args.mongo_uri)["open5gs"]
+    except PyMongoError as e:
+        print(f"[ERROR] MongoDB connection issue: {e}")
+        sys.exit(1)
     subscribers_collection = db["subscribers"]
 
-    # Delete all documents (subscribers) in the 'subscribers' collection
-    result = subscribers_collection.delete_many({})
-    
-    print(f"Deleted {result.deleted_count} subscribers from the database.")
+    started = time.time()
+    try:
+        if args.reset:
+            if args.dry_run:
+                print(f"[INFO] --reset would drop {subscribers_collection.estimated_document_count()} subscribers.")
+                return
+            if not args.yes and input("Drop and recreate open5gs.subscribers? [y/N] ").strip().lower() != "y":
+                print("[INFO] Aborted.")
+                return
+            count, indexes = reset_collection(db, "subscribers")
+            print(f"[INFO] Dropped {count} subscribers and recreated the collection "
+                  f"with indexes: {', '.join(indexes) or 'none'} ({time.time() - started:.1f} s).")
+            return
+        if args.dry_run:
+            print(f"[INFO] {subscribers_collection.count_documents(query)} subscribers match {json.dumps(query)}.")
+            return
+        if query:
+            deleted = delete_in_batches(subscribers_collection, query, max(args.batch_size, 1))
+        else:
+            deleted = subscribers_collection.delete_many({}).deleted_count
+    except PyMongoError as e:
+        print(f"\n[ERROR] Delete error: {e}")
+        sys.exit(1)
+
+    print(f"Deleted {deleted} subscribers from the database in {time.time() - started:.1f} s.")
 
 if __name__ == "__main__":
     main()
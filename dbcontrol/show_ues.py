@@ -1,26 +1,188 @@
 #!/usr/bin/env python3
+"""
+Queries 'open5gs.subscribers' without pulling the whole collection.
 
-from pymongo import MongoClient
-from utils import get_mongodb_ip
-def main():
-    # Replace this IP and port with the actual Pod IP if it changes
-    mongodb_ip = get_mongodb_ip(namespace="open5gs")
-    mongo_uri = f"mongodb://{mongodb_ip}:27017"
+Subscribers can be filtered by IMSI, IMSI range or prefix, slice (SST/SD)
+or any JSON query, projected to selected fields and paged by IMSI
+(--after / --limit, answered from the imsi index). Results stream as
+JSON Lines or CSV. --summary reports counts per slice, session type and
+AMBR profile, computed by the server with an aggregation.
 
-    # Connect to MongoDB
-    client = MongoClient(mongo_uri)
-    db = client["open5gs"]
+Examples:
+  ./show_ues.py --imsi 208930000000001
+  ./show_ues.py --imsi-prefix 2089300000 --fields imsi,security.k --format csv
+  ./show_ues.py --limit 1000 --after 208930000001000
+  ./show_ues.py --sst 1 --summary
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
 
-    # The Open5GS subscribers are generally in the 'subscribers' collection
-    subscribers_collection = db["subscribers"]
+from pymongo.errors import PyMongoError
 
-    # Query all documents (subscribers)
-    subscribers = subscribers_collection.find()
+from utils import get_client
 
-    # Print them
-    for subscriber in subscribers:
-        print(subscriber)
+# Default CSV columns when --fields is not given
+CSV_DEFAULT_FIELDS = ("imsi", "slice.sst", "slice.sd", "slice.session.name", "ambr.uplink.value", "ambr.downlink.value")
+
+
+def build_query(args):
+    """The query selecting subscribers, from the command line filters (combined with AND)."""
+    clauses = []
+    if args.imsi:
+        clauses.append({"imsi": args.imsi[0]} if len(args.imsi) == 1 else {"imsi": {"$in": args.imsi}})
+    if args.imsi_range:
+        first, last = args.imsi_range
+        if len(first) != len(last) or not (first + last).isdigit() or first > last:
+            raise ValueError("--imsi-range needs two IMSIs of the same width, first <= last")
+        clauses.append({"imsi": {"$gte": first, "$lte": last}})
+    if args.imsi_prefix:
+        clauses.append({"imsi": {"$regex": "^" + re.escape(args.imsi_prefix)}})
+    if args.after:
+        clauses.append({"imsi": {"$gt": args.after}})
+    slice_match = {}
+    if args.sst is not None:
+        slice_match["sst"] = args.sst
+    if args.sd:
+        slice_match["sd"] = args.sd
+    if slice_match:
+        clauses.append({"slice": {"$elemMatch": slice_match}})
+    if args.filter:
+        query = json.loads(args.filter)
+        if not isinstance(query, dict):
+            raise ValueError("--filter must be a JSON object")
+        clauses.append(query)
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def field_values(doc, path):
+    """Values at a dotted path; lists along the way (e.g. slice, session) contribute all their items."""
+    values = [doc]
+    for key in path.split("."):
+        next_values = []
+        for value in values:
+            items = value if isinstance(value, list) else [value]
+            next_values += [item[key] for item in items if isinstance(item, dict) and key in item]
+        values = next_values
+    return values
+
+def csv_cell(values):
+    return ";".join(json.dumps(v, default=str) if isinstance(v, (dict, list)) else str(v) for v in values)
+
+def summary_pipeline(query):
+    """Aggregation computing the --summary counts on the server."""
+    ambr = {"uplink": {"$concat": [{"$toString": "$ambr.uplink.value"}, "/", {"$toString": "$ambr.uplink.unit"}]},
+            "downlink": {"$concat": [{"$toString": "$ambr.downlink.value"}, "/", {"$toString": "$ambr.downlink.unit"}]}}
+    return [
+        {"$match": query},
+        {"$facet": {
+            "total": [{"$count": "subscribers"}],
+            "slices": [{"$unwind": "$slice"},
+                       {"$group": {"_id": {"sst": "$slice.sst", "sd": "$slice.sd"}, "subscribers": {"$sum": 1}}},
+                       {"$sort": {"_id.sst": 1, "_id.sd": 1}}],
+            "sessions": [{"$unwind": "$slice"}, {"$unwind": "$slice.session"},
+                         {"$group": {"_id": {"name": "$slice.session.name", "type": "$slice.session.type",
+                                             "qos_index": "$slice.session.qos.index"},
+                                     "subscribers": {"$sum": 1}}},
+                         {"$sort": {"subscribers": -1}}],
+            "ambr": [{"$group": {"_id": ambr, "subscribers": {"$sum": 1}}}, {"$sort": {"subscribers": -1}}],
+        }},
+    ]
+
+def print_summary(result):
+    """Prints the aggregation result as {total, slices: [...], sessions: [...], ambr: [...]}."""
+    total = result["total"][0]["subscribers"] if result["total"] else 0
+    summary = {"total": total}
+    for facet in ("slices", "sessions", "ambr"):
+        summary[facet] = [dict(row["_id"], subscribers=row["subscribers"]) for row in result[facet]]
+    print(json.dumps(summary, indent=2))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query subscribers in open5gs.subscribers.")
+    parser.add_argument("--imsi", action="append", help="IMSI to show (repeatable).")
+    parser.add_argument("--imsi-range", nargs=2, metavar=("FIRST", "LAST"), help="IMSIs FIRST..LAST (inclusive).")
+    parser.add_argument("--imsi-prefix", help="IMSIs starting with these digits.")
+    parser.add_argument("--sst", type=int, help="Subscribers with a slice of this SST.")
+    parser.add_argument("--sd", help="Subscribers with a slice of this SD (e.g. ffffff).")
+    parser.add_argument("--filter", help="Additional JSON query.")
+    parser.add_argument("--fields", help="Comma-separated (dotted) fields to return, e.g. imsi,security.k,slice.sst.")
+    parser.add_argument("--format", choices=("jsonl", "csv"), default="jsonl", help="Output format.")
+    parser.add_argument("--limit", type=int, default=0, help="Page size (0: no limit).")
+    parser.add_argument("--after", metavar="IMSI", help="Start after this IMSI (the last one of the previous page).")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents per cursor round trip.")
+    parser.add_argument("--summary", action="store_true",
+                        help="Counts per slice, session type and AMBR profile instead of documents.")
+    parser.add_argument("--mongo-uri", help="MongoDB URI (default: the MongoDB pod, or Service, in namespace open5gs).")
+    args = parser.parse_args(argv)
+
+    try:
+        query = build_query(args)
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # Connect to MongoDB (shared, pooled client)
+    try:
+        subscribers_collection = get_client(args.mongo_uri)["open5gs"]["subscribers"]
+    except PyMongoError as e:
+        print(f"[ERROR] MongoDB connection issue: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.summary:
+        try:
+            result = next(subscribers_collection.aggregate(summary_pipeline(query), allowDiskUse=True))
+        except PyMongoError as e:
+            print(f"[ERROR] Aggregation failed: {e}", file=sys.stderr)
+            sys.exit(1)
+        print_summary(result)
+        return
+
+    fields = [f for f in (args.fields or "").split(",") if f]
+    if args.format == "csv" and not fields:
+        fields = list(CSV_DEFAULT_FIELDS)
+    projection = {f: 1 for f in fields} if fields else {}
+    if "_id" not in fields:
+        projection["_id"] = 0
+    if fields and "imsi" not in fields:
+        projection["imsi"] = 1 # Needed for the next-page hint
+
+    # Sorted by imsi, paging follows the index instead of skipping documents
+    cursor = subscribers_collection.find(query, projection, batch_size=max(args.batch_size, 1)).sort("imsi", 1)
+    if args.limit:
+        cursor = cursor.limit(args.limit)
+
+    out = sys.stdout
+    writer = csv.writer(out) if args.format == "csv" else None
+    if writer:
+        writer.writerow(fields)
+    count, last_imsi = 0, None
+    try:
+        for subscriber in cursor:
+            last_imsi = subscriber.get("imsi", last_imsi)
+            if writer:
+                writer.writerow([csv_cell(field_values(subscriber, f)) for f in fields])
+            else:
+                if fields and "imsi" not in fields:
+                    subscriber.pop("imsi", None)
+                out.write(json.dumps(subscriber, default=str) + "\n")
+            count += 1
+        out.flush()
+    except BrokenPipeError:
+        # Output piped into e.g. head, which has seen enough
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return
+    except PyMongoError as e:
+        print(f"[ERROR] Query failed after {count} subscribers: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.limit and count == args.limit and last_imsi is not None:
+        print(f"[INFO] {count} subscribers; next page: --after {last_imsi}", file=sys.stderr)
+    else:
+        print(f"[INFO] {count} subscribers", file=sys.stderr)
 
 if __name__ == "__main__":
     main()
-
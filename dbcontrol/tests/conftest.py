@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The scripts import each other as top-level modules (e.g. 'from utils import ...')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def run(monkeypatch):
+    """Runs a script's main() with the given command line arguments."""
+    def run(module, *argv):
+        monkeypatch.setattr(sys, "argv", [f"{module.__name__}.py", *argv])
+        module.main()
+    return run
+
+@pytest.fixture
+def mongo():
+    """An in-memory MongoDB client; tests hand it to the scripts in place of the real one."""
+    mongomock = pytest.importorskip("mongomock")
+    return mongomock.MongoClient()
@@ -0,0 +1,85 @@
+import io
+import json
+import threading
+
+import bson
+import pytest
+from pymongo.errors import PyMongoError
+
+import add_ues
+import create_ues
+from add_ues import Checkpoint, insert_batch, iter_input, iter_yaml_documents, write_batches
+
+
+def imsis_of(docs):
+    return [bson.decode(doc.raw)["imsi"] if hasattr(doc, "raw") else doc["imsi"] for doc in docs]
+
+
+def test_checkpoint_advances_over_contiguous_finished_batches(tmp_path):
+    path = str(tmp_path / "load.ckpt")
+    checkpoint = Checkpoint(path, "jsonl:/data/subscribers.jsonl")
+    checkpoint.finish(10, 10) # Finished before the first batch
+    assert checkpoint.position == 0
+    checkpoint.finish(0, 10)
+    assert checkpoint.position == 20
+    checkpoint.finish(30, 5)
+    checkpoint.inserted = 20
+    checkpoint.save()
+
+    resumed = Checkpoint(path, "jsonl:/data/subscribers.jsonl")
+    assert (resumed.position, resumed.inserted) == (20, 20)
+    with pytest.raises(ValueError):
+        Checkpoint(path, "jsonl:/data/other.jsonl")
+
+def test_write_batches_runs_batches_concurrently_and_counts_them():
+    threads = set()
+    def write(collection, batch):
+        threads.add(threading.current_thread().name)
+        return {"inserted": len(batch)}
+    checkpoint = Checkpoint(None, "test")
+    counts = write_batches(iter(range(95)), None, write, checkpoint, batch_size=10, workers=3)
+    assert counts == {"inserted": 95}
+    assert (checkpoint.position, checkpoint.inserted) == (95, 95)
+    assert all(name.startswith("write") for name in threads)
+
+def test_failed_batch_stops_the_load_at_the_last_contiguous_position(tmp_path):
+    def write(collection, batch):
+        if batch[0] == 30:
+            raise PyMongoError("connection reset")
+        return {"inserted": len(batch)}
+    path = str(tmp_path / "load.ckpt")
+    with pytest.raises(PyMongoError):
+        write_batches(iter(range(100)), None, write, Checkpoint(path, "test"), batch_size=10, workers=1)
+    with open(path) as f:
+        saved = json.load(f)
+    assert saved["position"] == 30 and saved["done"] is False
+
+def test_resumed_input_skips_the_stored_documents(tmp_path, run):
+    path = str(tmp_path / "subscribers.yaml")
+    run(create_ues, "--count", "5", "--output", path)
+    assert imsis_of(iter_input(path, "yaml", skip=3)) == ["208930000000004", "208930000000005"]
+    jsonl = str(tmp_path / "subscribers.jsonl")
+    run(create_ues, "--count", "5", "--output", jsonl)
+    assert imsis_of(iter_input(jsonl, "jsonl", skip=4)) == ["208930000000005"]
+    assert imsis_of(add_ues.iter_generated(5, "208930000000001", skip=3)) == ["208930000000004", "208930000000005"]
+
+def test_generated_yaml_blocks_are_converted_without_parsing(tmp_path, monkeypatch, run):
+    monkeypatch.setattr(add_ues, "READ_CHUNK_BYTES", 100) # Blocks span several reads
+    path = str(tmp_path / "subscribers.yaml")
+    run(create_ues, "--count", "3", "--output", path)
+    with open(path, "rb") as f:
+        docs = list(iter_yaml_documents(f))
+    assert all(hasattr(doc, "raw") for doc in docs)
+    with open(path) as f:
+        expected = list(create_ues.YAML(typ="safe").load(f).values())
+    assert [bson.decode(doc.raw) for doc in docs] == expected
+    # Hand-edited blocks are parsed as YAML
+    edited = b"subscriber_1:\n  imsi: '208930000000001'\n  # edited\n  schema_version: 1\n"
+    assert list(iter_yaml_documents(io.BytesIO(edited))) == [{"imsi": "208930000000001", "schema_version": 1}]
+
+def test_rerun_counts_stored_subscribers_as_already_present(mongo):
+    collection = mongo["open5gs"]["subscribers"]
+    collection.create_index("imsi", unique=True)
+    docs = [{"imsi": f"20893000000000{i}"} for i in range(1, 4)]
+    assert insert_batch(collection, docs[:2]) == {"inserted": 2}
+    assert insert_batch(collection, [dict(doc) for doc in docs]) == {"inserted": 1, "already present": 2}
@@ -0,0 +1,115 @@
+import copy
+import csv
+import json
+import os
+
+import bson
+import pytest
+from ruamel.yaml import YAML
+
+import create_ues
+from create_ues import SUBSCRIBER_TEMPLATE, TemplateEncoder, imsi_range
+
+
+def subscriber(imsi, **security):
+    doc = copy.deepcopy(SUBSCRIBER_TEMPLATE)
+    doc["imsi"] = imsi
+    doc["security"].update(security)
+    return doc
+
+def read_yaml(path):
+    with open(path) as f:
+        return YAML(typ="safe").load(f)
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_imsi_range_keeps_the_width_and_rejects_overflow():
+    assert list(imsi_range("001010000000009", 3)) == ["001010000000009", "001010000000010", "001010000000011"]
+    with pytest.raises(ValueError):
+        list(imsi_range("999", 2))
+
+def test_pre_encoded_template_decodes_to_the_template():
+    imsi = "208930000000042"
+    values = {"imsi": imsi}
+    yaml = TemplateEncoder("yaml", {"imsi": len(imsi)}).encode(7, values)
+    assert YAML(typ="safe").load(yaml.decode()) == {"subscriber_7": subscriber(imsi)}
+    assert json.loads(TemplateEncoder("jsonl", {"imsi": len(imsi)}).encode(7, values)) == subscriber(imsi)
+    assert bson.decode(TemplateEncoder("bson", {"imsi": len(imsi)}).encode(7, values)) == subscriber(imsi)
+    # The template itself is never modified
+    assert SUBSCRIBER_TEMPLATE["imsi"] == ""
+
+def test_digit_only_values_stay_strings_in_yaml(tmp_path, run):
+    path = str(tmp_path / "subscribers.yaml")
+    run(create_ues, "--count", "2", "--imsi-start", "001010000000001", "--output", path)
+    assert [doc["imsi"] for doc in read_yaml(path).values()] == ["001010000000001", "001010000000002"]
+
+def test_output_is_streamed_in_batches(tmp_path, monkeypatch, run):
+    monkeypatch.setattr(create_ues, "WRITE_BATCH", 2)
+    path = str(tmp_path / "subscribers.jsonl")
+    run(create_ues, "--count", "5", "--output", path)
+    assert read_jsonl(path) == [subscriber(f"20893000000000{i}") for i in range(1, 6)]
+    yaml_path = str(tmp_path / "subscribers.yaml")
+    run(create_ues, "--count", "5", "--output", yaml_path)
+    assert list(read_yaml(yaml_path)) == [f"subscriber_{i}" for i in range(1, 6)]
+
+def test_bad_imsi_start_is_rejected(tmp_path, run):
+    with pytest.raises(SystemExit):
+        run(create_ues, "--imsi-start", "20893abc", "--output", str(tmp_path / "out.yaml"))
+    with pytest.raises(SystemExit):
+        run(create_ues, "--count", "2", "--imsi-start", "9", "--output", str(tmp_path / "out.yaml"))
+
+# --- Per-subscriber credentials ---
+
+def test_opc_matches_the_milenage_test_vector():
+    pytest.importorskip("cryptography")
+    # 3GPP TS 35.208, test set 1
+    k = bytes.fromhex("465B5CE8B199B49FAA5F0A2EE238A6BC")
+    op = bytes.fromhex("CDC202D5123E20F62B6D676AC72CB318")
+    assert create_ues.milenage_opc(k, op).hex().upper() == "CD63CB71954A9F4E48A5994E37A02BAF"
+
+def test_keys_depend_on_the_seed_and_imsi_only(monkeypatch):
+    pytest.importorskip("cryptography")
+    monkeypatch.setattr(create_ues, "CREDENTIAL_BATCH", 2)
+    options = create_ues.credential_options("run1", create_ues.DEFAULT_OP, workers=1)
+    imsis = [f"20893000000000{i}" for i in range(1, 6)]
+    rows = list(create_ues.iter_credentials(iter(imsis), **options))
+    assert [imsi for imsi, _, _ in rows] == imsis
+    assert len({k for _, k, _ in rows}) == 5
+    assert rows[2:] == list(create_ues.iter_credentials(iter(imsis[2:]), **options))
+    assert list(create_ues.iter_credentials(iter(imsis), **dict(options, workers=2))) == rows
+    for _, k, opc in rows:
+        assert create_ues.milenage_opc(bytes.fromhex(k), options["op"]).hex().upper() == opc
+    other = create_ues.credential_options("run2", create_ues.DEFAULT_OP, workers=1)
+    assert list(create_ues.iter_credentials(iter(imsis[:1]), **other))[0][1] != rows[0][1]
+
+def test_credential_options_are_validated():
+    pytest.importorskip("cryptography")
+    with pytest.raises(ValueError):
+        create_ues.credential_options("run1", "CDC2", workers=1)
+    with pytest.raises(ValueError):
+        create_ues.credential_options("", create_ues.DEFAULT_OP, workers=1)
+
+def test_key_list_matches_the_written_subscribers(tmp_path, run):
+    pytest.importorskip("cryptography")
+    path, keys = str(tmp_path / "subscribers.jsonl"), str(tmp_path / "keys.csv")
+    run(create_ues, "--count", "3", "--credentials", "--seed", "run1", "--credential-workers", "1",
+        "--key-list", keys, "--output", path)
+    docs = read_jsonl(path)
+    with open(keys) as f:
+        rows = list(csv.DictReader(f))
+    assert [row["imsi"] for row in rows] == [doc["imsi"] for doc in docs]
+    for row, doc in zip(rows, docs):
+        assert doc == subscriber(row["imsi"], k=row["key"], opc=row["opc"])
+        assert row["amf"] == "8000"
+    assert os.stat(keys).st_mode & 0o777 == 0o600
+
+def test_key_list_without_credentials_has_the_template_keys(tmp_path, run):
+    keys = str(tmp_path / "keys.csv")
+    run(create_ues, "--count", "2", "--key-list", keys, "--output", str(tmp_path / "subscribers.yaml"))
+    with open(keys) as f:
+        rows = list(csv.DictReader(f))
+    assert {(row["key"], row["opc"]) for row in rows} == {(SUBSCRIBER_TEMPLATE["security"]["k"],
+                                                          SUBSCRIBER_TEMPLATE["security"]["opc"])}
@@ -0,0 +1,94 @@
+import argparse
+
+import pytest
+
+import delete_all
+from delete_all import delete_in_batches, imsi_filter, reset_collection
+
+
+def options(imsi_range=None, imsi_prefix=None, filter=None):
+    return argparse.Namespace(imsi_range=imsi_range, imsi_prefix=imsi_prefix, filter=filter)
+
+@pytest.fixture
+def subscribers(mongo, monkeypatch):
+    """open5gs.subscribers with IMSIs 208930000000001..20; the scripts get the in-memory client."""
+    monkeypatch.setattr(delete_all, "get_client", lambda *args, **kwargs: mongo)
+    collection = mongo["open5gs"]["subscribers"]
+    collection.create_index("imsi", unique=True)
+    collection.insert_many([{"imsi": f"2089300000000{i:02d}", "slice": [{"sst": 1 + i % 2}]} for i in range(1, 21)])
+    return collection
+
+def counted_deletes(collection, monkeypatch):
+    """Records the query of every delete_many call on collection."""
+    calls = []
+    delete_many = collection.delete_many
+    def recording(query, *args, **kwargs):
+        calls.append(query)
+        return delete_many(query, *args, **kwargs)
+    monkeypatch.setattr(collection, "delete_many", recording, raising=False)
+    return calls
+
+def imsis(collection):
+    return sorted(doc["imsi"] for doc in collection.find({}, {"imsi": 1}))
+
+
+def test_selectors_are_validated():
+    assert imsi_filter(options(imsi_range=["208930000000001", "208930000000009"])) == \
+        {"imsi": {"$gte": "208930000000001", "$lte": "208930000000009"}}
+    assert imsi_filter(options(imsi_prefix="20893")) == {"imsi": {"$regex": "^20893"}}
+    assert imsi_filter(options()) == {}
+    for bad in (options(imsi_range=["9", "10"]), options(imsi_range=["2", "1"]), options(imsi_prefix="208*"),
+                options(filter="[1]")):
+        with pytest.raises(ValueError):
+            imsi_filter(bad)
+
+def test_range_is_deleted_in_contiguous_key_range_batches(subscribers, monkeypatch):
+    calls = counted_deletes(subscribers, monkeypatch)
+    query = {"imsi": {"$gte": "208930000000003", "$lte": "208930000000009"}}
+    assert delete_in_batches(subscribers, query, batch_size=3) == 7
+    assert len(calls) == 3
+    assert calls[0] == {"$and": [query, {"imsi": {"$gte": "208930000000003", "$lte": "208930000000005"}}]}
+    assert imsis(subscribers) == [f"2089300000000{i:02d}" for i in (1, 2, *range(10, 21))]
+
+def test_filter_deletes_only_matching_documents_of_each_key_range(subscribers):
+    # Every other subscriber has SST 2; the key ranges of the batches also cover SST 1 subscribers
+    assert delete_in_batches(subscribers, {"slice.sst": 2}, batch_size=4) == 10
+    assert subscribers.count_documents({"slice.sst": 2}) == 0
+    assert subscribers.count_documents({}) == 10
+
+def test_main_deletes_a_prefix_and_reports_dry_runs(subscribers, capsys, run):
+    run(delete_all, "--imsi-prefix", "20893000000001", "--dry-run")
+    assert "10 subscribers match" in capsys.readouterr().out
+    run(delete_all, "--imsi-prefix", "20893000000001", "--batch-size", "4")
+    assert "Deleted 10 subscribers" in capsys.readouterr().out
+    assert imsis(subscribers) == [f"2089300000000{i:02d}" for i in (*range(1, 10), 20)]
+
+def test_reset_recreates_the_collection_with_its_indexes(subscribers, mongo, monkeypatch):
+    monkeypatch.setattr(subscribers, "options", lambda: {}, raising=False) # Not implemented by mongomock
+    count, indexes = reset_collection(mongo["open5gs"], "subscribers")
+    assert (count, indexes) == (20, ["imsi_1"])
+    collection = mongo["open5gs"]["subscribers"]
+    assert collection.count_documents({}) == 0
+    assert collection.index_information()["imsi_1"]["unique"] is True
+
+def test_reset_asks_unless_yes(subscribers, monkeypatch, capsys, run):
+    monkeypatch.setattr("builtins.input", lambda prompt: "n")
+    run(delete_all, "--reset")
+    assert "Aborted" in capsys.readouterr().out
+    assert subscribers.count_documents({}) == 20
+
+def test_documents_without_a_string_imsi_are_swept(subscribers, monkeypatch):
+    subscribers.drop_index("imsi_1") # Missing and null IMSIs would collide in the unique index
+    subscribers.insert_many([{"slice": [{"sst": 2}]}, {"imsi": None, "slice": [{"sst": 2}]},
+                             {"imsi": 208930000000099, "slice": [{"sst": 2}]}, {"imsi": None, "slice": [{"sst": 1}]}])
+    calls = counted_deletes(subscribers, monkeypatch)
+    assert delete_in_batches(subscribers, {"slice.sst": 2}, batch_size=100) == 13
+    assert calls[-1] == {"$and": [{"slice.sst": 2}, {"imsi": {"$not": {"$type": "string"}}}]}
+    assert subscribers.count_documents({"slice.sst": 2}) == 0
+
+def test_everything_is_deleted_with_one_delete_many(subscribers, monkeypatch, run):
+    subscribers.insert_one({"imsi": None})
+    calls = counted_deletes(subscribers, monkeypatch)
+    run(delete_all)
+    assert calls == [{}]
+    assert subscribers.count_documents({}) == 0
@@ -0,0 +1,68 @@
+import argparse
+import csv
+import io
+import json
+
+import pytest
+
+import show_ues
+
+
+@pytest.fixture
+def subscribers(mongo, monkeypatch):
+    """open5gs.subscribers with IMSIs 208930000000001..10, every other one on slice 2; the scripts get the in-memory client."""
+    monkeypatch.setattr(show_ues, "get_client", lambda *args, **kwargs: mongo)
+    collection = mongo["open5gs"]["subscribers"]
+    collection.insert_many([{
+        "imsi": f"2089300000000{i:02d}",
+        "security": {"k": f"{i:032X}"},
+        "slice": [{"sst": 1 + i % 2, "sd": "ffffff", "session": [{"name": "internet", "type": 1, "qos": {"index": 9}}]}],
+        "ambr": {"uplink": {"value": 1, "unit": 3}, "downlink": {"value": 1, "unit": 3}},
+    } for i in range(10, 0, -1)])
+    return collection
+
+@pytest.fixture
+def show(run, capsys):
+    """Runs show_ues.py with the given arguments; returns its (stdout, stderr)."""
+    def show(*argv):
+        run(show_ues, *argv)
+        return capsys.readouterr()
+    return show
+
+
+def test_filters_are_combined_with_and():
+    args = argparse.Namespace(
+        imsi=None, imsi_range=["208930000000001", "208930000000005"], imsi_prefix=None, after="208930000000002",
+        sst=2, sd=None, filter=None)
+    assert show_ues.build_query(args) == {"$and": [
+        {"imsi": {"$gte": "208930000000001", "$lte": "208930000000005"}},
+        {"imsi": {"$gt": "208930000000002"}},
+        {"slice": {"$elemMatch": {"sst": 2}}},
+    ]}
+
+def test_pages_follow_the_imsi_order(subscribers, show):
+    out, err = show("--limit", "4", "--fields", "imsi")
+    assert [json.loads(line)["imsi"] for line in out.splitlines()] == [f"2089300000000{i:02d}" for i in range(1, 5)]
+    assert "next page: --after 208930000000004" in err
+    out, err = show("--limit", "4", "--after", "208930000000008", "--fields", "imsi")
+    assert [json.loads(line)["imsi"] for line in out.splitlines()] == ["208930000000009", "208930000000010"]
+    assert "next page" not in err
+
+def test_projection_drops_the_paging_imsi_again(subscribers, show):
+    out, _ = show("--imsi", "208930000000003", "--fields", "security.k")
+    assert json.loads(out) == {"security": {"k": f"{3:032X}"}}
+
+def test_csv_has_one_column_per_field(subscribers, show):
+    out, _ = show("--format", "csv", "--sst", "2", "--limit", "2")
+    rows = list(csv.reader(io.StringIO(out)))
+    assert rows[0] == list(show_ues.CSV_DEFAULT_FIELDS)
+    assert rows[1] == ["208930000000001", "2", "ffffff", "internet", "1", "1"]
+    assert [row[0] for row in rows[1:]] == ["208930000000001", "208930000000003"]
+
+def test_summary_counts_slices_sessions_and_ambr_profiles(subscribers, show):
+    out, _ = show("--summary", "--imsi-prefix", "20893000000000")
+    summary = json.loads(out)
+    assert summary["total"] == 9
+    assert summary["slices"] == [{"sst": 1, "sd": "ffffff", "subscribers": 4}, {"sst": 2, "sd": "ffffff", "subscribers": 5}]
+    assert summary["sessions"] == [{"name": "internet", "type": 1, "qos_index": 9, "subscribers": 9}]
+    assert summary["ambr"] == [{"uplink": "1/3", "downlink": "1/3", "subscribers": 9}]
@@ -0,0 +1,89 @@
+from collections import Counter
+
+import bson
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+from pymongo import DeleteMany, InsertOne, ReplaceOne
+
+import add_ues
+from add_ues import SYNC_HASH_FIELD, content_hash, hashed, raw_imsi, sync_operations
+
+
+def subscriber(imsi, k="465b5ce8b199b49faa5f0a2ee238a6bc", sst=1):
+    return {"imsi": imsi, "security": {"k": k, "amf": "8000"}, "slice": [{"sst": sst, "default_indicator": True}]}
+
+def stored(*docs):
+    """{imsi: hash} as stored_hashes() would read it back after loading docs."""
+    return {doc["imsi"]: content_hash(doc)[0] for doc in docs}
+
+def diff(docs, existing, delete=True):
+    counts = Counter()
+    return list(sync_operations(docs, existing, counts, delete=delete)), counts
+
+def test_hash_ignores_id_and_stored_hash_but_not_content():
+    doc = subscriber("208930000000001")
+    digest = content_hash(doc)[0]
+    assert content_hash(dict(doc, _id=ObjectId()))[0] == digest
+    assert content_hash(RawBSONDocument(bson.encode(doc)))[0] == digest
+    assert content_hash(bson.decode(hashed(doc).raw))[0] == digest
+    assert content_hash(subscriber("208930000000001", sst=2))[0] != digest
+
+def test_hashed_document_carries_its_hash():
+    doc = subscriber("208930000000001")
+    decoded = bson.decode(hashed(dict(doc, _id=ObjectId())).raw)
+    assert decoded == dict(doc, **{SYNC_HASH_FIELD: content_hash(doc)[0]})
+    assert raw_imsi(hashed(doc).raw) == "208930000000001"
+    assert raw_imsi(bson.encode({"name": "no imsi"})) is None
+
+def test_new_imsis_are_inserted():
+    doc = subscriber("208930000000001")
+    operations, counts = diff([doc], {})
+    assert operations == [InsertOne(hashed(doc))]
+    assert counts == {}
+
+def test_changed_documents_are_replaced_and_unchanged_ones_skipped():
+    same, old = subscriber("208930000000001"), subscriber("208930000000002")
+    new = subscriber("208930000000002", k="0" * 32)
+    operations, counts = diff([same, new], stored(same, old))
+    assert operations == [ReplaceOne({"imsi": "208930000000002"}, hashed(new))]
+    assert counts == {"unchanged": 1}
+
+def test_documents_stored_without_a_hash_are_replaced():
+    doc = subscriber("208930000000001")
+    operations, _ = diff([doc], {"208930000000001": None})
+    assert operations == [ReplaceOne({"imsi": "208930000000001"}, hashed(doc))]
+
+def test_stored_imsis_missing_from_the_input_are_deleted_in_batches(monkeypatch):
+    monkeypatch.setattr(add_ues, "DELETE_BATCH", 2)
+    kept = subscriber("208930000000001")
+    existing = stored(kept, *(subscriber(f"20893000000001{i}") for i in range(3)))
+    operations, _ = diff([kept], existing)
+    assert operations == [DeleteMany({"imsi": {"$in": ["208930000000010", "208930000000011"]}}),
+                          DeleteMany({"imsi": {"$in": ["208930000000012"]}})]
+    assert existing == {}
+
+def test_no_deletes_without_delete():
+    existing = stored(subscriber("208930000000001"))
+    operations, _ = diff([], existing, delete=False)
+    assert operations == []
+
+def test_duplicate_input_imsis_are_counted_once():
+    doc = subscriber("208930000000001")
+    operations, counts = diff([doc, subscriber("208930000000001", sst=2)], {})
+    assert operations == [InsertOne(hashed(doc))]
+    assert counts == {"duplicate input": 1}
+
+def test_existing_unique_imsi_index_is_reused(mongo):
+    collection = mongo["open5gs"]["subscribers"]
+    collection.create_index("imsi", unique=True, name="imsi_1") # As the WebUI creates it
+    assert add_ues.ensure_imsi_index(collection, dedupe=True) == 0
+    assert sorted(collection.index_information()) == ["_id_", "imsi_1"]
+
+def test_duplicates_are_removed_before_the_index_is_created(mongo):
+    collection = mongo["open5gs"]["subscribers"]
+    first = collection.insert_one(subscriber("208930000000001")).inserted_id
+    collection.insert_one(subscriber("208930000000001", sst=2))
+    collection.insert_one(subscriber("208930000000002"))
+    assert add_ues.ensure_imsi_index(collection, dedupe=True) == 1
+    assert collection.find_one({"imsi": "208930000000001"})["_id"] == first
+    assert collection.index_information()["imsi_1"]["unique"] is True
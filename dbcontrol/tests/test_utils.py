@@ -0,0 +1,92 @@
+import types
+
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+import dbcontrol
+import utils
+
+
+def pod(name, ip, phase="Running", ready=True):
+    return {"metadata": {"name": name},
+            "status": {"phase": phase, "podIP": ip,
+                       "conditions": [{"type": "Ready", "status": "True" if ready else "False"}]}}
+
+@pytest.fixture
+def clock(monkeypatch, tmp_path):
+    """A settable clock for utils, with the discovery cache in tmp_path."""
+    monkeypatch.setattr(utils, "CACHE_FILE", str(tmp_path / "dbcontrol" / "mongodb.json"))
+    now = types.SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(utils, "time", types.SimpleNamespace(time=lambda: now.value))
+    return now
+
+@pytest.fixture
+def discoveries(monkeypatch):
+    """Namespaces passed to discover_mongodb_pod; set .found to change its answer."""
+    calls = []
+    def discover(namespace):
+        calls.append(namespace)
+        return discover.found
+    discover.found = ("open-mongodb-0", "10.244.1.7")
+    monkeypatch.setattr(utils, "discover_mongodb_pod", discover)
+    return discover, calls
+
+
+def test_discovered_ip_is_cached_for_the_ttl(clock, discoveries):
+    discover, calls = discoveries
+    assert utils.get_mongodb_ip("open5gs") == "10.244.1.7"
+    discover.found = ("open-mongodb-0", "10.244.2.9") # The pod moved
+    clock.value += utils.CACHE_TTL - 1
+    assert utils.get_mongodb_ip("open5gs") == "10.244.1.7"
+    assert len(calls) == 1
+    clock.value += 2
+    assert utils.get_mongodb_ip("open5gs") == "10.244.2.9"
+    assert utils.get_mongodb_ip("open5gs", refresh=True) == "10.244.2.9"
+    assert calls == ["open5gs"] * 3
+
+def test_service_is_used_when_no_pod_is_found(clock, discoveries):
+    discover, _ = discoveries
+    discover.found = None
+    assert utils.mongodb_uri("core") == "mongodb://open-mongodb.core.svc.cluster.local:27017"
+
+def test_release_pod_and_ready_pods_are_preferred(monkeypatch):
+    pods = [pod("mongodb-arbiter-0", "10.0.0.1"), pod("open-mongodb-1", "10.0.0.2", ready=False),
+            pod("open-mongodb-0", "10.0.0.3"), pod("open-mongodb-2", "10.0.0.4", phase="Pending")]
+    monkeypatch.setattr(utils, "_kubectl_pods", lambda namespace, selector=None: pods)
+    assert utils.discover_mongodb_pod() == ("open-mongodb-0", "10.0.0.3")
+    monkeypatch.setattr(utils, "_kubectl_pods", lambda namespace, selector=None: None) # No kubectl
+    assert utils.discover_mongodb_pod() is None
+
+def test_unreachable_cached_address_is_rediscovered_once(clock, discoveries, monkeypatch):
+    discover, calls = discoveries
+    utils.get_mongodb_ip("open5gs") # Cached: 10.244.1.7
+    discover.found = ("open-mongodb-0", "10.244.2.9")
+
+    class FakeClient:
+        def __init__(self, uri, **options):
+            self.uri, self.closed = uri, False
+            self.options = types.SimpleNamespace(pool_options=types.SimpleNamespace(max_pool_size=options["maxPoolSize"]))
+            self.admin = types.SimpleNamespace(command=self.ping)
+        def ping(self, name):
+            if "10.244.1.7" in self.uri:
+                raise ServerSelectionTimeoutError("timed out")
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(utils, "MongoClient", FakeClient)
+    monkeypatch.setattr(utils, "_clients", {})
+    monkeypatch.setattr(utils, "_resolved", {})
+    client = utils.get_client()
+    assert client.uri == "mongodb://10.244.2.9:27017"
+    assert utils.get_client() is client and len(calls) == 2
+    # A larger pool replaces the shared client
+    bigger = utils.get_client(pool_size=64)
+    assert bigger is not client and client.closed and bigger.options.pool_options.max_pool_size == 64
+
+def test_subcommands_are_chained_with_plus():
+    assert dbcontrol.split_chain("delete", ["--reset", "--yes", "+", "add", "--generate", "10", "+", "show"]) == \
+        [("delete", ["--reset", "--yes"]), ("add", ["--generate", "10"]), ("show", [])]
+    with pytest.raises(ValueError):
+        dbcontrol.split_chain("delete", ["+", "drop"])
+    with pytest.raises(ValueError):
+        dbcontrol.split_chain("show", ["+"])
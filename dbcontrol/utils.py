@@ -1,42 +1,164 @@
 #!/usr/bin/env python3
+"""
+MongoDB discovery and connections shared by the dbcontrol scripts.
 
+The MongoDB pod is found with a label selector ('kubectl get pods -l ... -o
+json') and its IP is cached on disk for a few minutes, so consecutive script
+runs do not each pay for a kubectl call. If no pod is found (e.g. when
+running inside the cluster without kubectl), the Service DNS name is used.
+get_client() hands out one pooled MongoClient per URI for the whole process.
+"""
+import json
+import os
 import subprocess
+import sys
+import time
 
-def get_mongodb_ip(namespace="open5gs"):
-    """
-    Retrieve the IP of the 'open-mongodb' pod running in the given namespace.
-    Returns None if no open-mongodb pod is found.
-    """
+from pymongo import MongoClient
+from pymongo.errors import ServerSelectionTimeoutError
+
+DEFAULT_NAMESPACE = "open5gs"
+# Labels of the MongoDB pod deployed by the open5gs chart (bitnami mongodb, release 'open')
+MONGODB_SELECTOR = "app.kubernetes.io/name=mongodb"
+MONGODB_POD_PREFIX = "open-mongodb"
+# Service of that pod; used when no pod IP can be discovered
+MONGODB_SERVICE = "open-mongodb"
+MONGODB_PORT = 27017
+# Discovered pod IPs are reused for this many seconds
+CACHE_TTL = 300
+CACHE_FILE = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "dbcontrol", "mongodb.json")
+# Options of the shared MongoClient; maxPoolSize is raised for callers asking for more connections
+CLIENT_OPTIONS = {
+    "maxPoolSize": 16,
+    "connectTimeoutMS": 5000,
+    "serverSelectionTimeoutMS": 5000,
+    "maxIdleTimeMS": 60000,
+    "appname": "dbcontrol",
+}
+
+# Overridable by the dbcontrol entry point (--mongo-uri, --namespace)
+defaults = {"uri": None, "namespace": DEFAULT_NAMESPACE}
+# {uri: MongoClient}, and the URI found for each namespace in this process
+_clients = {}
+_resolved = {}
+
+
+def _load_cache():
     try:
-        # Run the kubectl command and capture its output
-        output = subprocess.check_output(
-            ["kubectl", "get", "pods", "-n", namespace, "-o", "wide"],
-            text=True
-        )
+        with open(CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(cache):
+    try:
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        tmp = f"{CACHE_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp, CACHE_FILE)
+    except OSError:
+        pass # The cache is only an optimization
+
+def _kubectl_pods(namespace, selector=None):
+    """Pods of namespace as parsed 'kubectl get pods -o json' items, or None if kubectl failed."""
+    command = ["kubectl", "get", "pods", "-n", namespace, "-o", "json"]
+    if selector:
+        command += ["-l", selector]
+    try:
+        output = subprocess.check_output(command, text=True, stderr=subprocess.PIPE)
+        return json.loads(output).get("items", [])
+    except FileNotFoundError:
+        return None
     except subprocess.CalledProcessError as e:
-        print("Error calling kubectl:", e)
+        print(f"[ERROR] kubectl failed: {(e.stderr or '').strip() or e}", file=sys.stderr)
+        return None
+    except ValueError as e:
+        print(f"[ERROR] Cannot parse the kubectl output: {e}", file=sys.stderr)
         return None
 
-    lines = output.strip().split("\n")
-    if len(lines) < 2:
-        # No data returned
+def discover_mongodb_pod(namespace=DEFAULT_NAMESPACE):
+    """(pod name, pod IP) of the running MongoDB pod in namespace, or None."""
+    pods = _kubectl_pods(namespace, MONGODB_SELECTOR)
+    if pods is None:
         return None
-    
-    # The first line is the header, e.g. "NAME  READY  STATUS  RESTARTS  AGE  IP  NODE  ..."
-    # We'll iterate over the subsequent lines
-    for line in lines[1:]:
-        columns = line.split()
-        if not columns:
-            continue
-        
-        # columns[0] is the Pod name. We look for "open-mongodb-..."
-        pod_name = columns[0]
-        if pod_name.startswith("open-mongodb"):
-            # columns[5] is typically the IP in "kubectl get pods -o wide" output
-            pod_ip = columns[5]
-            return pod_ip
-
-    return None
+    if not pods:
+        # Deployments without the chart labels: match the pod name as before
+        pods = [p for p in _kubectl_pods(namespace) or [] if p["metadata"]["name"].startswith(MONGODB_POD_PREFIX)]
+    running = [p for p in pods if p.get("status", {}).get("phase") == "Running" and p["status"].get("podIP")]
+    if not running:
+        return None
+    # Prefer the release's own pod, then ready pods
+    def rank(pod):
+        ready = any(c.get("type") == "Ready" and c.get("status") == "True" for c in pod["status"].get("conditions", []))
+        return (not pod["metadata"]["name"].startswith(MONGODB_POD_PREFIX), not ready, pod["metadata"]["name"])
+    pod = min(running, key=rank)
+    return pod["metadata"]["name"], pod["status"]["podIP"]
+
+def get_mongodb_ip(namespace=DEFAULT_NAMESPACE, refresh=False):
+    """
+    Retrieve the IP of the MongoDB pod running in the given namespace, from
+    the cache if it is recent enough (unless refresh). Returns None if no
+    MongoDB pod is found.
+    """
+    cache = _load_cache()
+    entry = cache.get(namespace)
+    if entry and not refresh and time.time() - entry.get("time", 0) < CACHE_TTL:
+        return entry["ip"]
+    found = discover_mongodb_pod(namespace)
+    if found is None:
+        return None
+    cache[namespace] = {"pod": found[0], "ip": found[1], "time": time.time()}
+    _save_cache(cache)
+    return found[1]
+
+def forget_mongodb_ip(namespace=DEFAULT_NAMESPACE):
+    cache = _load_cache()
+    if cache.pop(namespace, None) is not None:
+        _save_cache(cache)
+
+def mongodb_uri(namespace=DEFAULT_NAMESPACE, refresh=False):
+    """URI of the MongoDB pod in namespace, or of its Service if the pod cannot be discovered."""
+    ip = get_mongodb_ip(namespace, refresh=refresh)
+    if ip:
+        return f"mongodb://{ip}:{MONGODB_PORT}"
+    print(f"[INFO] No MongoDB pod found in namespace '{namespace}'; using the Service "
+          f"{MONGODB_SERVICE}.{namespace}.svc.cluster.local.", file=sys.stderr)
+    return f"mongodb://{MONGODB_SERVICE}.{namespace}.svc.cluster.local:{MONGODB_PORT}"
+
+def get_client(uri=None, namespace=None, pool_size=None):
+    """
+    The shared MongoClient for uri (default: defaults["uri"], else the
+    discovered MongoDB of namespace). Clients are created once per process;
+    asking for a larger pool_size than the current client has replaces it.
+    A discovered address that does not answer is rediscovered once.
+    """
+    uri = uri or defaults["uri"]
+    namespace = namespace or defaults["namespace"]
+    discovered = uri is None
+    if discovered:
+        uri = _resolved.get(namespace) or mongodb_uri(namespace)
+
+    client = _clients.get(uri)
+    if client is not None and pool_size and pool_size > client.options.pool_options.max_pool_size:
+        client.close()
+        client = None
+    if client is None:
+        options = dict(CLIENT_OPTIONS, maxPoolSize=max(CLIENT_OPTIONS["maxPoolSize"], pool_size or 0))
+        client = MongoClient(uri, **options)
+        if discovered and namespace not in _resolved:
+            try:
+                # Also opens the first connection, so the caller starts right away
+                client.admin.command("ping")
+            except ServerSelectionTimeoutError:
+                # The pod may have moved since its IP was cached
+                client.close()
+                forget_mongodb_ip(namespace)
+                uri = mongodb_uri(namespace, refresh=True)
+                client = _clients.get(uri) or MongoClient(uri, **options)
+            _resolved[namespace] = uri
+        _clients[uri] = client
+    return client
 
 if __name__ == "__main__":
     mongodb_ip = get_mongodb_ip(namespace="open5gs")